@@ -1,68 +1,140 @@
+import atexit
+import functools
+import hmac
+import os
+import threading
 import streamlit as st
+import numpy as np
 import pandas as pd
 import folium
 from streamlit_folium import st_folium
-from math import radians, cos, sin, sqrt, atan2
-from datetime import datetime, timedelta, time
-import json
+from datetime import datetime, timedelta
+from time import perf_counter
 import requests
+from comments import CommentStore
+from delays import DelayTracker
+from history import HISTORY_DIR, SnapshotRecorder, load_history, occupancy_by_unit, punctuality
+from feed import GTFS_DIR, load_dataset
+from metrics import METRICS
+from realtime import TrainPositionsFeed, index_positions
+from maps import TRACK_TOLERANCE_M, build_network_layer, add_tracks, add_stations
+from geo import build_stop_index, nearest_stops
+from stations import build_station_index, search_stations, station
+from planner import build_connections, plan_journey, reachability, reachable_within
+from boards import departure_boards
+from timetable import DAY, build_departure_index, build_calendar_index, build_trip_vias, format_seconds
 
 # ---------------------------
 # Funcions d'utilitat
 # ---------------------------
-comments_file = "data/comments.json"
-
-@st.cache_data
-def load_data():
-    """Carregar dades GTFS."""
-    stops = pd.read_csv("data/stops.txt")
-    stop_times = pd.read_csv("data/stop_times.txt")
-    trips = pd.read_csv("data/trips.txt")
-    calendar_dates = pd.read_csv("data/calendar_dates.txt")
-    routes = pd.read_csv("data/routes.txt")
-    access = pd.read_csv("data/access.csv")
-    shapes = pd.read_csv("data/shapes.txt")
-    return stops, stop_times, trips, calendar_dates, routes, access, shapes
-
-
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calcular distància entre dues coordenades geogràfiques (en km)."""
-    R = 6371  # Radi de la Terra en km
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat / 2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    return R * c
-
-def preprocess_stop_times(stop_times):
-    """Arreglar formats horaris GTFS i convertir-los a datetime."""
-    def fix_gtfs_time_format(time_str):
-        hours, minutes, seconds = map(int, time_str.split(":"))
-        if hours >= 24:
-            hours -= 24
-        return f"{hours:02}:{minutes:02}:{seconds:02}"
-    
-    stop_times['departure_time'] = stop_times['departure_time'].apply(fix_gtfs_time_format)
-    stop_times['departure_time'] = pd.to_datetime(stop_times['departure_time'], format='%H:%M:%S')
-    return stop_times
-
-def get_upcoming_trips(nearest_stop, stop_times, trips, calendar_dates, vies):
-    end_day = time(23, 59, 59)
+comments_file = "data/comments.json"  # Format antic, només per importar-lo
+comments_db = "data/comments.db"
+
+def counted_cache(name, cache=st.cache_resource):
+    """Memòria cau de Streamlit (per defecte st.cache_resource) que compta encerts i errades.
+
+    Cada crida suma un cache_hits o un cache_misses a METRICS amb l'etiqueta
+    cache=name, per veure'n la proporció al panell. La funció original només s'executa quan no hi ha el valor a la memòria cau:
+    si s'ha executat en aquest fil durant la crida, ha estat una errada.
+    """
+    def decorate(load):
+        state = threading.local()
+
+        @cache
+        @functools.wraps(load)
+        def cached(*args, **kwargs):
+            state.missed = True
+            return load(*args, **kwargs)
+
+        @functools.wraps(load)
+        def counted(*args, **kwargs):
+            state.missed = False
+            value = cached(*args, **kwargs)
+            METRICS.count("cache_misses" if state.missed else "cache_hits", cache=name)
+            return value
+        return counted
+    return decorate
+
+@counted_cache("load_data")
+def load_data(gtfs_source=GTFS_DIR):
+    """Carregar dades GTFS (directori o .zip) des de la memòria cau columnar.
+
+    La memòria cau es compila si el feed ha canviat. Les dades es comparteixen
+    entre sessions sense copiar-les, en un FeedDataset de només lectura.
+    """
+    with METRICS.span("load_data"):
+        return load_dataset(gtfs_source)
+
+
+@counted_cache("stop_index")
+def load_stop_index():
+    """Construir l'índex espacial de parades un sol cop."""
+    data = load_data()
+    return build_stop_index(data.stops)
+
+@counted_cache("station_index")
+def load_station_index():
+    """Construir l'índex de cerca d'estacions (noms i accessibilitat) un sol cop."""
+    data = load_data()
+    return build_station_index(data.stops, data.access)
+
+@counted_cache("departure_index")
+def load_departure_index():
+    """Construir l'índex de sortides un sol cop i compartir-lo entre sessions."""
+    data = load_data()
+    return build_departure_index(data.stop_times, data.trips)
+
+@counted_cache("calendar_index")
+def load_calendar_index():
+    """Construir l'índex del calendari de serveis un sol cop."""
+    data = load_data()
+    return build_calendar_index(data.calendar_dates, data.feed_info, data.trips)
+
+@counted_cache("trip_vias")
+def load_trip_vias():
+    """Calcular la via de cada viatge un sol cop."""
+    data = load_data()
+    return build_trip_vias(data.trips, data.routes)
+
+@counted_cache("connections")
+def load_connections():
+    """Construir la taula de connexions del planificador un sol cop."""
+    data = load_data()
+    return build_connections(data.stop_times, data.trips, data.stops, data.access)
+
+@counted_cache("train_feed")
+def load_train_feed():
+    """Una sola font de posicions de trens per procés, renovada en segon pla.
+
+    Amb FGC_HISTORY=1 cada instantània es desa a l'històric, i el fil de fons
+    no para encara que no hi hagi ningú mirant l'app.
+    """
+    if os.environ.get("FGC_HISTORY") == "1":
+        recorder = SnapshotRecorder(HISTORY_DIR)
+        atexit.register(recorder.flush)
+        train_feed = TrainPositionsFeed(recorder=recorder, idle_after=float("inf"))
+    else:
+        train_feed = TrainPositionsFeed()
+    train_feed.start()
+    return train_feed
+
+@counted_cache("delay_tracker")
+def load_delay_tracker():
+    """Retards dels trens compartits per totes les sessions (es renoven amb cada instantània)."""
+    data = load_data()
+    return DelayTracker(data.stop_times, data.trips)
+
+@counted_cache("network_layer")
+def load_network_layer(feed_version, tolerance_m=TRACK_TOLERANCE_M):
+    """Capa estàtica de vies i estacions, una per versió del feed."""
+    data = load_data()
+    return build_network_layer(data.shapes, data.stops, tolerance_m)
+
+def get_upcoming_trips(stop_id, departure_index, calendar_index, trip_vias, trips, vies):
     now = datetime.now()
     now_time = now.time()
 
     time_interval = st.selectbox("Selecciona l'interval de temps:", [1, 2, 12, 24], index=1, help="Escull l'interval de temps en minuts.")
-    user_end_datetime = now + timedelta(hours=time_interval)
-
-    # Check if the user_end_time is beyond midnight (next day)
-    if user_end_datetime.date() > now.date():
-        end_time = end_day
-    else:
-        end_time = user_end_datetime.time()
-
-
-    stop_times = preprocess_stop_times(stop_times)
-    calendar_dates['date'] = pd.to_datetime(calendar_dates['date'], format='%Y%m%d').dt.date
 
     #AQUI
     
@@ -73,64 +145,22 @@ def get_upcoming_trips(nearest_stop, stop_times, trips, calendar_dates, vies):
         current_date = datetime.now().date()
     else:
         current_date = selected_date
-        calendar_today = calendar_dates[calendar_dates['date'] == selected_date]
-        trips['trip_service_id'] = trips['trip_id'].str.split('|').str[0]
-        valid_trips = trips[trips['service_id'].isin(calendar_today['service_id'])]
     
     # Filtrar horaris per l'estació més propera i l'interval de temps
-    upcoming_trips = stop_times[
-        (stop_times['stop_id'] == nearest_stop['stop_id']) &
-        (stop_times['departure_time'].dt.time > now_time) &
-        (stop_times['departure_time'].dt.time <= end_time)
-    ]
-    
-    upcoming_trips['departure_time'] = upcoming_trips['departure_time'].dt.strftime('%H:%M:%S')  # Format HH:MM:SS departure
-    upcoming_trips = upcoming_trips.merge(valid_trips, on="trip_id").sort_values("departure_time")
-    upcoming_trips = upcoming_trips.merge(routes[['route_id', 'route_long_name']], on='route_id', how='left')
-
-    # Afegir la columna 'via' basada en la selecció de la via
-    upcoming_trips['via'] = upcoming_trips.apply(
-    lambda row: (
-        "1" if ' - ' in row['route_long_name'] and row['trip_headsign'] == row['route_long_name'].split(' - ')[1] 
-        else "2" if ' - ' in row['route_long_name'] and row['trip_headsign'] != row['route_long_name'].split(' - ')[1] 
-        else "Desconegut"
-    ),
-    axis=1
-)
-
-    # Filtrar per via (igual que abans)
-    if vies == 1:
-        indices_to_drop = []
-        for i in range(len(upcoming_trips)):
-            line = upcoming_trips['route_id'].iloc[i]
-            headsign = upcoming_trips['trip_headsign'].iloc[i]
-            route_long_name = routes[routes['route_id'] == line]['route_long_name'].values[0]
-            if ' - ' in route_long_name:
-                destination = route_long_name.split(' - ')[1]
-                if headsign != destination:
-                    indices_to_drop.append(i)
-        upcoming_trips = upcoming_trips.drop(indices_to_drop)
-
-    if vies == 2:
-        indices_to_drop = []
-        for i in range(len(upcoming_trips)):
-            line = upcoming_trips['route_id'].iloc[i]
-            headsign = upcoming_trips['trip_headsign'].iloc[i]
-            route_long_name = routes[routes['route_id'] == line]['route_long_name'].values[0]
-            if ' - ' in route_long_name:
-                destination = route_long_name.split(' - ')[1]
-                if headsign == destination:
-                    indices_to_drop.append(i)
-        upcoming_trips = upcoming_trips.drop(indices_to_drop)
-
-    upcoming_trips = upcoming_trips.reset_index(drop=True)
-    return upcoming_trips
+    # La finestra pot passar de mitjanit: no la tallem a les 23:59:59
+    now_secs = now_time.hour * 3600 + now_time.minute * 60 + now_time.second
+    end_secs = now_secs + time_interval * 3600
+    # Mateixa consulta que el servidor de taulers (boards.py), per una sola parada
+    with METRICS.span("departure_board"):
+        upcoming_trips = departure_boards(departure_index, calendar_index, trip_vias, trips, [stop_id],
+                                          current_date, now_secs, end_secs, via=vies)
+    return upcoming_trips, current_date
 
 # -------------------------------------------
 # Funció per mostrar la selecció de temps i viatges
 # -------------------------------------------
 
-def show_info(nearest_stop):
+def show_info(stop_id):
     vies = 0
     #HORARIS
     st.markdown("## Horaris")
@@ -165,84 +195,134 @@ def show_info(nearest_stop):
     elif st.session_state["selected_option"] == "via2":
         vies = 2
     elif st.session_state["selected_option"] == "accessibilitat":
-        show_access(nearest_stop['stop_id'])
+        show_access(stop_id)
         return
 
     # Obtenir els viatges amb el nou interval de temps
-    upcoming_trips = get_upcoming_trips(nearest_stop, stop_times, trips, calendar_dates, vies)
+    upcoming_trips, board_date = get_upcoming_trips(stop_id, departure_index, calendar_index, trip_vias, trips, vies)
     
     if upcoming_trips.empty:
         st.write(f"No hi ha viatges previstos")
     else:
+        # Posicions compartides per totes les sessions (una petició a l'API per interval)
+        try:
+            with METRICS.span("train_positions"):
+                dades = train_feed.get()
+        except requests.RequestException:
+            st.error("Error en obtenir les dades del tren.")
+            dades = None
+
+        # Retard de cada tren segons la seva posició, propagat a les parades que li queden.
+        # Sense instantània no es toca el tracker: és compartit i es perdrien els retards de tots els trens.
+        with METRICS.span("delays"):
+            if dades is not None:
+                delay_tracker.update_snapshot(dades, dades["fetched_at"])
+            upcoming_trips = delay_tracker.apply(upcoming_trips, board_date)
+        if dades is None:
+            dades = index_positions([])
+
         if st.button("Mostra informació del proper tren"):
             next_train = upcoming_trips.iloc[0]  # Agafar el primer tren de la llista
             st.subheader("Informació del proper tren")
             st.write(f"**Línia:** {next_train['route_id']}")
             st.write(f"**Destí:** {next_train['trip_headsign']}")
             st.write(f"**Numero:** {next_train['trip_id']}")
+            if next_train['delay_secs']:
+                st.write(f"**Hora prevista:** {next_train['predicted_time']} ({next_train['delay_secs'] // 60:+d} min)")
 
-            API_URL = "https://dadesobertes.fgc.cat/api/explore/v2.1/catalog/datasets/posicionament-dels-trens/records"
-            params = {"dataset": "posicionament-dels-trens", "limit": 100}
-
-            resposta = requests.get(API_URL, params=params)
-            resposta.raise_for_status()
-            dades = resposta.json()
-
-            if "results" in dades:
-                for registre in dades["results"]:
-                    if registre['id'] == next_train['trip_id']:
-                        linia = registre.get('lin', 'Desconegut')
-                        desti = registre.get('desti', 'Desconegut')
-                        direccio = registre.get('dir', 'Desconegut')
-                        id = registre.get('id', 'Desconegut')
-                        st.write(f"Un tren coincideix")
-                        st.write(f"**Línia:** {linia}")
-                        st.write(f"**Destí:** {desti}")
-                        st.write(f"**Direcció:** {direccio}")
-                        st.write(f"**Estacionat a:** {registre.get('estacionat_a', 'Desconegut')}")
-                        st.write(f"**Properes parades:** {registre.get('properes_parades', 'Desconegut')}")
-                        st.write(f"**En hora:** {registre.get('en_hora', 'Desconegut')}")
-                        st.write(f"**Tipus d'unitat:** {registre.get('tipus_unitat', 'Desconegut')}")
-                        st.write(f"**Unitat:** {registre.get('ut', 'Desconegut')}")
-                        st.write(f"**Ocupació mi (%):** {registre.get('ocupacio_mi_percent', 'Desconegut')}")
-                        st.write(f"**Ocupació ri (%):** {registre.get('ocupacio_ri_percent', 'Desconegut')}")
-                        st.write(f"**Ocupació m1 (%):** {registre.get('ocupacio_m1_percent', 'Desconegut')}")
-                        st.write(f"**Ocupació m2 (%):** {registre.get('ocupacio_m2_percent', 'Desconegut')}")
-
-                                                                    
-
-        
+            registre = dades["by_id"].get(next_train['trip_id'])
+            if registre is not None:
+                linia = registre.get('lin', 'Desconegut')
+                desti = registre.get('desti', 'Desconegut')
+                direccio = registre.get('dir', 'Desconegut')
+                st.write(f"Un tren coincideix")
+                st.write(f"**Línia:** {linia}")
+                st.write(f"**Destí:** {desti}")
+                st.write(f"**Direcció:** {direccio}")
+                st.write(f"**Estacionat a:** {registre.get('estacionat_a', 'Desconegut')}")
+                st.write(f"**Properes parades:** {registre.get('properes_parades', 'Desconegut')}")
+                st.write(f"**En hora:** {registre.get('en_hora', 'Desconegut')}")
+                st.write(f"**Tipus d'unitat:** {registre.get('tipus_unitat', 'Desconegut')}")
+                st.write(f"**Unitat:** {registre.get('ut', 'Desconegut')}")
+                st.write(f"**Ocupació mi (%):** {registre.get('ocupacio_mi_percent', 'Desconegut')}")
+                st.write(f"**Ocupació ri (%):** {registre.get('ocupacio_ri_percent', 'Desconegut')}")
+                st.write(f"**Ocupació m1 (%):** {registre.get('ocupacio_m1_percent', 'Desconegut')}")
+                st.write(f"**Ocupació m2 (%):** {registre.get('ocupacio_m2_percent', 'Desconegut')}")
+
+        # Estat en temps real de cada tren del tauler, amb un sol join per id
+        with METRICS.span("live_join"):
+            upcoming_trips = upcoming_trips.join(dades["live"], on="trip_id")
 
         #TIMETABLE
         column_titles = {
             "departure_time": "Hora de sortida",
+            "predicted_time": "Hora prevista",
             "route_id": "Línia",
             "trip_headsign": "Destí",
-            "via": "Via"
+            "via": "Via",
+            "en_hora": "En hora",
+            "ocupacio": "Ocupació (%)"
         }
-        st.table(upcoming_trips.rename(columns=column_titles)[["Hora de sortida", "Línia", "Destí", "Via"]])
+        st.table(upcoming_trips.rename(columns=column_titles)[["Hora de sortida", "Hora prevista", "Línia", "Destí", "Via", "En hora", "Ocupació (%)"]].fillna("-"))
 
 def select_station_list():
-    station_options = stops['stop_name'].tolist() #LLISTA D'ESTACIONS
+    # Cerca sense accents per prefix o aproximada; la sessió només guarda el stop_id
+    query = st.text_input("Cerca una estació", placeholder="p. ex. placa cat")
+    wheelchair = st.checkbox("Només estacions accessibles amb cadira de rodes", key="search_wheelchair")
+    min_wc = st.selectbox("Banys", [None, 1, 2, 3], format_func=lambda level: {
+        None: "Tant és", 1: "Almenys sota demanda", 2: "Disponible", 3: "Disponible i net"}[level])
+    with METRICS.span("station_search"):
+        found = search_stations(station_index, query, limit=None if not query else 20,
+                                wheelchair=wheelchair, min_wc=min_wc)
+    if len(found) == 0:
+        st.write("Cap estació coincideix amb la cerca.")
+        return None
+    selected_stop = st.selectbox("Selecciona una estació de la llista", list(station_index["stop_ids"][found]),
+                                 format_func=lambda stop_id: station(station_index, stop_id)["stop_name"]) # SELECTOR LLISTA
 
-    selected_station_name = st.selectbox("Selecciona una estació de la llista", station_options) # SELECTOR LLISTA
+    return selected_stop
 
-    selected_stop = stops[stops['stop_name'] == selected_station_name].iloc[0] #DEFINIR ESTACIÓ SELECCIONADA)
+REACH_COLORS = [(15, "green"), (30, "orange"), (60, "red")]  # Minuts de viatge fins a cada color
 
-    return selected_stop
+def reach_layer(origin_id, max_minutes):
+    """Capa amb les estacions on s'arriba des d'origin_id en max_minutes, sortint ara."""
+    now = datetime.now()
+    with st.spinner("Preparant les taules d'abast del dia..."), METRICS.span("reachability"):
+        table = reachability(connections, calendar_index, now.date())
+    travel = reachable_within(table, origin_id, now.hour * 3600 + now.minute * 60 + now.second, max_minutes)
+
+    # Les posicions de la taula són les de table["stop_ids"], no les files de stops
+    rows = pd.Index(stops["stop_id"]).get_indexer(table["stop_ids"])
+    layer = folium.FeatureGroup(name="Abast")
+    for pos in np.flatnonzero(travel >= 0):
+        minutes = int(travel[pos])
+        row = rows[pos]
+        color = next((color for limit, color in REACH_COLORS if minutes <= limit), "darkred")
+        folium.CircleMarker(
+            location=[stops["stop_lat"].iloc[row], stops["stop_lon"].iloc[row]],
+            radius=9, color=color, fill=True, fill_opacity=0.6,
+            popup=f"{stops['stop_name'].iloc[row]}: {minutes} min",
+        ).add_to(layer)
+    return layer
 
 def select_station_map():
     nearest_stop = None
-    m = folium.Map(location=[41.3888, 2.159], zoom_start=11)
-    for _, stop in stops.iterrows():
-        folium.Marker(
-            location=[stop["stop_lat"], stop["stop_lon"]],
-            popup=f"{stop['stop_name']} (ID: {stop['stop_id']})",
-            icon=folium.Icon(color='blue')
-        ).add_to(m)
-    
-    # Mostrar el mapa a Streamlit
-    map_data = st_folium(m, width=1000, height=400)
+    show_reach = st.checkbox("Mostra on es pot arribar des de l'estació escollida")
+    max_minutes = st.slider("Minuts de viatge:", 10, 120, 30, step=5) if show_reach else None
+
+    # st_folium desa l'últim clic a session_state: l'estació ja es coneix abans de dibuixar el mapa
+    clicked = (st.session_state.get("station_map") or {}).get("last_clicked")
+    overlay = None
+    if show_reach and clicked:
+        positions, _ = nearest_stops(stop_index, clicked['lat'], clicked['lng'], k=1)
+        overlay = reach_layer(stops['stop_id'].iloc[positions[0]], max_minutes)
+
+    with METRICS.span("station_map"):
+        m = folium.Map(location=[41.3888, 2.159], zoom_start=11)
+        add_stations(m, network_layer)  # Totes les estacions en una sola capa precalculada
+
+        # Mostrar el mapa a Streamlit (la capa d'abast va a part, sense redibuixar el mapa base)
+        map_data = st_folium(m, width=1000, height=400, key="station_map", feature_group_to_add=overlay)
 
     stop_msg = "Fes clic al mapa per escollir una estació."
     distance_msg = "La distància es calcularà respecte a la ubicació clicada." 
@@ -250,12 +330,12 @@ def select_station_map():
     if map_data and map_data['last_clicked']:
         lat, lon = map_data['last_clicked']['lat'], map_data['last_clicked']['lng']
 
-        # Trobar l'estació més propera a la ubicació clicada
-        stops["distance"] = stops.apply(lambda row: calculate_distance(lat, lon, row["stop_lat"], row["stop_lon"]), axis=1)
-        nearest_stop = stops.loc[stops["distance"].idxmin()]
+        # Trobar l'estació més propera a la ubicació clicada (sense tocar el frame compartit)
+        positions, distances = nearest_stops(stop_index, lat, lon, k=1)
+        nearest_stop = stops['stop_id'].iloc[positions[0]]
 
-        stop_msg = (f"{nearest_stop['stop_name']}")
-        distance_msg = (f"**Distància:** {nearest_stop['distance']:.2f} km")
+        stop_msg = (f"{stops['stop_name'].iloc[positions[0]]}")
+        distance_msg = (f"**Distància:** {distances[0]:.2f} km")
     
     col1, col2, = st.columns([1, 1])
     with col1:
@@ -277,27 +357,24 @@ def obtenir_color_lin(linia):
 def geotren():
     st.subheader("Geotren")
 
-    # Data for shapes (rail tracks)
-    shapes_data = shapes
-    rail_tracks = {shape_id: list(zip(group["shape_pt_lat"], group["shape_pt_lon"]))
-                    for shape_id, group in shapes_data.groupby("shape_id")}
-
-    # API URL per obtenir la posició en temps real
-    API_URL = "https://dadesobertes.fgc.cat/api/explore/v2.1/catalog/datasets/posicionament-dels-trens/records"
-    params = {"dataset": "posicionament-dels-trens", "limit": 100}
+    # Posició en temps real, compartida per totes les sessions
+    try:
+        with METRICS.span("train_positions"):
+            dades = train_feed.get()
+    except requests.RequestException:
+        st.error("Error en obtenir les dades del tren.")
+        dades = index_positions([])  # Mostrem igualment les vies
 
-    resposta = requests.get(API_URL, params=params)
-    resposta.raise_for_status()
-    dades = resposta.json()
+    geotren_start = perf_counter()
 
     # Crear el mapa centrat a Barcelona
     mapa = folium.Map(location=[41.398222, 2.141769], zoom_start=12)
 
-    # Dibuixar les vies del tren
-    for shape_id, points in rail_tracks.items():
-        folium.PolyLine(points, color="blue", weight=2, opacity=0.7).add_to(mapa)
+    # Dibuixar les vies del tren (capa estàtica precalculada)
+    add_tracks(mapa, network_layer)
 
-    # Afegir els trens en temps real amb icones direccionals
+    # Afegir els trens en temps real amb icones direccionals, en una capa a part
+    trens = folium.FeatureGroup(name="Trens")
     if "results" in dades:
         for registre in dades["results"]:
             try:
@@ -320,89 +397,91 @@ def geotren():
                     location=[lat, lon],
                     icon=folium.DivIcon(html=icon_svg),
                     popup=f"Destí: {desti}"
-                ).add_to(mapa)
+                ).add_to(trens)
             except KeyError:
                 st.error("Error en obtenir les dades del tren.")
     
-    # Mostrar el mapa en Streamlit
-    st_folium(mapa, width=700, height=500)
+    METRICS.observe("geotren_map", perf_counter() - geotren_start)
 
+    # Mostrar el mapa en Streamlit: amb una key fixa, el mapa base no es torna
+    # a dibuixar i a cada refresc només s'envia la capa de trens
+    with METRICS.span("geotren_render"):
+        st_folium(mapa, width=700, height=500, key="geotren", feature_group_to_add=trens)
 
-def load_comments():
-    try:
-        with open(comments_file, "r") as file:
-            comments_data = json.load(file)
-            # Convertim el timestamp de nou a datetime
-            for service in comments_data:
-                for comment in comments_data[service]:
-                    try:
-                        # Intentem convertir amb fracció de segon
-                        comment["timestamp"] = datetime.strptime(comment["timestamp"], "%Y-%m-%d %H:%M:%S.%f")
-                    except ValueError:
-                        # Si no té fracció de segon, utilitzem el format sense fracció
-                        comment["timestamp"] = datetime.strptime(comment["timestamp"], "%Y-%m-%d %H:%M:%S")
-            return comments_data
-    except FileNotFoundError:
-        return {}
 
-# Funció per guardar els comentaris al fitxer JSON
-def save_comments(comments_data):
-    with open(comments_file, "w") as file:
-        # Guardar els comentaris amb el timestamp com a cadena
-        for service in comments_data:
-            for comment in comments_data[service]:
-                comment["timestamp"] = comment["timestamp"].strftime("%Y-%m-%d %H:%M:%S.%f")
-        json.dump(comments_data, file, default=str, indent=4)
+# ---------------------------
+# Planificador de trajectes
+# ---------------------------
 
-# Afegeix un comentari per a una estació
-def add_comment(service, comment_text, station_name):
-    comments_data = load_comments()
-    
-    # Crear el nou comentari
-    comment = {
-        "service": service,
-        "comment": comment_text,
-        "timestamp": datetime.now(),  # Guardem l'objecte datetime
-        "station": station_name
-    }
+def show_journey_planner():
+    st.subheader("Planificador de trajectes")
 
-    # Afegir el comentari a la llista corresponent
-    if service not in comments_data:
-        comments_data[service] = []
-    
-    comments_data[service].append(comment)
-    
-    # Limitar a 10 comentaris per servei
-    if len(comments_data[service]) > 10:
-        comments_data[service] = sorted(comments_data[service], key=lambda x: x["timestamp"], reverse=True)
-        comments_data[service] = comments_data[service][:10]  # Mantenir només els 10 comentaris més recents
+    station_names = stops.dropna(subset=["stop_id"]).drop_duplicates("stop_name")
+    station_ids = dict(zip(station_names["stop_name"], station_names["stop_id"]))
+    origin_name = st.selectbox("Origen:", list(station_ids))
+    destination_name = st.selectbox("Destí:", list(station_ids), index=min(1, len(station_ids) - 1))
 
-    # Desa els comentaris al fitxer
-    save_comments(comments_data)
+    now = datetime.now()
+    journey_date = st.date_input("Data del trajecte:", value=now.date())
+    journey_time = st.time_input("Hora de sortida:", value=now.time().replace(second=0, microsecond=0))
+    wheelchair = st.checkbox("Només estacions accessibles amb cadira de rodes")
+
+    if origin_name == destination_name:
+        st.write("Tria dues estacions diferents.")
+        return
+
+    depart_secs = journey_time.hour * 3600 + journey_time.minute * 60
+    with METRICS.span("journey_plan"):
+        legs = plan_journey(connections, calendar_index, station_ids[origin_name], station_ids[destination_name],
+                            journey_date, depart_secs, wheelchair=wheelchair)
+    if legs.empty:
+        if wheelchair:
+            st.write("No hi ha cap trajecte accessible amb cadira de rodes.")
+        else:
+            st.write("No hi ha cap trajecte a partir d'aquesta hora.")
+        return
+
+    stop_names = dict(zip(stops["stop_id"], stops["stop_name"]))
+    journey = pd.DataFrame({
+        "Sortida": format_seconds(legs["departure_secs"] % DAY),
+        "Arribada": format_seconds(legs["arrival_secs"] % DAY),
+        "Línia": legs["route_id"],
+        "Destí del tren": legs["trip_headsign"],
+        "Des de": legs["from_stop_id"].map(stop_names),
+        "Fins a": legs["to_stop_id"].map(stop_names),
+    })
+    minutes = (legs["arrival_secs"].iloc[-1] - depart_secs) // 60
+    st.write(f"**Arribada:** {journey['Arribada'].iloc[-1]} ({minutes} min, {len(legs) - 1} transbords)")
+    st.table(journey)
+
+
+@counted_cache("comment_store")
+def load_comment_store():
+    """Magatzem de comentaris compartit per totes les sessions (importa el comments.json antic)."""
+    return CommentStore(comments_db, legacy_json=comments_file)
+
+# Afegeix un comentari per a una estació
+def add_comment(service, comment_text, station_name):
+    # Es guarden només els 10 comentaris més recents de cada servei a cada estació
+    comment_store.add(service, station_name, comment_text)
 
 # Mostra els comentaris per estació i servei
 def show_comments(service, station_name):
-    comments_data = load_comments()
-    
-    if service in comments_data:
-        # Filtrar els comentaris per estació
-        service_comments = [comment for comment in comments_data[service] if comment["station"] == station_name]
-        
-        if service_comments:
-            # Mostrar comentaris en ordre de recents a antics
-            for comment in service_comments:
-                formatted_timestamp = comment['timestamp'].strftime("%Y-%m-%d %H:%M")
-                st.write(f"{formatted_timestamp} - {comment['comment']}")
-        else:
-            st.write("No hi ha comentaris per aquesta estació.")
+    service_comments = comment_store.list(service, station_name)
+
+    if service_comments:
+        # Mostrar comentaris en ordre de recents a antics
+        for timestamp, comment in service_comments:
+            formatted_timestamp = timestamp.strftime("%Y-%m-%d %H:%M")
+            st.write(f"{formatted_timestamp} - {comment}")
     else:
-        st.write("No hi ha comentaris per aquest servei.")
+        st.write("No hi ha comentaris per aquesta estació.")
 
 # Funció per mostrar la informació d'accessibilitat i comentaris
-def show_access(station):
-    # Carregar la informació d'accessibilitat del fitxer access.csv (ajustat segons el teu codi)
-    filtered_data = access[access['stop_id'] == station]
-    
+def show_access(station_id):
+    # Accessibilitat de l'estació (access.csv) des de l'índex d'estacions
+    info = station(station_index, station_id)
+
     # Mapping de les dades de 'wheelchair_boarding' i 'wc'
     wheelchair_boarding_msg = {
         1: "Viable",
@@ -418,17 +497,11 @@ def show_access(station):
         -1: "Sense informació"
     }
     
-    # Substituir els valors en el dataframe amb els missatges corresponents
-    filtered_data["wheelchair_boarding"] = filtered_data["wheelchair_boarding"].map(wheelchair_boarding_msg)
-    filtered_data["wc"] = filtered_data["wc"].map(wc_msg)
-
-    # Mostrar la informació d'accessibilitat
-    filtered_data_renamed = filtered_data.rename(
-        columns={
-            "wheelchair_boarding": "Cadira de rodes",
-            "wc": "Banys"
-        })
-    st.table(filtered_data_renamed[["Cadira de rodes", "Banys"]])
+    # Taula nova amb els missatges corresponents (les dades compartides no es toquen)
+    st.table(pd.DataFrame({
+        "Cadira de rodes": [wheelchair_boarding_msg.get(info["wheelchair_boarding"], "Sense informació")],
+        "Banys": [wc_msg.get(info["wc"], "Sense informació")],
+    }))
 
     # Formulari per recollir comentaris
     service_type = st.selectbox("Selecciona el servei que vols puntuar:", ["Lavabos", "Accessibilitat", "Altres"])
@@ -436,20 +509,121 @@ def show_access(station):
 
     if st.button("Publicar comentari"):
         if comment_text:
-            add_comment(service_type, comment_text, station)  # Afegir el comentari i guardar-lo
+            add_comment(service_type, comment_text, station_id)  # Afegir el comentari i guardar-lo
             st.success("Comentari afegit amb èxit!")
         else:
             st.warning("Per favor, escriu un comentari abans de publicar.")
 
     # Mostrar els comentaris
-    show_comments(service_type, station)
+    show_comments(service_type, station_id)
     
+# ---------------------------
+# Històric de puntualitat i ocupació
+# ---------------------------
+
+@counted_cache("history_stats", st.cache_data(ttl=300))
+def load_history_stats(days):
+    """Puntualitat per línia i hora i ocupació per unitat dels últims `days` dies."""
+    with METRICS.span("history_stats"):
+        history = load_history(HISTORY_DIR, start=datetime.now() - timedelta(days=days))
+        return punctuality(history), occupancy_by_unit(history)
+
+def show_history():
+    st.subheader("Puntualitat i ocupació")
+    days = st.slider("Dies enrere:", min_value=1, max_value=28, value=7)
+    on_time, occupancy = load_history_stats(days)
+    if on_time.empty and occupancy.empty:
+        st.write("Encara no hi ha històric. Engega l'app amb FGC_HISTORY=1 per anar desant les posicions dels trens.")
+        return
+
+    # Percentatge de trens en hora: una fila per línia i una columna per hora
+    st.markdown("### Trens en hora (%)")
+    per_line = on_time.assign(on_time=on_time["on_time_pct"] * on_time["observations"] / 100).groupby("line")[["on_time", "observations"]].sum()
+    st.table(pd.DataFrame({
+        "Observacions": per_line["observations"],
+        "En hora (%)": (per_line["on_time"] / per_line["observations"] * 100).round(1),
+    }).rename_axis("Línia"))
+    st.dataframe(on_time.pivot(index="line", columns="hour", values="on_time_pct").round().rename_axis(index="Línia", columns="Hora"))
+
+    st.markdown("### Ocupació mitjana per unitat (%)")
+    st.dataframe(occupancy.rename(columns={"unit": "Unitat", "samples": "Mostres", "occupancy_pct": "Ocupació (%)"}).round(1),
+                 hide_index=True)
+
+# ---------------------------
+# Panell de depuració
+# ---------------------------
+
+def debug_token():
+    """Token del panell de depuració: FGC_DEBUG_TOKEN o debug_token a st.secrets (None si no n'hi ha)."""
+    token = os.environ.get("FGC_DEBUG_TOKEN")
+    if token:
+        return token
+    try:
+        return st.secrets.get("debug_token")
+    except FileNotFoundError:
+        return None
+
+def debug_allowed():
+    """Si es mostra el panell: mètriques activades (FGC_METRICS=1) i ?debug=<token> correcte.
+
+    Sense token configurat el panell no es mostra mai. Un paràmetre de l'URL no
+    canvia mai l'estat del procés: només l'entorn activa les mètriques.
+    """
+    token = debug_token()
+    requested = st.query_params.get("debug")
+    return METRICS.enabled and bool(token) and requested is not None and hmac.compare_digest(requested, str(token))
+
+def show_debug_panel():
+    """Latència per etapa i comptadors del procés (?debug=<token>), amb exportació."""
+    with st.sidebar.expander("Mètriques", expanded=True):
+        snapshot = METRICS.snapshot()
+        if snapshot["spans"]:
+            stages = pd.DataFrame.from_dict(snapshot["spans"], orient="index").sort_values("total_ms", ascending=False)
+            st.dataframe(stages.round(2))
+        if snapshot["counters"]:
+            st.dataframe(pd.DataFrame({
+                "comptador": [counter["name"] for counter in snapshot["counters"]],
+                "etiquetes": [",".join(f"{key}={value}" for key, value in counter["labels"].items()) for counter in snapshot["counters"]],
+                "valor": [counter["value"] for counter in snapshot["counters"]],
+            }), hide_index=True)
+            # Proporció d'encerts de cada memòria cau
+            caches = {}
+            for counter in snapshot["counters"]:
+                if counter["name"] in ("cache_hits", "cache_misses") and "cache" in counter["labels"]:
+                    caches.setdefault(counter["labels"]["cache"], {"encerts": 0, "errades": 0})[
+                        "encerts" if counter["name"] == "cache_hits" else "errades"] += counter["value"]
+            if caches:
+                ratios = pd.DataFrame.from_dict(caches, orient="index").rename_axis("memòria cau")
+                ratios["encerts (%)"] = (ratios["encerts"] / (ratios["encerts"] + ratios["errades"]) * 100).round(1)
+                st.dataframe(ratios)
+        st.download_button("Prometheus", METRICS.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+        st.download_button("JSON lines", METRICS.to_json_lines(), file_name="metrics.jsonl", mime="application/jsonl")
+        if st.button("Reinicia les mètriques"):
+            METRICS.reset()
+
 # ---------------------------
 # Execució de l'aplicació
 # ---------------------------
 
+rerun_start = perf_counter()
+# Mètriques només amb FGC_METRICS=1 (desactivades, no costen res); panell amb ?debug=<token>
+debug = debug_allowed()
+
 st.title("FGC")
-stops, stop_times, trips, calendar_dates, routes, access, shapes = load_data()
+with METRICS.span("load_resources"):
+    data = load_data()
+    # Còpies superficials per aquest rerun: les taules compartides no es poden modificar
+    stops, trips = data.stops, data.trips
+    stop_index = load_stop_index()
+    station_index = load_station_index()
+    departure_index = load_departure_index()
+    calendar_index = load_calendar_index()
+    trip_vias = load_trip_vias()
+    connections = load_connections()
+    train_feed = load_train_feed()
+    delay_tracker = load_delay_tracker()
+    network_layer = load_network_layer(data.feed_version)
+    comment_store = load_comment_store()
 
 # Iniciar l'estat de sessió si no existeix
 if "menu_level_1" not in st.session_state:
@@ -459,12 +633,15 @@ if "menu_level_2" not in st.session_state:
 if "selected_stop" not in st.session_state:
     st.session_state["selected_stop"] = None
 
-# --- MENÚ NIVELL 1: "Buscador", "Geotren" o "Altres" ---
-bus, geo, altres = st.columns(3)
+# --- MENÚ NIVELL 1: "Buscador", "Trajecte", "Geotren" o "Altres" ---
+bus, trajecte, geo, altres = st.columns(4)
 with bus:
     if st.button("Buscador"):
         st.session_state["menu_level_1"] = "Buscador"
         st.session_state["menu_level_2"] = "Mapa"  # Resetar submenú
+with trajecte:
+    if st.button("Trajecte"):
+        st.session_state["menu_level_1"] = "Trajecte"
 with geo:
     if st.button("Geotren"):
         st.session_state["menu_level_1"] = "Geotren"
@@ -498,10 +675,18 @@ if st.session_state["menu_level_1"] == "Buscador":
         if st.session_state["selected_stop"] is not None:
             show_info(st.session_state["selected_stop"])  # Mostrar info de l'estació
 
+# --- Opcions per a "Trajecte" ---
+elif st.session_state["menu_level_1"] == "Trajecte":
+    show_journey_planner()
+
 # --- Opcions per a "Geotren" ---
 elif st.session_state["menu_level_1"] == "Geotren":
     geotren()
 
 # --- Opcions per a "Altres" ---
 elif st.session_state["menu_level_1"] == "Altres":
-    st.write("Altres opcions pendents d'implementar.")
\ No newline at end of file
+    show_history()
+
+METRICS.observe("rerun", perf_counter() - rerun_start)
+if debug:
+    show_debug_panel()
@@ -0,0 +1,870 @@
+# Benchmarks de la lògica de l'aplicació, sense Streamlit.
+# Ús: python benchmark.py
+#     python benchmark.py --scales 1,10,100 --json resultats.json [--compare anteriors.json]
+
+import argparse
+import http.client
+import os
+import pickle
+import platform
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from boards import BoardServer, departure_boards
+from comments import CommentStore
+from delays import DelayTracker
+from history import SnapshotRecorder, load_history, occupancy_by_unit, punctuality
+import feed
+from metrics import Metrics
+from planner import TRANSFER_SECS, _day_connections, _scan, build_connections, build_reachability, plan_journey, reachable_within
+from maps import build_network_layer, add_tracks, add_stations
+from geo import build_stop_index, nearest_stops, nearest_stops_bruteforce, stops_within
+from stations import build_station_index, search_stations, station
+from synthetic import BBOX, write_feed, write_scaled_feed
+from timetable import DAY, build_departure_index, build_calendar_index, build_trip_vias, query_departures, query_window, valid_trip_mask
+
+# ---------------------------
+# Dades
+# ---------------------------
+
+def feed_dir(workdir):
+    """GTFS dels benchmarks: data/ si hi ha stop_times.txt; si no, un feed sintètic de la mida de FGC a workdir."""
+    if os.path.exists(os.path.join(feed.GTFS_DIR, "stop_times.txt")):
+        return feed.GTFS_DIR
+    gtfs_dir = os.path.join(workdir, "gtfs")
+    write_scaled_feed(gtfs_dir)
+    return gtfs_dir
+
+
+def load_feed(gtfs_dir):
+    """Taules del GTFS de gtfs_dir, llegides dels CSV."""
+    tables = feed.read_gtfs(gtfs_dir)
+    return tuple(tables[name] for name in ("stops", "stop_times", "trips", "calendar_dates", "feed_info", "routes", "shapes", "access"))
+
+
+def timed(fn, *args, repeat=5):
+    """Millor temps (en ms) de repeat execucions de fn."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        fn(*args)
+        best = min(best, perf_counter() - start)
+    return best * 1000
+
+# ---------------------------
+# Tauler de sortides
+# ---------------------------
+
+def legacy_upcoming(stop_times, stop_id, start, end):
+    """Camí anterior: preprocess_stop_times i filtre booleà sobre tota la taula."""
+    def fix_gtfs_time_format(time_str):
+        hours, minutes, seconds = map(int, time_str.split(":"))
+        if hours >= 24:
+            hours -= 24
+        return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+    stop_times = stop_times.copy()
+    stop_times['departure_time'] = stop_times['departure_time'].apply(fix_gtfs_time_format)
+    stop_times['departure_time'] = pd.to_datetime(stop_times['departure_time'], format='%H:%M:%S')
+    return stop_times[
+        (stop_times['stop_id'] == stop_id) &
+        (stop_times['departure_time'].dt.time > start) &
+        (stop_times['departure_time'].dt.time <= end)
+    ]
+
+
+def bench_departure_board(stop_times, trips, stop_id="PC"):
+    from datetime import time
+
+    build_ms = timed(build_departure_index, stop_times, trips, repeat=1)
+    index = build_departure_index(stop_times, trips)
+    print(f"stop_times: {len(stop_times)} files")
+    print(f"  construcció de l'índex (un cop):   {build_ms:9.2f} ms")
+    print(f"  camí anterior (cada rerun):        {timed(legacy_upcoming, stop_times, stop_id, time(8), time(10), repeat=1):9.2f} ms")
+    print(f"  consulta a l'índex, finestra 2 h:  {timed(query_departures, index, stop_id, 8 * 3600, 10 * 3600):9.3f} ms")
+    print(f"  consulta a l'índex, finestra 24 h: {timed(query_departures, index, stop_id, 0, 86399):9.3f} ms")
+    print(f"  finestra 1 h sobre mitjanit:       {timed(query_window, index, stop_id, 23 * 3600 + 1800, 24 * 3600 + 1800):9.3f} ms")
+    print(f"  finestra 24 h des de les 20:00:    {timed(query_window, index, stop_id, 20 * 3600, 44 * 3600):9.3f} ms")
+
+
+def legacy_valid_trips(trips, calendar_dates, selected_date):
+    """Camí anterior: reparsejar calendar_dates i fer isin sobre tots els viatges."""
+    calendar_dates = calendar_dates.copy()
+    calendar_dates['date'] = pd.to_datetime(calendar_dates['date'], format='%Y%m%d').dt.date
+    calendar_today = calendar_dates[calendar_dates['date'] == selected_date]
+    trips = trips.copy()
+    trips['trip_service_id'] = trips['trip_id'].str.split('|').str[0]
+    return trips[trips['service_id'].isin(calendar_today['service_id'])]
+
+
+def bench_calendar(trips, calendar_dates, feed_info):
+    from datetime import date
+
+    day = date(2025, 3, 3)
+    build_ms = timed(build_calendar_index, calendar_dates, feed_info, trips, repeat=1)
+    index = build_calendar_index(calendar_dates, feed_info, trips)
+    print(f"calendari: {len(calendar_dates)} dates, {len(trips)} viatges")
+    print(f"  construcció de l'índex (un cop):   {build_ms:9.2f} ms")
+    print(f"  camí anterior (cada rerun):        {timed(legacy_valid_trips, trips, calendar_dates, day):9.2f} ms")
+    print(f"  màscara de viatges vàlids:         {timed(valid_trip_mask, index, day):9.4f} ms")
+
+
+def legacy_via(upcoming_trips, routes, vies):
+    """Camí anterior: apply fila a fila i bucles que tornen a filtrar routes."""
+    upcoming_trips = upcoming_trips.merge(routes[['route_id', 'route_long_name']], on='route_id', how='left')
+    upcoming_trips['via'] = upcoming_trips.apply(
+        lambda row: (
+            "1" if ' - ' in row['route_long_name'] and row['trip_headsign'] == row['route_long_name'].split(' - ')[1]
+            else "2" if ' - ' in row['route_long_name'] and row['trip_headsign'] != row['route_long_name'].split(' - ')[1]
+            else "Desconegut"
+        ),
+        axis=1
+    )
+    indices_to_drop = []
+    for i in range(len(upcoming_trips)):
+        line = upcoming_trips['route_id'].iloc[i]
+        headsign = upcoming_trips['trip_headsign'].iloc[i]
+        route_long_name = routes[routes['route_id'] == line]['route_long_name'].values[0]
+        if ' - ' in route_long_name:
+            destination = route_long_name.split(' - ')[1]
+            if (headsign != destination) == (vies == 1):
+                indices_to_drop.append(i)
+    return upcoming_trips.drop(indices_to_drop)
+
+
+def indexed_via(upcoming_trips, trip_vias, vies):
+    """Camí nou: via precalculada per viatge i una sola màscara."""
+    upcoming_trips['via'] = trip_vias[upcoming_trips['trip_code']]
+    return upcoming_trips[upcoming_trips['via'] != ("2" if vies == 1 else "1")]
+
+
+def bench_via(stop_times, trips, routes, stop_id="PC"):
+    index = build_departure_index(stop_times, trips)
+    board = query_window(index, stop_id, 0, DAY).merge(trips, on=["trip_id", "service_id"])
+    build_ms = timed(build_trip_vias, trips, routes, repeat=1)
+    trip_vias = build_trip_vias(trips, routes)
+    print(f"via, tauler de 24 h a {stop_id}: {len(board)} sortides")
+    print(f"  càlcul de vies per viatge (un cop): {build_ms:9.2f} ms")
+    print(f"  camí anterior:                      {timed(legacy_via, board, routes, 1, repeat=1):9.2f} ms")
+    print(f"  via precalculada:                   {timed(indexed_via, board, trip_vias, 1):9.3f} ms")
+
+
+# ---------------------------
+# Estació més propera
+# ---------------------------
+
+def legacy_nearest(stops, lat, lon):
+    """Camí anterior: calculate_distance amb apply sobre totes les parades."""
+    from math import radians, cos, sin, sqrt, atan2
+
+    def calculate_distance(lat1, lon1, lat2, lon2):
+        dlat = radians(lat2 - lat1)
+        dlon = radians(lon2 - lon1)
+        a = sin(dlat / 2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2)**2
+        return 6371 * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+    distance = stops.apply(lambda row: calculate_distance(lat, lon, row["stop_lat"], row["stop_lon"]), axis=1)
+    return stops.loc[distance.idxmin()]
+
+
+def synthetic_stops(n, seed=0):
+    """Parades aleatòries repartides per Catalunya."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "stop_id": [f"S{i}" for i in range(n)],
+        "stop_name": [f"Estació {i}" for i in range(n)],
+        "stop_lat": rng.uniform(40.5, 42.8, n),
+        "stop_lon": rng.uniform(0.2, 3.3, n),
+    })
+
+
+def bench_station_search(stops):
+    lat, lon = 41.3888, 2.159
+    for label, frame in (("FGC", stops), ("sintètic", synthetic_stops(100_000))):
+        build_ms = timed(build_stop_index, frame, repeat=1)
+        index = build_stop_index(frame)
+        print(f"estació més propera, {label}: {len(frame)} parades")
+        print(f"  construcció de l'índex (un cop):   {build_ms:9.2f} ms")
+        print(f"  camí anterior (apply):             {timed(legacy_nearest, frame, lat, lon, repeat=1):9.2f} ms")
+        print(f"  haversine vectoritzat:             {timed(nearest_stops_bruteforce, index, lat, lon):9.3f} ms")
+        print(f"  graella, k=1:                      {timed(nearest_stops, index, lat, lon):9.3f} ms")
+        print(f"  graella, k=10:                     {timed(nearest_stops, index, lat, lon, 10):9.3f} ms")
+        print(f"  graella, radi de 2 km:             {timed(stops_within, index, lat, lon, 2.0):9.3f} ms")
+
+
+NAME_WORDS = ["Plaça", "Sant", "Santa", "Estació", "Avinguda", "Passeig", "Carrer", "Pont", "Riera", "Església",
+              "Catalunya", "Gràcia", "Sarrià", "Montjuïc", "Lleida", "Girona", "Mataró", "Vic", "Reus", "Tàrrega",
+              "Major", "Nord", "Sud", "Centre", "Universitat", "Hospital", "Mercat", "Rambla", "Castell", "Font"]
+
+
+def synthetic_station_names(n, seed=0):
+    """Noms d'estació amb accents: "Poble 123 - Plaça Gràcia Nord", amb accessibilitat aleatòria."""
+    rng = np.random.default_rng(seed)
+    words = np.array(NAME_WORDS, dtype=object)
+    picks = rng.integers(0, len(words), size=(n, 3))
+    names = [f"Poble {town} - {words[a]} {words[b]} {words[c]}"
+             for town, (a, b, c) in zip(rng.integers(0, n // 10 + 1, n), picks)]
+    stop_ids = [f"S{i}" for i in range(n)]
+    stops = pd.DataFrame({"stop_id": stop_ids, "stop_name": names})
+    access = pd.DataFrame({
+        "stop_name": names,
+        "stop_id": stop_ids,
+        "wheelchair_boarding": rng.integers(0, 2, n),
+        "wc": rng.integers(-1, 4, n),
+    })
+    return stops, access
+
+
+def legacy_station_lookup(stops, access, name):
+    """Camí anterior: resoldre el nom triat i l'accessibilitat amb dos escanejos."""
+    selected = stops[stops["stop_name"] == name].iloc[0]
+    return access[access["stop_id"] == selected["stop_id"]]
+
+
+def keystrokes(index, text, **filters):
+    """Una cerca per cada lletra escrita, com fa la llista mentre s'escriu."""
+    for end in range(1, len(text) + 1):
+        search_stations(index, text[:end], **filters)
+
+
+def bench_station_names(stops, access):
+    index = build_station_index(stops, access)
+    # Una estació del feed: al de FGC, Sarrià
+    pos = int(np.flatnonzero(stops["stop_name"] == "Sarrià")[0]) if (stops["stop_name"] == "Sarrià").any() else 0
+    name, stop_id = stops["stop_name"].iloc[pos], stops["stop_id"].iloc[pos]
+
+    big_stops, big_access = synthetic_station_names(50_000)
+    build_ms = timed(build_station_index, big_stops, big_access, repeat=1)
+    big = build_station_index(big_stops, big_access)
+    target = big_stops["stop_name"].iloc[12_345]
+
+    print(f"cerca d'estacions per nom, FGC: {len(index['stop_ids'])} estacions")
+    print(f"  camí anterior (dos escanejos):     {timed(legacy_station_lookup, stops, access, name):9.3f} ms")
+    print(f"  \"placa cat\" (prefix):              {timed(search_stations, index, 'placa cat'):9.3f} ms")
+    print(f"  \"terasa\" (aproximada):             {timed(search_stations, index, 'terasa'):9.3f} ms")
+    print(f"  accés per stop_id:                 {timed(station, index, stop_id) * 1000:9.2f} us")
+    print(f"cerca d'estacions per nom, sintètic: {len(big_stops)} estacions")
+    print(f"  construcció de l'índex (un cop):   {build_ms:9.2f} ms")
+    print(f"  camí anterior (dos escanejos):     {timed(legacy_station_lookup, big_stops, big_access, target):9.3f} ms")
+    for text in ("placa gracia", "sant mataro", "hospitl girna"):
+        per_key = timed(keystrokes, big, text) / len(text)
+        print(f"  {text!r:20} per tecla:          {per_key:9.3f} ms")
+    per_key = timed(lambda: keystrokes(big, "placa", wheelchair=True, min_wc=2)) / len("placa")
+    print(f"  'placa' accessible per tecla:      {per_key:9.3f} ms")
+
+
+# ---------------------------
+# Mapes
+# ---------------------------
+
+def legacy_maps(shapes, stops):
+    """Camí anterior: una PolyLine per shape i un Marker per estació, a cada rerun."""
+    import folium
+
+    geotren = folium.Map(location=[41.398222, 2.141769], zoom_start=12)
+    rail_tracks = {shape_id: list(zip(group["shape_pt_lat"], group["shape_pt_lon"]))
+                   for shape_id, group in shapes.groupby("shape_id")}
+    for points in rail_tracks.values():
+        folium.PolyLine(points, color="blue", weight=2, opacity=0.7).add_to(geotren)
+
+    station_map = folium.Map(location=[41.3888, 2.159], zoom_start=11)
+    for _, stop in stops.iterrows():
+        folium.Marker(
+            location=[stop["stop_lat"], stop["stop_lon"]],
+            popup=f"{stop['stop_name']} (ID: {stop['stop_id']})",
+            icon=folium.Icon(color='blue')
+        ).add_to(station_map)
+    return geotren.get_root().render(), station_map.get_root().render()
+
+
+def layered_maps(network):
+    """Camí nou: capes GeoJSON precalculades."""
+    import folium
+
+    geotren = folium.Map(location=[41.398222, 2.141769], zoom_start=12)
+    add_tracks(geotren, network)
+    station_map = folium.Map(location=[41.3888, 2.159], zoom_start=11)
+    add_stations(station_map, network)
+    return geotren.get_root().render(), station_map.get_root().render()
+
+
+def bench_maps(shapes, stops):
+    legacy = legacy_maps(shapes, stops)
+    print(f"mapes: {len(shapes)} punts de shapes, {len(stops)} estacions")
+    print(f"  camí anterior:  {timed(legacy_maps, shapes, stops, repeat=3):9.2f} ms, "
+          f"HTML geotren {len(legacy[0]) / 1024:7.1f} KB, estacions {len(legacy[1]) / 1024:7.1f} KB")
+    for tolerance_m in (0, 5, 20):
+        build_ms = timed(build_network_layer, shapes, stops, tolerance_m, repeat=1)
+        network = build_network_layer(shapes, stops, tolerance_m)
+        layered = layered_maps(network)
+        print(f"  capes, {tolerance_m:2} m:   {timed(layered_maps, network, repeat=3):9.2f} ms, "
+              f"HTML geotren {len(layered[0]) / 1024:7.1f} KB, estacions {len(layered[1]) / 1024:7.1f} KB "
+              f"(construcció un cop: {build_ms:.1f} ms)")
+
+
+# ---------------------------
+# Arrencada
+# ---------------------------
+
+STARTUP_SCRIPT = """
+from time import perf_counter
+import numpy as np, pandas as pd
+import feed
+start = perf_counter()
+{load}
+elapsed = perf_counter() - start
+status = dict(line.split(":", 1) for line in open("/proc/self/status"))
+print(elapsed * 1000, int(status["VmHWM"].split()[0]) / 1024, int(status["VmRSS"].split()[0]) / 1024)
+"""
+
+
+def run_startup(load):
+    """Temps (ms), pic de memòria i memòria final (MB) d'un procés nou que carrega el feed."""
+    output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT.format(load=load)],
+                            capture_output=True, text=True, check=True).stdout
+    elapsed_ms, peak_mb, rss_mb = map(float, output.split())
+    return elapsed_ms, peak_mb, rss_mb
+
+
+def bench_startup(gtfs_dir):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cases = [
+            ("només imports", "tables = None"),
+            ("CSV (read_gtfs)", f"tables = feed.read_gtfs({gtfs_dir!r})"),
+            ("compilar memòria cau", f"tables = feed.compile_feed({gtfs_dir!r}, {cache_dir!r})"),
+            ("memòria cau (mmap)", f"tables = feed.load_feed({gtfs_dir!r}, {cache_dir!r})"),
+        ]
+        print("arrencada en un procés nou")
+        for label, load in cases:
+            elapsed_ms, peak_mb, rss_mb = run_startup(load)
+            print(f"  {label:22} {elapsed_ms:9.2f} ms, pic RSS {peak_mb:7.1f} MB, RSS final {rss_mb:7.1f} MB")
+
+
+def bench_streaming(trips_per_day=54_000):
+    """Ingesta d'un feed sintètic amb uns 5 milions de files de stop_times (FGC amb 30 vegades més viatges)."""
+    with tempfile.TemporaryDirectory() as workdir:
+        gtfs_dir = os.path.join(workdir, "gtfs")
+        size = write_feed(gtfs_dir, trips_per_day=trips_per_day)
+        cache_dir = os.path.join(workdir, "cache")
+        print(f"ingesta de stop_times sintètic: {size['stop_times']} files, "
+              f"{os.path.getsize(os.path.join(gtfs_dir, 'stop_times.txt')) / 2**20:.0f} MB")
+        for label, load in (
+            ("CSV sencer (read_gtfs)", f"tables = feed.read_gtfs({gtfs_dir!r})"),
+            ("compilar a trossos", f"tables = feed.compile_feed({gtfs_dir!r}, {cache_dir!r})"),
+            ("memòria cau (mmap)", f"tables = feed.load_feed({gtfs_dir!r}, {cache_dir!r})"),
+        ):
+            elapsed_ms, peak_mb, rss_mb = run_startup(load)
+            print(f"  {label:22} {elapsed_ms:9.0f} ms, pic RSS {peak_mb:7.1f} MB, RSS final {rss_mb:7.1f} MB")
+
+
+# ---------------------------
+# Comentaris
+# ---------------------------
+
+def legacy_add_comment(path, service, comment_text, station_name):
+    """Camí anterior: llegir tot el JSON, afegir-hi el comentari i reescriure'l."""
+    try:
+        with open(path) as file:
+            comments_data = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        comments_data = {}
+    comments_data.setdefault(service, []).append({"service": service, "comment": comment_text, "station": station_name})
+    with open(path, "w") as file:
+        json.dump(comments_data, file, indent=4)
+
+
+def hammer(add, threads=8, per_thread=200):
+    """Escriure threads x per_thread comentaris alhora; torna el temps en ms."""
+    def writer(thread):
+        for i in range(per_thread):
+            add("Lavabos", f"comentari {thread}-{i}", "PC")
+
+    workers = [threading.Thread(target=writer, args=(thread,)) for thread in range(threads)]
+    start = perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (perf_counter() - start) * 1000
+
+
+def bench_comments(threads=8, per_thread=200):
+    expected = threads * per_thread
+    print(f"comentaris: {threads} fils x {per_thread} escriptures a la mateixa estació")
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "comments.json")
+        elapsed_ms = hammer(lambda *args: legacy_add_comment(path, *args), threads, per_thread)
+        try:
+            with open(path) as file:
+                kept = len(json.load(file)["Lavabos"])
+        except json.JSONDecodeError:
+            kept = 0
+        print(f"  JSON reescrit (anterior): {elapsed_ms:9.0f} ms, {kept}/{expected} comentaris guardats")
+
+        # Sense límit de retenció, per poder comptar-los tots
+        store = CommentStore(os.path.join(workdir, "comments.db"), keep=None)
+        elapsed_ms = hammer(lambda service, comment, station: store.add(service, station, comment), threads, per_thread)
+        kept = store.count()
+        print(f"  SQLite WAL:               {elapsed_ms:9.0f} ms, {kept}/{expected} comentaris guardats")
+        print(f"  lectura (memòria cau):    {timed(store.list, 'Lavabos', 'PC', repeat=20):9.3f} ms")
+
+
+# ---------------------------
+# Taulers per lots i servidor HTTP
+# ---------------------------
+
+def per_stop_boards(index, calendar, trip_vias, trips, stop_ids, date, start, end):
+    """Camí de l'app abans dels lots: una consulta i un merge amb trips per parada."""
+    boards = []
+    for stop_id in stop_ids:
+        upcoming = query_window(index, stop_id, start, end)
+        running = np.zeros(len(upcoming), dtype=bool)
+        for day_offset in (-1, 0, 1):
+            valid_trips = valid_trip_mask(calendar, date + pd.Timedelta(days=day_offset))
+            running |= (upcoming["day_offset"] == day_offset) & valid_trips[upcoming["trip_code"]]
+        upcoming = upcoming[running].merge(trips, on=["trip_id", "service_id"])
+        upcoming["via"] = trip_vias[upcoming["trip_code"]]
+        boards.append(upcoming)
+    return boards
+
+
+def http_load(port, path, seconds=3, clients=8):
+    """Peticions per segon que aguanta el servidor amb clients fils consultant path sense parar."""
+    counts = [0] * clients
+    deadline = perf_counter() + seconds
+
+    def client(slot):
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        while perf_counter() < deadline:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            assert response.status == 200
+            counts[slot] += 1
+        connection.close()
+
+    workers = [threading.Thread(target=client, args=(slot,)) for slot in range(clients)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / seconds
+
+
+def bench_boards(stop_times, trips, routes, calendar_dates, feed_info, stops):
+    index = build_departure_index(stop_times, trips)
+    calendar = build_calendar_index(calendar_dates, feed_info, trips)
+    trip_vias = build_trip_vias(trips, routes)
+    stop_ids = stops["stop_id"].dropna().tolist()
+    busiest = int(np.argmax(calendar["trip_masks"][calendar["day_pattern"]].sum(axis=1)))
+    date = calendar["first_day"] + pd.Timedelta(days=busiest)
+    start, end = 8 * 3600, 10 * 3600
+
+    # Els dos camins han de donar les mateixes sortides a cada parada perquè la comparació de temps valgui
+    batch_boards = departure_boards(index, calendar, trip_vias, trips, stop_ids, date, start, end)
+    for stop_id, board in zip(stop_ids, per_stop_boards(index, calendar, trip_vias, trips, stop_ids, date, start, end)):
+        expected = batch_boards[batch_boards["stop_id"] == stop_id][board.columns].reset_index(drop=True)
+        pd.testing.assert_frame_equal(board.reset_index(drop=True), expected, check_dtype=False, check_categorical=False)
+
+    print(f"taulers de {len(stop_ids)} parades, finestra de 2 h, {len(batch_boards)} sortides")
+    per_stop = timed(per_stop_boards, index, calendar, trip_vias, trips, stop_ids, date, start, end, repeat=3)
+    batch = timed(departure_boards, index, calendar, trip_vias, trips, stop_ids, date, start, end)
+    single = timed(departure_boards, index, calendar, trip_vias, trips, stop_ids[:1], date, start, end)
+    print(f"  una consulta per parada (anterior): {per_stop:9.2f} ms ({len(stop_ids) / per_stop * 1000:8.0f} taulers/s)")
+    print(f"  totes en una passada:               {batch:9.2f} ms ({len(stop_ids) / batch * 1000:8.0f} taulers/s)")
+    print(f"  una sola parada:                    {single:9.2f} ms")
+
+    data = {"departure_index": index, "calendar_index": calendar, "trip_vias": trip_vias, "trips": trips, "stop_ids": stop_ids}
+    for label, ttl in (("sense memòria cau", 0), ("amb memòria cau", 30)):
+        server = BoardServer(("127.0.0.1", 0), data, ttl=ttl)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        path = f"/boards?date={date.isoformat()}&start=08:00&hours=2"
+        one = http_load(server.server_port, f"{path}&stops={stop_ids[0]}")
+        everything = http_load(server.server_port, path)
+        server.shutdown()
+        server.server_close()
+        print(f"  HTTP {label:18} una parada {one:7.0f} peticions/s, totes les parades {everything:7.0f} peticions/s")
+
+
+# ---------------------------
+# Planificador de trajectes
+# ---------------------------
+
+def bench_planner(stop_times, trips, stops, calendar_dates, feed_info, access, n_queries=500, seed=0):
+    start = perf_counter()
+    connections = build_connections(stop_times, trips, stops, access)
+    build_ms = (perf_counter() - start) * 1000
+    calendar = build_calendar_index(calendar_dates, feed_info, trips)
+    # El dia amb més viatges del feed
+    busiest = int(np.argmax(calendar["trip_masks"][calendar["day_pattern"]].sum(axis=1)))
+    date = calendar["first_day"] + pd.Timedelta(days=busiest)
+
+    rng = np.random.default_rng(seed)
+    stop_ids = stops["stop_id"].dropna().to_numpy()
+    print(f"planificador: {len(connections['dep_secs'])} connexions, construïdes en {build_ms:.0f} ms")
+    plan_journey(connections, calendar, stop_ids[0], stop_ids[1], date, 0)  # Prepara les connexions del dia
+    for wheelchair in (False, True):
+        # En cadira de rodes, parells d'estacions accessibles (si no, no hi ha res a buscar)
+        candidates = connections["stop_ids"][connections["accessible"]].to_numpy() if wheelchair else stop_ids
+        latencies, found = [], 0
+        for _ in range(n_queries):
+            origin, destination = rng.choice(candidates, size=2, replace=False)
+            depart_secs = int(rng.integers(5 * 3600, 23 * 3600))
+            begin = perf_counter()
+            legs = plan_journey(connections, calendar, origin, destination, date, depart_secs, wheelchair=wheelchair)
+            latencies.append((perf_counter() - begin) * 1000)
+            found += not legs.empty
+        label = "cadira de rodes" if wheelchair else "totes les estacions"
+        print(f"  {label:20} {n_queries} parells O-D: mitjana {np.mean(latencies):6.2f} ms, "
+              f"p95 {np.percentile(latencies, 95):6.2f} ms, màx {np.max(latencies):6.2f} ms, {found} amb trajecte")
+
+    # Pitjor cas: escanejar totes les connexions del dia (cap a una parada que no existeix)
+    day = _day_connections(connections, calendar, date)
+    origin = connections["stop_pos"][stop_ids[0]]
+    worst = timed(_scan, day, origin, -1, 0, None, TRANSFER_SECS)
+    print(f"  {'dia sencer':20} {len(day['dep_secs'])} connexions escanejades en {worst:6.2f} ms")
+
+
+def bench_reachability(stop_times, trips, stops, calendar_dates, feed_info, access):
+    connections = build_connections(stop_times, trips, stops, access)
+    calendar = build_calendar_index(calendar_dates, feed_info, trips)
+    busiest = int(np.argmax(calendar["trip_masks"][calendar["day_pattern"]].sum(axis=1)))
+    date = calendar["first_day"] + pd.Timedelta(days=busiest)
+
+    start = perf_counter()
+    table = build_reachability(connections, calendar, date)
+    build_ms = (perf_counter() - start) * 1000
+    print(f"taules d'abast: {table['minutes'].shape[0]} franges x {len(table['stop_ids'])} estacions, "
+          f"{table['minutes'].nbytes / 2**20:.1f} MB, construïdes en {build_ms:.0f} ms")
+
+    stop_ids = stops["stop_id"].dropna().to_numpy()
+    print(f"  estacions a 30 min (consulta):     {timed(reachable_within, table, stop_ids[0], 8 * 3600, 30, repeat=100):9.4f} ms")
+    print(f"  planificador, un sol destí:        {timed(plan_journey, connections, calendar, stop_ids[0], stop_ids[1], date, 8 * 3600):9.4f} ms")
+
+
+# ---------------------------
+# Retards en temps real
+# ---------------------------
+
+def synthetic_positions(stop_times, trips, n_trains, rng):
+    """Registres de l'API per n_trains viatges a l'atzar, aturats a una parada del seu recorregut."""
+    trains = rng.choice(trips["trip_id"].to_numpy(), size=n_trains, replace=False)
+    route_stops = stop_times[stop_times["trip_id"].isin(trains)].groupby("trip_id", observed=True)["stop_id"].agg(list)
+    return [{"id": train, "estacionat_a": rng.choice(route_stops[train]), "properes_parades": None} for train in trains]
+
+
+def bench_delays(stop_times, trips, routes, calendar_dates, feed_info, stops, n_trains=200, n_moved=10, seed=0):
+    from datetime import datetime
+
+    rng = np.random.default_rng(seed)
+    build_ms = timed(DelayTracker, stop_times, trips, repeat=1)
+    tracker = DelayTracker(stop_times, trips)
+    at = datetime(2025, 3, 3, 8)
+    records = synthetic_positions(stop_times, trips, n_trains, rng)
+    other = synthetic_positions(stop_times, trips, n_trains, rng)
+    # Instantània següent: els n_moved primers trens han canviat de parada
+    moved = [{**registre, "estacionat_a": "??"} for registre in records[:n_moved]] + records[n_moved:]
+
+    def alternate(first, second):
+        tracker.update(first, at)
+        tracker.update(second, at)
+
+    tracker.update(records, at)
+    print(f"retards: {n_trains} trens en circulació, {len(stop_times)} files de stop_times")
+    print(f"  construcció (un cop):                 {build_ms:9.2f} ms")
+    print(f"  instantània sense canvis:             {timed(tracker.update, records, at):9.3f} ms")
+    print(f"  {n_moved:3} trens canvien de parada:        {timed(alternate, moved, records) / 2:9.3f} ms")
+    print(f"  {n_trains:3} trens canvien (tots):            {timed(alternate, other, records) / 2:9.3f} ms")
+
+    index = build_departure_index(stop_times, trips)
+    calendar = build_calendar_index(calendar_dates, feed_info, trips)
+    trip_vias = build_trip_vias(trips, routes)
+    busiest = int(np.argmax(calendar["trip_masks"][calendar["day_pattern"]].sum(axis=1)))
+    date = calendar["first_day"] + pd.Timedelta(days=busiest)
+    boards = departure_boards(index, calendar, trip_vias, trips, stops["stop_id"].dropna().tolist(), date, 8 * 3600, 10 * 3600)
+    print(f"  hora prevista a {len(boards):5} sortides:       {timed(tracker.apply, boards, date):9.3f} ms")
+
+# ---------------------------
+# Dades compartides i sessions
+# ---------------------------
+
+def simulated_session(data, indices, stop_id, date):
+    """Un rerun de l'app per una sessió: estat mínim, tauler de l'estació i la distància a totes les parades."""
+    session_state = {"menu_level_1": "Buscador", "menu_level_2": "Llista", "selected_stop": stop_id, "selected_option": "all"}
+    board = departure_boards(*indices, data.trips, [session_state["selected_stop"]], date, 8 * 3600, 10 * 3600)
+    # El codi antic afegia columnes a les taules compartides: ara només toca la còpia de la sessió
+    stops = data.stops
+    stop = stops.iloc[data.stop_pos[stop_id]]
+    stops["distance"] = np.hypot(stops["stop_lat"] - stop["stop_lat"], stops["stop_lon"] - stop["stop_lon"])
+    return session_state, board["trip_id"].tolist(), stops.nsmallest(3, "distance")["stop_id"].tolist()
+
+
+def bench_sessions(gtfs_dir, cache_dir, n_sessions=64, workers=16):
+    data = feed.load_dataset(gtfs_dir, cache_dir)
+    indices = (build_departure_index(data.stop_times, data.trips),
+               build_calendar_index(data.calendar_dates, data.feed_info, data.trips),
+               build_trip_vias(data.trips, data.routes))
+    calendar = indices[1]
+    busiest = int(np.argmax(calendar["trip_masks"][calendar["day_pattern"]].sum(axis=1)))
+    date = calendar["first_day"] + pd.Timedelta(days=busiest)
+    stop_ids = list(data.stop_pos)
+
+    sessions = [stop_ids[i % len(stop_ids)] for i in range(n_sessions)]
+    start = perf_counter()
+    serial = [simulated_session(data, indices, stop_id, date) for stop_id in sessions]
+    serial_ms = (perf_counter() - start) * 1000
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda stop_id: simulated_session(data, indices, stop_id, date), sessions))
+    concurrent_ms = (perf_counter() - start) * 1000
+
+    legacy_state = dict(serial[0][0], selected_stop=data.stops.iloc[data.stop_pos[sessions[0]]])
+    tracemalloc.start()
+    simulated_session(data, indices, sessions[0], date)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"sessions: {n_sessions} sessions simulades")
+    print(f"  en sèrie:                                  {serial_ms:9.0f} ms")
+    print(f"  en {workers:2} fils:                                {concurrent_ms:9.0f} ms")
+    print(f"  estat de sessió, amb la fila de stops (anterior): {len(pickle.dumps(legacy_state)):6} bytes")
+    print(f"  estat de sessió, només stop_id:                  {len(pickle.dumps(serial[0][0])):6} bytes")
+    print(f"  memòria transitòria d'un rerun (pic):            {peak / 1024:6.0f} KB")
+    print(f"  taules per sessió (còpia superficial):           {timed(lambda: [getattr(data, name) for name in feed.FEED_TABLES], repeat=20):9.3f} ms")
+
+
+# ---------------------------
+# Mètriques
+# ---------------------------
+
+def bench_metrics(n=100_000):
+    def spans(metrics):
+        for _ in range(n):
+            with metrics.span("etapa"):
+                pass
+            metrics.count("cache_hits", cache="feed")
+
+    metrics = Metrics()
+    print(f"mètriques: {n} spans i comptadors")
+    print(f"  desactivades: {timed(spans, metrics, repeat=3) * 1000 / n:7.3f} µs per span")
+    metrics.enabled = True
+    print(f"  activades:    {timed(spans, metrics, repeat=3) * 1000 / n:7.3f} µs per span")
+
+
+# ---------------------------
+# Històric de posicions
+# ---------------------------
+
+def synthetic_day(n_trains, snapshot_secs, seed=0):
+    """Instantànies d'un dia sencer: trens que es mouen a l'atzar, amb en_hora i ocupació."""
+    rng = np.random.default_rng(seed)
+    n_snapshots = 24 * 3600 // snapshot_secs
+    lines = np.array(["L6", "L7", "S1", "S2", "R5", "R6", "L8", "S3"])[rng.integers(0, 8, n_trains)]
+    steps = rng.normal(0, 0.001, size=(n_snapshots, n_trains, 2)) * (rng.random((n_snapshots, n_trains, 1)) < 0.6)
+    positions = np.array([41.4, 2.1]) + np.cumsum(steps, axis=0)
+    late = rng.random((n_snapshots, n_trains)) < 0.15
+    occupancy = rng.integers(0, 101, size=(n_snapshots, n_trains, 4))
+    for snapshot in range(n_snapshots):
+        yield snapshot * snapshot_secs, [{
+            "id": f"{lines[train]}{train:03d}",
+            "lin": lines[train],
+            "ut": f"{112 + train % 40}.{train % 3}",
+            "geo_point_2d": {"lat": positions[snapshot, train, 0], "lon": positions[snapshot, train, 1]},
+            "en_hora": "False" if late[snapshot, train] else "True",
+            "ocupacio_mi_percent": occupancy[snapshot, train, 0],
+            "ocupacio_ri_percent": occupancy[snapshot, train, 1],
+            "ocupacio_m1_percent": occupancy[snapshot, train, 2],
+            "ocupacio_m2_percent": None if train % 2 else occupancy[snapshot, train, 3],
+        } for train in range(n_trains)]
+
+
+def copy_chunks(path, days):
+    """Repetir els trossos del primer dia als `days` dies següents (només canvia la primera hora)."""
+    for filename in sorted(os.listdir(path)):
+        with np.load(os.path.join(path, filename)) as chunk:
+            columns = dict(chunk)
+        first, last = (int(value) for value in filename[:-len(".npz")].split("-"))
+        for day in range(1, days):
+            shifted = dict(columns, time=columns["time"].copy())
+            shifted["time"][0] += day * 86400
+            np.savez_compressed(os.path.join(path, f"{first + day * 86400}-{last + day * 86400}.npz"), **shifted)
+
+
+def bench_history(days=28, n_trains=120, snapshot_secs=15):
+    from datetime import datetime, timedelta
+
+    start = datetime(2025, 3, 3)
+    with tempfile.TemporaryDirectory() as workdir:
+        recorder = SnapshotRecorder(workdir)
+        json_bytes, record_secs, worst_secs, n_snapshots = 0, 0.0, 0.0, 0
+        for offset, records in synthetic_day(n_trains, snapshot_secs):
+            if n_snapshots % 240 == 0:
+                json_bytes += len(json.dumps(records, default=int)) * 240
+            began = perf_counter()
+            recorder.record(records, start + timedelta(seconds=offset))
+            record_secs += perf_counter() - began
+            worst_secs = max(worst_secs, perf_counter() - began)
+            n_snapshots += 1
+        recorder.flush()
+        day_bytes = sum(os.path.getsize(os.path.join(workdir, name)) for name in os.listdir(workdir))
+        copy_chunks(workdir, days)
+
+        print(f"històric de posicions: {n_trains} trens, una instantània cada {snapshot_secs} s")
+        print(f"  enregistrar (mitjana per instantània): {record_secs / n_snapshots * 1000:9.3f} ms")
+        print(f"  enregistrar (pitjor, escriu i fusiona): {worst_secs * 1000:8.1f} ms")
+        print(f"  un dia en trossos .npz:                {day_bytes / 1e6:9.2f} MB (JSON: {json_bytes / 1e6:.1f} MB)")
+
+        end = start + timedelta(days=days)
+        scan_ms = timed(lambda: load_history(workdir, start, end), repeat=1)
+        history = load_history(workdir, start, end)
+        print(f"  llegir {days} dies ({len(history['time']):,} files):    {scan_ms:9.1f} ms")
+        print(f"  puntualitat per línia i hora:          {timed(punctuality, history):9.1f} ms")
+        print(f"  ocupació per unitat:                   {timed(occupancy_by_unit, history):9.1f} ms")
+
+
+# ---------------------------
+# Suite per escales (resultats en JSON)
+# ---------------------------
+
+SCALES = (1, 10, 100)  # Múltiples de la mida de FGC
+REGRESSION_RATIO = 1.2  # Una etapa més lenta que això respecte a la referència és una regressió
+
+
+def scale_results(scale, workdir, n_queries=200, n_comments=500, seed=0):
+    """Temps (ms) de càrrega, cerca d'estacions, taulers, mapes i comentaris amb un feed scale x FGC."""
+    gtfs_dir = os.path.join(workdir, f"gtfs-{scale}")
+    cache_dir = os.path.join(workdir, f"cache-{scale}")
+    size = write_scaled_feed(gtfs_dir, scale, seed)
+    stages = {}
+
+    # Càrrega en un procés nou: compilar la memòria cau i llegir-la ja compilada
+    stages["load_compile_ms"], stages["load_compile_peak_mb"], _ = run_startup(f"tables = feed.compile_feed({gtfs_dir!r}, {cache_dir!r})")
+    stages["load_cached_ms"], stages["load_cached_peak_mb"], _ = run_startup(f"tables = feed.load_feed({gtfs_dir!r}, {cache_dir!r})")
+    tables = feed.load_feed(gtfs_dir, cache_dir)
+    stops, stop_times, trips = tables["stops"], tables["stop_times"], tables["trips"]
+
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(BBOX[0], BBOX[1], n_queries)
+    lons = rng.uniform(BBOX[2], BBOX[3], n_queries)
+    stages["stop_index_build_ms"] = timed(build_stop_index, stops, repeat=1)
+    stop_index = build_stop_index(stops)
+    stages["nearest_stop_ms"] = timed(lambda: [nearest_stops(stop_index, lat, lon) for lat, lon in zip(lats, lons)]) / n_queries
+    stages["station_index_build_ms"] = timed(build_station_index, stops, tables["access"], repeat=1)
+    station_index = build_station_index(stops, tables["access"])
+    queries = [f"estacio {number}" for number in rng.integers(0, len(stops), n_queries)]
+    stages["station_name_search_ms"] = timed(lambda: [search_stations(station_index, query) for query in queries]) / n_queries
+
+    start = perf_counter()
+    index = build_departure_index(stop_times, trips)
+    calendar = build_calendar_index(tables["calendar_dates"], tables["feed_info"], trips)
+    trip_vias = build_trip_vias(trips, tables["routes"])
+    stages["board_index_build_ms"] = (perf_counter() - start) * 1000
+    stop_ids = stops["stop_id"].astype(object).tolist()
+    date = calendar["first_day"] + pd.Timedelta(days=7)
+    board_stops = rng.choice(stop_ids, size=n_queries)
+    stages["board_one_stop_ms"] = timed(lambda: [departure_boards(index, calendar, trip_vias, trips, [stop_id], date, 8 * 3600, 10 * 3600)
+                                                 for stop_id in board_stops], repeat=3) / n_queries
+    stages["board_all_stops_ms"] = timed(departure_boards, index, calendar, trip_vias, trips, stop_ids, date, 8 * 3600, 10 * 3600, repeat=3)
+
+    stages["map_layer_build_ms"] = timed(build_network_layer, tables["shapes"], stops, repeat=1)
+    network = build_network_layer(tables["shapes"], stops)
+    stages["map_render_ms"] = timed(layered_maps, network, repeat=3)
+
+    store = CommentStore(os.path.join(workdir, f"comments-{scale}.db"))
+    stations = rng.choice(stop_ids, size=n_comments)
+    stages["comment_write_ms"] = timed(lambda: [store.add("Lavabos", station, "comentari") for station in stations], repeat=1) / n_comments
+    stages["comment_read_ms"] = timed(lambda: [store.list("Lavabos", station) for station in stations[:n_queries]], repeat=3) / n_queries
+    return {"size": size, "stages": stages}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_scales(scales=SCALES, seed=0):
+    """Executar la suite a cada escala i tornar els resultats en un diccionari serialitzable."""
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "seed": seed,
+        "scales": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in scales:
+            result = scale_results(scale, workdir, seed=seed)
+            results["scales"][str(scale)] = result
+            print(f"escala {scale}x: " + ", ".join(f"{count} {name}" for name, count in result["size"].items()))
+            for stage, value in result["stages"].items():
+                print(f"  {stage:24} {value:12.3f}")
+    return results
+
+
+def compare_results(results, baseline):
+    """Etapes comunes amb la referència; marca les que han empitjorat més de REGRESSION_RATIO."""
+    regressions = 0
+    for scale, result in results["scales"].items():
+        reference = baseline["scales"].get(scale)
+        if reference is None:
+            continue
+        print(f"escala {scale}x respecte a {baseline.get('commit') or 'la referència'}")
+        for stage, value in result["stages"].items():
+            if stage not in reference["stages"] or not reference["stages"][stage]:
+                continue
+            ratio = value / reference["stages"][stage]
+            flag = "  REGRESSIÓ" if ratio > REGRESSION_RATIO else ""
+            regressions += bool(flag)
+            print(f"  {stage:24} {reference['stages'][stage]:12.3f} -> {value:12.3f} ({ratio:5.2f}x){flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks de l'aplicació")
+    parser.add_argument("--scales", help="Suite amb feeds sintètics a aquestes escales, p. ex. 1,10,100")
+    parser.add_argument("--json", help="Desar els resultats de la suite en aquest fitxer JSON")
+    parser.add_argument("--compare", help="Resultats JSON d'una versió anterior per detectar regressions")
+    args = parser.parse_args()
+
+    if args.scales:
+        results = bench_scales([int(scale) for scale in args.scales.split(",")])
+        if args.json:
+            with open(args.json, "w") as file:
+                json.dump(results, file, indent=4)
+        if args.compare:
+            with open(args.compare) as file:
+                sys.exit(1 if compare_results(results, json.load(file)) else 0)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        gtfs_dir = feed_dir(workdir)
+        stops, stop_times, trips, calendar_dates, feed_info, routes, shapes, access = load_feed(gtfs_dir)
+        # La parada amb més sortides del feed
+        stop_id = stop_times["stop_id"].value_counts().index[0]
+        bench_departure_board(stop_times, trips, stop_id)
+        bench_calendar(trips, calendar_dates, feed_info)
+        bench_via(stop_times, trips, routes, stop_id)
+        bench_station_search(stops)
+        bench_station_names(stops, access)
+        bench_maps(shapes, stops)
+        bench_startup(gtfs_dir)
+        bench_comments()
+        bench_planner(stop_times, trips, stops, calendar_dates, feed_info, access)
+        bench_reachability(stop_times, trips, stops, calendar_dates, feed_info, access)
+        bench_boards(stop_times, trips, routes, calendar_dates, feed_info, stops)
+        bench_delays(stop_times, trips, routes, calendar_dates, feed_info, stops)
+        bench_sessions(gtfs_dir, os.path.join(workdir, "cache"))
+        bench_history()
+        bench_metrics()
+        bench_streaming()
@@ -0,0 +1,180 @@
+# Taulers de sortides sense Streamlit: consulta per lots i servidor HTTP/JSON.
+# Ús: python boards.py [--port 8000] [--gtfs data]
+
+import argparse
+import json
+import threading
+import time
+from datetime import date as Date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from feed import GTFS_DIR, load_feed
+from metrics import METRICS
+from timetable import DAY, build_calendar_index, build_departure_index, build_trip_vias, format_seconds, query_boards, valid_trip_mask
+
+BOARD_TTL = 30  # Segons que el servidor reutilitza una resposta ja calculada
+BOARD_COLUMNS = ["trip_id", "route_id", "trip_headsign", "departure_time", "via", "day_offset"]
+
+# ---------------------------
+# Consulta de taulers
+# ---------------------------
+
+def load_board_data(gtfs_source=GTFS_DIR):
+    """Índexs que necessiten els taulers, construïts un sol cop a partir del feed."""
+    feed = load_feed(gtfs_source)
+    return {
+        "departure_index": build_departure_index(feed["stop_times"], feed["trips"]),
+        "calendar_index": build_calendar_index(feed["calendar_dates"], feed["feed_info"], feed["trips"]),
+        "trip_vias": build_trip_vias(feed["trips"], feed["routes"]),
+        "trips": feed["trips"],
+        "stop_ids": feed["stops"]["stop_id"].dropna().astype(object).tolist(),
+    }
+
+
+def departure_boards(departure_index, calendar_index, trip_vias, trips, stop_ids, date, start, end, via=0):
+    """Taulers de sortides de totes les parades de stop_ids en una sola passada.
+
+    start i end són segons des de la mitjanit de date (end pot superar DAY).
+    Només es queden les sortides amb el servei actiu el seu dia de servei. via 1
+    treu els trens de via "2" i via 2 els de via "1" (els de via desconeguda es
+    queden a totes dues). A més de les columnes de query_boards, cada fila porta
+    les columnes de trips, via i departure_time (HH:MM:SS).
+    """
+    boards = query_boards(departure_index, stop_ids, start, end)
+
+    # Cada sortida ha de tenir el servei actiu el seu dia de servei (ahir, avui o demà)
+    trip_codes = boards["trip_code"].to_numpy()
+    day_offsets = boards["day_offset"].to_numpy()
+    running = np.zeros(len(boards), dtype=bool)
+    for day_offset in (-1, 0, 1):
+        valid_trips = valid_trip_mask(calendar_index, date + timedelta(days=day_offset))
+        running |= (day_offsets == day_offset) & valid_trips[trip_codes]
+
+    vias = trip_vias[trip_codes]
+    if via == 1:
+        running &= vias != "2"
+    elif via == 2:
+        running &= vias != "1"
+    boards = boards[running].reset_index(drop=True)
+
+    # Columnes de trips per posició, sense merge
+    trip_columns = trips.drop(columns=[column for column in boards.columns if column in trips.columns])
+    boards = pd.concat([boards, trip_columns.iloc[trip_codes[running]].reset_index(drop=True)], axis=1)
+    boards["via"] = vias[running]
+    boards["departure_time"] = format_seconds(boards["board_secs"] % DAY)
+    return boards
+
+
+def boards_to_json(boards, stop_ids):
+    """{stop_id: [sortides]} amb les columnes de BOARD_COLUMNS; les parades sense sortides hi surten buides."""
+    records = boards[["stop_id", *BOARD_COLUMNS]].astype({"day_offset": int}).to_dict("records")
+    result = {stop_id: [] for stop_id in stop_ids}
+    for record in records:
+        result[record.pop("stop_id")].append(record)
+    return result
+
+# ---------------------------
+# Servidor HTTP/JSON
+# ---------------------------
+
+def _parse_query(query, all_stops):
+    """Paràmetres de /boards: stops, date (AAAA-MM-DD), start (HH:MM), hours i via."""
+    params = {name: values[-1] for name, values in parse_qs(query).items()}
+    now = datetime.now()
+    stop_ids = list(dict.fromkeys(params["stops"].split(","))) if params.get("stops") else all_stops
+    date = Date.fromisoformat(params["date"]) if "date" in params else now.date()
+    if "start" in params:
+        hours, minutes = params["start"].split(":")
+        start = int(hours) * 3600 + int(minutes) * 60
+    else:
+        start = now.hour * 3600 + now.minute * 60
+    hours = float(params.get("hours", 2))
+    via = int(params.get("via", 0))
+    if via not in (0, 1, 2) or not 0 < hours <= 24:
+        raise ValueError("via ha de ser 0, 1 o 2 i hours entre 0 i 24")
+    return tuple(stop_ids), date, start, start + int(hours * 3600), via
+
+
+class BoardServer(ThreadingHTTPServer):
+    """Servidor de taulers: GET /boards?stops=PC,GR&date=2025-03-03&start=08:00&hours=2&via=1.
+
+    Les pantalles de les estacions fan sempre les mateixes consultes, de manera
+    que cada resposta es guarda ja codificada durant BOARD_TTL segons.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, data, ttl=BOARD_TTL):
+        super().__init__(address, BoardRequestHandler)
+        self.data = data
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def board_response(self, query):
+        key = _parse_query(query, self.data["stop_ids"])
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            METRICS.count("cache_hits", cache="boards")
+            return cached[1]
+
+        METRICS.count("cache_misses", cache="boards")
+        stop_ids, date, start, end, via = key
+        with METRICS.span("departure_boards"):
+            boards = departure_boards(self.data["departure_index"], self.data["calendar_index"], self.data["trip_vias"],
+                                      self.data["trips"], stop_ids, date, start, end, via)
+        body = json.dumps(boards_to_json(boards, stop_ids), ensure_ascii=False).encode()
+        with self._lock:
+            if len(self._cache) > 1024:
+                self._cache.clear()
+            self._cache[key] = (time.monotonic() + self.ttl, body)
+        return body
+
+
+class BoardRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Connexions persistents per a les pantalles que consulten sovint
+    disable_nagle_algorithm = True  # Capçaleres i cos van en dos send(): sense això, cada resposta espera l'ACK retardat
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/boards":
+            self._send(404, {"error": "not found"})
+            return
+        try:
+            body = self.server.board_response(url.query)
+        except (KeyError, ValueError) as error:
+            self._send(400, {"error": str(error)})
+            return
+        self._send(200, body)
+
+    def _send(self, status, body):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Sense una línia per petició
+
+
+def serve(port=8000, gtfs_source=GTFS_DIR, host="0.0.0.0"):
+    """Engegar el servidor de taulers (bloqueja fins que s'atura)."""
+    server = BoardServer((host, port), load_board_data(gtfs_source))
+    print(f"Taulers a http://{host}:{server.server_port}/boards")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor HTTP/JSON de taulers de sortides")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--gtfs", default=GTFS_DIR, help="Directori o .zip del GTFS")
+    args = parser.parse_args()
+    serve(args.port, args.gtfs)
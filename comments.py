@@ -0,0 +1,113 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+KEEP_PER_STATION = 10  # Comentaris que es guarden per servei i estació
+
+# ---------------------------
+# Magatzem de comentaris (SQLite)
+# ---------------------------
+
+class CommentStore:
+    """Comentaris per servei i estació en una base de dades SQLite en mode WAL.
+
+    Cada comentari és un INSERT (no es reescriu cap fitxer), de manera que
+    escriptors concurrents, fils o processos, no es trepitgen. Les lectures es
+    serveixen d'una memòria cau en memòria que es buida quan s'hi escriu, i
+    també quan un altre procés hi ha escrit (PRAGMA data_version).
+    """
+
+    def __init__(self, path, keep=KEEP_PER_STATION, legacy_json=None):
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS comments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                service TEXT NOT NULL,
+                station TEXT NOT NULL,
+                comment TEXT NOT NULL,
+                timestamp TEXT NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS comments_service_station ON comments (service, station, timestamp)")
+        if legacy_json is not None:
+            self._import_json(legacy_json)
+        self._data_version = self._read_data_version()
+
+    def _read_data_version(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _import_json(self, path):
+        """Importar el comments.json antic si la base de dades encara és buida."""
+        if not os.path.exists(path):
+            return
+        with open(path) as file:
+            comments_data = json.load(file)
+        rows = [(comment["service"], comment["station"], comment["comment"],
+                 datetime.fromisoformat(comment["timestamp"]).isoformat(sep=" ", timespec="microseconds"))
+                for service_comments in comments_data.values() for comment in service_comments]
+        with self._lock:
+            # Dins la transacció, perquè dos processos no l'importin tots dos
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if not self._conn.execute("SELECT 1 FROM comments LIMIT 1").fetchone():
+                    self._conn.executemany("INSERT INTO comments (service, station, comment, timestamp) VALUES (?, ?, ?, ?)", rows)
+                    if self.keep is not None:
+                        # El JSON antic pot tenir més de keep comentaris per estació
+                        self._conn.execute("""
+                            DELETE FROM comments WHERE id IN (
+                                SELECT id FROM (
+                                    SELECT id, ROW_NUMBER() OVER (
+                                        PARTITION BY service, station ORDER BY timestamp DESC, id DESC) AS position
+                                    FROM comments)
+                                WHERE position > ?)""", (self.keep,))
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def add(self, service, station, comment, timestamp=None):
+        """Afegir un comentari i deixar només els keep més recents del servei a l'estació."""
+        timestamp = (timestamp or datetime.now()).isoformat(sep=" ", timespec="microseconds")
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("INSERT INTO comments (service, station, comment, timestamp) VALUES (?, ?, ?, ?)",
+                                   (service, station, comment, timestamp))
+                if self.keep is not None:
+                    self._conn.execute("""
+                        DELETE FROM comments WHERE service = ? AND station = ? AND id NOT IN (
+                            SELECT id FROM comments WHERE service = ? AND station = ?
+                            ORDER BY timestamp DESC, id DESC LIMIT ?)""",
+                                       (service, station, service, station, self.keep))
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._cache.clear()
+
+    def list(self, service, station):
+        """Comentaris d'un servei a una estació, del més recent al més antic: [(datetime, text)]."""
+        with self._lock:
+            data_version = self._read_data_version()
+            if data_version != self._data_version:
+                # Un altre procés hi ha escrit
+                self._cache.clear()
+                self._data_version = data_version
+            key = (service, station)
+            if key not in self._cache:
+                rows = self._conn.execute(
+                    "SELECT timestamp, comment FROM comments WHERE service = ? AND station = ? ORDER BY timestamp DESC, id DESC",
+                    key).fetchall()
+                self._cache[key] = [(datetime.fromisoformat(timestamp), comment) for timestamp, comment in rows]
+            return self._cache[key]
+
+    def count(self):
+        """Nombre total de comentaris guardats."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM comments").fetchone()[0]
@@ -0,0 +1,193 @@
+import json
+import os
+import re
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from timetable import DAY, _trip_codes, format_seconds, time_column_seconds
+
+NOT_TRACKED = np.iinfo(np.int32).max  # from_secs dels viatges sense dades en temps real
+STOP_CODE = re.compile(r"[A-Z0-9]{2,3}")
+
+# ---------------------------
+# Instantànies de posicions
+# ---------------------------
+
+def next_stops(value):
+    """Llista de codis de parada de properes_parades.
+
+    L'API el dona com a text (objectes JSON separats per ";", per exemple
+    '{"parada": "GR"};{"parada": "SG"}'), però també s'accepta una llista.
+    """
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [item.get("parada") if isinstance(item, dict) else item for item in value]
+    return STOP_CODE.findall(re.sub(r'"?parada"?\s*:', "", str(value)))
+
+
+def save_snapshot(path, records, fetched_at=None):
+    """Desar una instantània de l'API en JSON per poder-la reproduir després."""
+    fetched_at = fetched_at or datetime.now()
+    with open(path, "w") as file:
+        json.dump({"fetched_at": fetched_at.isoformat(), "results": records}, file, ensure_ascii=False)
+
+
+def load_snapshot(path):
+    """Llegir una instantània desada: (fetched_at, registres).
+
+    També accepta una resposta de l'API tal qual; llavors l'hora és la del fitxer.
+    """
+    with open(path) as file:
+        snapshot = json.load(file)
+    if "fetched_at" in snapshot:
+        fetched_at = datetime.fromisoformat(snapshot["fetched_at"])
+    else:
+        fetched_at = datetime.fromtimestamp(os.path.getmtime(path))
+    return fetched_at, snapshot.get("results", [])
+
+# ---------------------------
+# Retards per viatge
+# ---------------------------
+
+class DelayTracker:
+    """Retard estimat de cada viatge a partir d'instantànies successives de posicions.
+
+    Per cada tren es compara on és amb l'horari: si està aturat a estacionat_a,
+    el retard és l'hora de la instantània menys l'arribada prevista a l'estació;
+    si circula, encara no ha arribat a la primera de properes_parades i el retard
+    és com a mínim l'hora menys l'arribada prevista allà. El retard s'aplica a
+    les parades des d'aquella en endavant (from_secs, l'hora prevista de la
+    parada), de manera que el tauler calcula l'hora prevista de tots els trens
+    sense recórrer l'horari.
+
+    update() només recalcula els trens que han canviat de posició des de
+    l'última instantània i oblida els que ja no hi surten: el cost és
+    proporcional als trens que canvien, no a la mida de l'horari.
+    """
+
+    def __init__(self, stop_times, trips):
+        trip_codes = _trip_codes(stop_times, trips)
+        stop_codes, stop_ids = pd.factorize(stop_times["stop_id"].astype(object))
+        departures = time_column_seconds(stop_times["departure_time"])
+        arrivals = time_column_seconds(stop_times["arrival_time"], fallback=departures)
+
+        # Parades de cada viatge en ordre, en trams contigus
+        order = np.lexsort((stop_times["stop_sequence"].to_numpy(), trip_codes))
+        self._stops = stop_codes[order]
+        self._arrivals = arrivals[order]
+        self._departures = departures[order]
+        # Les files sense viatge a trips (-1) queden davant de offsets[0] i no es fan servir
+        self._offsets = np.searchsorted(trip_codes[order], np.arange(len(trips) + 1))
+        self._stop_ids = np.asarray(stop_ids, dtype=object)
+        self._stop_pos = {stop_id: pos for pos, stop_id in enumerate(stop_ids)}
+        self._trip_pos = {trip_id: pos for pos, trip_id in enumerate(trips["trip_id"].astype(object))}
+
+        self.delay_secs = np.zeros(len(trips), dtype=np.int32)
+        self.from_secs = np.full(len(trips), NOT_TRACKED, dtype=np.int32)
+        self.service_day = np.zeros(len(trips), dtype=np.int32)  # Data (ordinal) del dia de servei seguit
+        self._positions = {}  # id del tren -> (trip_code, estacionat_a, propera parada)
+        self._lock = threading.Lock()
+        self.last_snapshot = None
+
+    def _estimate(self, trip, at, stopped_at, next_stop):
+        """(retard, hora prevista de la parada des d'on s'aplica, dia de servei) o None."""
+        lo, hi = self._offsets[trip], self._offsets[trip + 1]
+        stop, moving = (stopped_at, False) if stopped_at is not None else (next_stop, True)
+        stop_code = self._stop_pos.get(stop)
+        if stop_code is None:
+            return None
+        rows = lo + np.flatnonzero(self._stops[lo:hi] == stop_code)
+        if len(rows) == 0:
+            return None
+        row = rows[0]
+        scheduled = int(self._arrivals[row])
+
+        # Dia de servei: el que deixa l'hora real més a prop de l'horari (viatges de 24:xx)
+        now_secs = at.hour * 3600 + at.minute * 60 + at.second
+        day_offset = min((0, 1, -1), key=lambda offset: abs(now_secs + offset * DAY - scheduled))
+        delay = now_secs + day_offset * DAY - scheduled
+        if moving:
+            # Encara no ha arribat a la propera parada: només sabem que no va més avançat
+            delay = max(delay, 0)
+        from_secs = scheduled if moving else int(self._departures[row])
+        return delay, from_secs, at.toordinal() - day_offset
+
+    def update(self, records, at=None):
+        """Aplicar una instantània de posicions; torna els trip_code que han canviat."""
+        at = at or datetime.now()
+        changed = set()
+        with self._lock:
+            seen = set()
+            for registre in records:
+                trip = self._trip_pos.get(registre.get("id"))
+                if trip is None:
+                    continue
+                seen.add(registre["id"])
+                upcoming = next_stops(registre.get("properes_parades"))
+                position = (trip, registre.get("estacionat_a"), upcoming[0] if upcoming else None)
+                if self._positions.get(registre["id"]) == position:
+                    continue
+                self._positions[registre["id"]] = position
+                estimate = self._estimate(trip, at, position[1], position[2])
+                if estimate is None:
+                    # Posició que no encaixa amb l'horari del viatge: sense estimació
+                    self.delay_secs[trip], self.from_secs[trip] = 0, NOT_TRACKED
+                else:
+                    self.delay_secs[trip], self.from_secs[trip], self.service_day[trip] = estimate
+                changed.add(trip)
+
+            # Els trens que ja no surten han acabat el recorregut
+            for train_id in set(self._positions) - seen:
+                trip = self._positions.pop(train_id)[0]
+                self.delay_secs[trip], self.from_secs[trip] = 0, NOT_TRACKED
+                changed.add(trip)
+        return changed
+
+    def update_snapshot(self, snapshot, at=None):
+        """Com update(), però no fa res si la instantània (index_positions) ja s'ha aplicat.
+
+        Sense at, l'hora és la fetched_at de la instantània, no la del moment d'aplicar-la.
+        """
+        with self._lock:
+            if snapshot is self.last_snapshot:
+                return set()
+            self.last_snapshot = snapshot
+        return self.update(snapshot["results"], at or snapshot.get("fetched_at"))
+
+    def replay(self, paths):
+        """Reproduir instantànies desades amb save_snapshot, en ordre; torna els canvis de cadascuna."""
+        changes = []
+        for path in paths:
+            fetched_at, records = load_snapshot(path)
+            changes.append(self.update(records, fetched_at))
+        return changes
+
+    def apply(self, board, date):
+        """Afegir delay_secs, predicted_secs i predicted_time a un tauler (departure_boards).
+
+        Només es retarden les sortides del dia de servei seguit i de parades des
+        de la posició del tren en endavant; la resta queden amb l'hora programada.
+        """
+        trip_codes = board["trip_code"].to_numpy()
+        service_day = date.toordinal() + board["day_offset"].to_numpy().astype(np.int32)
+        downstream = (board["departure_secs"].to_numpy() >= self.from_secs[trip_codes]) & (service_day == self.service_day[trip_codes])
+        board = board.assign(delay_secs=np.where(downstream, self.delay_secs[trip_codes], 0))
+        board["predicted_secs"] = board["board_secs"] + board["delay_secs"]
+        board["predicted_time"] = format_seconds(board["predicted_secs"] % DAY)
+        return board
+
+    def predicted_times(self, trip_id):
+        """Parades d'un viatge amb l'hora programada i la prevista (segons del dia de servei)."""
+        trip = self._trip_pos[trip_id]
+        lo, hi = self._offsets[trip], self._offsets[trip + 1]
+        departures = self._departures[lo:hi]
+        downstream = departures >= self.from_secs[trip]
+        return pd.DataFrame({
+            "stop_id": self._stop_ids[self._stops[lo:hi]],
+            "scheduled_secs": departures,
+            "predicted_secs": departures + np.where(downstream, self.delay_secs[trip], 0),
+        })
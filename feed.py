@@ -0,0 +1,297 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+from pandas._libs.parsers import STR_NA_VALUES
+
+from metrics import METRICS
+from timetable import gtfs_time_to_seconds
+
+GTFS_DIR = "data"
+CACHE_DIR = ".feed_cache"
+
+# Taules del feed i fitxer d'on surt cadascuna
+FEED_TABLES = {
+    "stops": "stops.txt",
+    "stop_times": "stop_times.txt",
+    "trips": "trips.txt",
+    "calendar_dates": "calendar_dates.txt",
+    "feed_info": "feed_info.txt",
+    "routes": "routes.txt",
+    "access": "access.csv",
+    "shapes": "shapes.txt",
+}
+TIME_COLUMNS = ("arrival_time", "departure_time")
+CACHE_FORMAT = 4  # Canviar-lo invalida les memòries cau compilades amb un format anterior
+
+# stop_times es llegeix a trossos i només amb aquestes columnes
+STOP_TIMES_DTYPES = {"trip_id": str, "arrival_time": str, "departure_time": str, "stop_id": str, "stop_sequence": "int32"}
+CHUNK_ROWS = 500_000
+
+# ---------------------------
+# Lectura del GTFS
+# ---------------------------
+
+def _open_table(source, filename):
+    """Obrir un fitxer del GTFS, tant si source és un directori com un .zip."""
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            # Alguns .zip porten els fitxers dins d'una carpeta
+            names = [name for name in archive.namelist() if os.path.basename(name) == filename]
+            if not names:
+                raise FileNotFoundError(f"{filename} no és a {source}")
+            # El fitxer del .zip queda obert fins que es tanca el membre
+            return archive.open(names[0])
+    return open(os.path.join(source, filename), "rb")
+
+
+def is_id_column(column):
+    """Columnes d'identificadors (*_id), que es llegeixen sempre com a text.
+
+    Així un trip_id 101 és el mateix a trips que a stop_times encara que una
+    taula l'infereixi com a enter. direction_id no és un identificador sinó un
+    0/1 del GTFS.
+    """
+    return column.endswith("_id") and column != "direction_id"
+
+
+def _na_values(columns):
+    """Opcions de pd.read_csv perquè als id només falti el text buit.
+
+    Amb els valors per defecte de pandas, l'id "NA" (Terrassa Nacions Unides)
+    es llegiria com a NaN. Les altres columnes mantenen els de pandas.
+    """
+    return {
+        "keep_default_na": False,
+        "na_values": {column: [""] if is_id_column(column) else sorted(STR_NA_VALUES) for column in columns},
+    }
+
+
+def read_table(source, filename, **kwargs):
+    """Llegir una taula del GTFS amb pd.read_csv (directori o .zip), amb els id com a text."""
+    with _open_table(source, filename) as file:
+        header = pd.read_csv(file, nrows=0).columns
+    dtype = {column: str for column in header if is_id_column(column)}
+    dtype.update(kwargs.pop("dtype", None) or {})
+    with _open_table(source, filename) as file:
+        return pd.read_csv(file, dtype=dtype, **_na_values(header), **kwargs)
+
+
+def read_gtfs(gtfs_dir=GTFS_DIR):
+    """Llegir els CSV del GTFS tal com són, sencers."""
+    return {name: read_table(gtfs_dir, filename) for name, filename in FEED_TABLES.items()}
+
+
+def feed_key(gtfs_dir=GTFS_DIR):
+    """Clau de la memòria cau: feed_version i data i mida de cada fitxer (o del .zip)."""
+    feed_version = read_table(gtfs_dir, "feed_info.txt")["feed_version"].iloc[0]
+    digest = hashlib.sha1(f"{CACHE_FORMAT}:{feed_version}".encode())
+    if zipfile.is_zipfile(gtfs_dir):
+        paths = [gtfs_dir]
+    else:
+        paths = [os.path.join(gtfs_dir, filename) for filename in sorted(FEED_TABLES.values())]
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+    return digest.hexdigest()[:16]
+
+# ---------------------------
+# Memòria cau columnar
+# ---------------------------
+
+def _compact_column(table, column, values):
+    """Forma compacta d'una columna: (tipus, {nom: array}) per desar en .npy."""
+    if table == "stop_times" and column in TIME_COLUMNS:
+        # Segons del dia de servei en int32; -1 si la parada no té hora
+        seconds = np.full(len(values), -1, dtype=np.int32)
+        present = values.notna().to_numpy()
+        seconds[present] = gtfs_time_to_seconds(values[present].astype(str))
+        return "seconds", {"values": seconds}
+    if pd.api.types.is_float_dtype(values):
+        return "float", {"values": values.to_numpy(dtype=np.float32)}
+    if pd.api.types.is_integer_dtype(values) or pd.api.types.is_bool_dtype(values):
+        fits = values.empty or (values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max)
+        return "int", {"values": values.to_numpy(dtype=np.int32 if fits else np.int64)}
+    # Identificadors i textos: codis enters i la llista de valors diferents
+    codes, categories = pd.factorize(values)
+    return "category", {"codes": codes.astype(_codes_dtype(len(categories))), "categories": np.asarray(categories, dtype=str)}
+
+
+def _codes_dtype(n_categories):
+    """Tipus dels codis que pandas fa servir amb n_categories categories.
+
+    Si els codis desats ja en són, pd.Categorical.from_codes no els converteix
+    i la columna continua sobre el mmap en lloc de ser una còpia per procés.
+    """
+    return pd.Categorical.from_codes(np.empty(0, dtype=np.int8), categories=pd.RangeIndex(n_categories)).codes.dtype
+
+
+def _encode(values, categories):
+    """Codis enters de values; els valors nous s'afegeixen a categories (valor -> codi)."""
+    for value in values.dropna().unique():
+        if value not in categories:
+            categories[value] = len(categories)
+    return values.map(categories).fillna(-1).to_numpy(dtype=np.int32)
+
+
+def _compile_stop_times(gtfs_dir, staging, chunksize=CHUNK_ROWS):
+    """Compilar stop_times a trossos: cada tros es redueix a arrays int32 i es descarta.
+
+    Només es llegeixen les columnes de STOP_TIMES_DTYPES, amb tipus explícits,
+    de manera que la taula de text sencera no és mai a memòria.
+    """
+    parts, kinds = {}, {}
+    categories = {"trip_id": {}, "stop_id": {}}
+    with _open_table(gtfs_dir, "stop_times.txt") as file:
+        header = [column for column in pd.read_csv(file, nrows=0).columns if column in STOP_TIMES_DTYPES]
+    with _open_table(gtfs_dir, "stop_times.txt") as file:
+        chunks = pd.read_csv(file, usecols=header, dtype=STOP_TIMES_DTYPES, chunksize=chunksize, **_na_values(header))
+        for chunk in chunks:
+            for column in chunk.columns:
+                if column in categories:
+                    kinds[column] = "category"
+                    parts.setdefault(column, []).append(_encode(chunk[column], categories[column]))
+                else:
+                    kinds[column], arrays = _compact_column("stop_times", column, chunk[column])
+                    parts.setdefault(column, []).append(arrays["values"])
+
+    for column, kind in kinds.items():
+        values = np.concatenate(parts.pop(column))
+        if kind == "category":
+            np.save(os.path.join(staging, f"stop_times.{column}.codes.npy"), values.astype(_codes_dtype(len(categories[column]))))
+            np.save(os.path.join(staging, f"stop_times.{column}.categories.npy"), np.array(list(categories[column]), dtype=str))
+        else:
+            np.save(os.path.join(staging, f"stop_times.{column}.values.npy"), values)
+    return kinds
+
+
+def compile_feed(gtfs_dir=GTFS_DIR, cache_dir=CACHE_DIR):
+    """Convertir el GTFS (directori o .zip) en una memòria cau columnar (un .npy per columna).
+
+    Es desa a cache_dir/<feed_key>/ i s'hi escriu primer en un directori temporal
+    que després es reanomena, perquè un altre procés no pugui llegir-la a mig fer.
+    """
+    key = feed_key(gtfs_dir)
+    target = os.path.join(cache_dir, key)
+    if os.path.exists(target):
+        METRICS.count("cache_hits", cache="feed")
+        return target
+
+    METRICS.count("cache_misses", cache="feed")
+    os.makedirs(cache_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{key}-", dir=cache_dir)
+    manifest = {"key": key, "tables": {}}
+    for table, filename in FEED_TABLES.items():
+        if table == "stop_times":
+            manifest["tables"][table] = _compile_stop_times(gtfs_dir, staging)
+            continue
+        frame = read_table(gtfs_dir, filename)
+        columns = {}
+        for column in frame.columns:
+            kind, arrays = _compact_column(table, column, frame[column])
+            for part, array in arrays.items():
+                np.save(os.path.join(staging, f"{table}.{column}.{part}.npy"), array)
+            columns[column] = kind
+        manifest["tables"][table] = columns
+    with open(os.path.join(staging, "manifest.json"), "w") as file:
+        json.dump(manifest, file, indent=4)
+
+    try:
+        os.rename(staging, target)
+    except OSError:
+        # Un altre procés l'ha compilada alhora: ens quedem amb la seva
+        shutil.rmtree(staging, ignore_errors=True)
+    return target
+
+
+def load_compiled(path):
+    """Carregar una memòria cau compilada; els arrays numèrics es mapen de disc (mmap).
+
+    Amb el mapatge, diversos processos que carreguen la mateixa memòria cau
+    comparteixen les mateixes pàgines en lloc de tenir-ne cadascun una còpia.
+    """
+    with open(os.path.join(path, "manifest.json")) as file:
+        manifest = json.load(file)
+
+    def array(table, column, part):
+        return np.load(os.path.join(path, f"{table}.{column}.{part}.npy"), mmap_mode="r")
+
+    tables = {}
+    for table, columns in manifest["tables"].items():
+        data = {}
+        for column, kind in columns.items():
+            if kind == "category":
+                categories = pd.Index(np.asarray(array(table, column, "categories")), dtype=object)
+                data[column] = pd.Categorical.from_codes(array(table, column, "codes"), categories=categories)
+            else:
+                data[column] = array(table, column, "values")
+        tables[table] = pd.DataFrame(data, copy=False)
+    return tables
+
+
+def load_feed(gtfs_dir=GTFS_DIR, cache_dir=CACHE_DIR):
+    """Carregar el feed (directori o .zip) des de la memòria cau, compilant-la primer si cal."""
+    with METRICS.span("load_feed"):
+        return load_compiled(compile_feed(gtfs_dir, cache_dir))
+
+# ---------------------------
+# Dades compartides de només lectura
+# ---------------------------
+
+def _freeze(frame):
+    """Mateixa taula amb tots els arrays de només lectura (els de la memòria cau ja ho són, mmap)."""
+    columns = {}
+    for column in frame.columns:
+        values = frame[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes = values.array.codes
+            if codes.flags.writeable:
+                codes = codes.copy()
+                codes.flags.writeable = False
+            columns[column] = pd.Categorical.from_codes(codes, categories=values.cat.categories)
+        else:
+            array = values.to_numpy()
+            if array.flags.writeable:
+                array = array.copy()
+                array.flags.writeable = False
+            columns[column] = array
+    return pd.DataFrame(columns, copy=False)
+
+
+class FeedDataset:
+    """Feed carregat, de només lectura, compartit per totes les sessions.
+
+    Els arrays de les taules no es poden escriure: una assignació dins d'una
+    columna falla en lloc de canviar les dades de tothom. Cada accés a una
+    taula (dataset.stops, dataset.trips...) torna una còpia superficial, sense
+    copiar dades, de manera que afegir-hi o reemplaçar-hi columnes només afecta
+    qui ho fa. Amb la memòria cau mmap, els processos que carreguen el mateix
+    feed comparteixen també les pàgines. Les sessions guarden només el
+    stop_id; stop_pos el tradueix a la posició a stops.
+    """
+
+    def __init__(self, tables):
+        tables = {name: _freeze(frame) for name, frame in tables.items()}
+        object.__setattr__(self, "_tables", MappingProxyType(tables))
+        stop_ids = tables["stops"]["stop_id"].astype(object)
+        object.__setattr__(self, "stop_pos", MappingProxyType({stop_id: pos for pos, stop_id in enumerate(stop_ids) if pd.notna(stop_id)}))
+        object.__setattr__(self, "feed_version", str(tables["feed_info"]["feed_version"].iloc[0]))
+
+    def __getattr__(self, name):
+        if name in self._tables:
+            return self._tables[name].copy(deep=False)
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FeedDataset és de només lectura")
+
+
+def load_dataset(gtfs_dir=GTFS_DIR, cache_dir=CACHE_DIR):
+    """Carregar el feed com a FeedDataset (des de la memòria cau, compilant-la si cal)."""
+    return FeedDataset(load_feed(gtfs_dir, cache_dir))
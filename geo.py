@@ -0,0 +1,143 @@
+import numpy as np
+
+R = 6371  # Radi de la Terra en km
+
+# ---------------------------
+# Distàncies
+# ---------------------------
+
+def haversine_km(lat, lon, lats, lons):
+    """Distància (en km) d'un punt a un vector de coordenades."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * R * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _project(index, lat, lon):
+    """Projecció equirectangular en km, centrada a la latitud mitjana de les parades."""
+    x = R * np.radians(lon) * np.cos(np.radians(index["lat0"]))
+    y = R * np.radians(lat)
+    return x, y
+
+# ---------------------------
+# Graella espacial de parades
+# ---------------------------
+
+# La projecció deforma una mica les distàncies lluny de lat0: deixem marge
+GRID_MARGIN = 0.9
+# Per sota d'aquesta mida és més ràpid calcular la distància a totes les parades
+BRUTEFORCE_MAX_STOPS = 2000
+
+
+def build_stop_index(stops, cell_km=None):
+    """Construir una graella de parades per trobar les més properes sense recórrer-les totes.
+
+    Cada parada cau en una cel·la de cell_km x cell_km (per defecte, unes quatre
+    parades per cel·la). Les parades s'ordenen per cel·la, de manera que les
+    d'una cel·la són un tram contigu que es troba amb una cerca binària.
+    """
+    lats = stops["stop_lat"].to_numpy(dtype=np.float64)
+    lons = stops["stop_lon"].to_numpy(dtype=np.float64)
+    index = {"lats": lats, "lons": lons, "lat0": float(lats.mean())}
+
+    x, y = _project(index, lats, lons)
+    if cell_km is None:
+        area = max((x.max() - x.min()) * (y.max() - y.min()), 1e-6)
+        cell_km = max(2 * np.sqrt(area / len(lats)), 0.05)
+
+    cx = ((x - x.min()) // cell_km).astype(np.int64)
+    cy = ((y - y.min()) // cell_km).astype(np.int64)
+    n_rows = int(cy.max()) + 1
+    keys = cx * n_rows + cy
+    order = np.argsort(keys, kind="stable")
+
+    index.update({
+        "x0": x.min(), "y0": y.min(), "cell_km": cell_km,
+        "n_cols": int(cx.max()) + 1, "n_rows": n_rows,
+        "order": order, "keys": keys[order],
+    })
+    return index
+
+
+def _cells_stops(index, cx, cy):
+    """Posicions (a stops) de les parades de les cel·les (cx, cy) donades."""
+    inside = (cx >= 0) & (cx < index["n_cols"]) & (cy >= 0) & (cy < index["n_rows"])
+    keys = cx[inside] * index["n_rows"] + cy[inside]
+    lo = np.searchsorted(index["keys"], keys, side="left")
+    hi = np.searchsorted(index["keys"], keys, side="right")
+    counts = hi - lo
+    if counts.sum() == 0:
+        return np.empty(0, dtype=np.int64)
+    # Concatenar els trams [lo, hi) sense bucle de Python
+    starts = np.repeat(lo - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    return index["order"][starts + np.arange(counts.sum())]
+
+
+def _point_cell(index, lat, lon):
+    x, y = _project(index, lat, lon)
+    cx = int((x - index["x0"]) // index["cell_km"])
+    cy = int((y - index["y0"]) // index["cell_km"])
+    return cx, cy
+
+
+def _sorted_by_distance(index, positions, lat, lon):
+    distances = haversine_km(lat, lon, index["lats"][positions], index["lons"][positions])
+    order = np.argsort(distances, kind="stable")
+    return positions[order], distances[order]
+
+
+def nearest_stops_bruteforce(index, lat, lon, k=1):
+    """Les k parades més properes calculant la distància a totes (haversine vectoritzat)."""
+    positions, distances = _sorted_by_distance(index, np.arange(len(index["lats"])), lat, lon)
+    return positions[:k], distances[:k]
+
+
+def nearest_stops(index, lat, lon, k=1):
+    """Les k parades més properes a (lat, lon): posicions a stops i distàncies en km.
+
+    Es recorren anells de cel·les al voltant del punt fins que la k-èsima distància
+    trobada és més petita que la de qualsevol cel·la encara no visitada.
+    """
+    k = min(k, len(index["lats"]))
+    cx, cy = _point_cell(index, lat, lon)
+    if len(index["lats"]) <= BRUTEFORCE_MAX_STOPS or not (0 <= cx < index["n_cols"] and 0 <= cy < index["n_rows"]):
+        # Xarxa petita o clic fora de la xarxa: amb el càlcul directe n'hi ha prou
+        return nearest_stops_bruteforce(index, lat, lon, k)
+
+    max_ring = max(index["n_cols"], index["n_rows"])
+    found = np.empty(0, dtype=np.int64)
+    for ring in range(max_ring + 1):
+        if ring == 0:
+            dx, dy = np.array([0]), np.array([0])
+        else:
+            side = np.arange(-ring, ring + 1)
+            inner = side[1:-1]
+            dx = np.concatenate([side, side, np.full(len(inner), -ring), np.full(len(inner), ring)])
+            dy = np.concatenate([np.full(len(side), -ring), np.full(len(side), ring), inner, inner])
+        found = np.concatenate([found, _cells_stops(index, cx + dx, cy + dy)])
+
+        if len(found) >= k:
+            positions, distances = _sorted_by_distance(index, found, lat, lon)
+            if distances[k - 1] <= ring * index["cell_km"] * GRID_MARGIN:
+                return positions[:k], distances[:k]
+
+    positions, distances = _sorted_by_distance(index, found, lat, lon)
+    return positions[:k], distances[:k]
+
+
+def stops_within(index, lat, lon, radius_km):
+    """Totes les parades a menys de radius_km de (lat, lon), de la més propera a la més llunyana."""
+    if len(index["lats"]) <= BRUTEFORCE_MAX_STOPS:
+        positions, distances = _sorted_by_distance(index, np.arange(len(index["lats"])), lat, lon)
+        close = distances <= radius_km
+        return positions[close], distances[close]
+
+    cx, cy = _point_cell(index, lat, lon)
+    reach = int(np.ceil(radius_km / (index["cell_km"] * GRID_MARGIN)))
+    dx, dy = np.meshgrid(np.arange(-reach, reach + 1), np.arange(-reach, reach + 1))
+    candidates = _cells_stops(index, cx + dx.ravel(), cy + dy.ravel())
+
+    positions, distances = _sorted_by_distance(index, candidates, lat, lon)
+    close = distances <= radius_km
+    return positions[close], distances[close]
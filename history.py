@@ -0,0 +1,295 @@
+# Històric de posicions dels trens: instantànies successives en trossos columnars.
+# S'activa a l'app amb FGC_HISTORY=1 (es desa a data/history).
+
+import glob
+import os
+import tempfile
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from realtime import OCCUPANCY_FIELDS
+
+HISTORY_DIR = "data/history"
+CHUNK_SNAPSHOTS = 20  # Instantànies per tros (5 minuts amb el ttl de 15 s): el que es perd si el procés mor
+COMPACT_CHUNKS = 12  # Trossos que es fusionen en un (una hora amb el ttl de 15 s)
+COORD_SCALE = 100_000  # Graus -> enters (uns 1,1 m de resolució)
+NO_OCCUPANCY = 255  # Ocupació desconeguda d'un cotxe
+EPOCH = datetime(1970, 1, 1)
+
+# ---------------------------
+# Codificació de les instantànies
+# ---------------------------
+
+def _timestamp(at):
+    """Segons des de 1970 de l'hora local (sense zona), perquè l'hora del dia surti amb una divisió."""
+    return int((at - EPOCH).total_seconds())
+
+
+def _flag(value):
+    """en_hora com a 1 (en hora), 0 (amb retard) o -1 (desconegut); l'API el pot donar com a text."""
+    if isinstance(value, str):
+        value = {"true": True, "1": True, "false": False, "0": False}.get(value.strip().lower())
+    if value is None:
+        return -1
+    return int(bool(value))
+
+
+def _occupancy(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return NO_OCCUPANCY
+    return NO_OCCUPANCY if np.isnan(value) else int(min(max(round(value), 0), 100))
+
+
+def _segment_starts(codes):
+    """Ordre estable per codi i on comença cada grup dins d'aquest ordre."""
+    order = np.argsort(codes, kind="stable")
+    starts = np.ones(len(order), dtype=bool)
+    starts[1:] = codes[order][1:] != codes[order][:-1]
+    return order, starts
+
+
+def delta_encode(values, groups):
+    """Cada valor menys l'anterior del mateix grup (el primer de cada grup queda sencer).
+
+    Un tren aturat o que avança poc dona diferències petites o zero, que el
+    .npz comprimit guarda en molt poc espai.
+    """
+    order, starts = _segment_starts(groups)
+    sorted_values = values[order]
+    deltas = np.empty_like(sorted_values)
+    deltas[0:1] = sorted_values[0:1]
+    deltas[1:] = np.diff(sorted_values)
+    deltas[starts] = sorted_values[starts]
+    encoded = np.empty_like(values)
+    encoded[order] = deltas
+    return encoded
+
+
+def delta_decode(deltas, groups):
+    """Invers de delta_encode: suma acumulada que torna a començar a cada grup."""
+    order, starts = _segment_starts(groups)
+    totals = np.cumsum(deltas[order])
+    starts_at = np.flatnonzero(starts)
+    base = totals[starts_at] - deltas[order][starts_at]
+    values = np.empty_like(deltas)
+    values[order] = totals - np.repeat(base, np.diff(np.append(starts_at, len(order))))
+    return values
+
+
+def _codes(values):
+    """Codis enters i categories d'una columna de text."""
+    codes, categories = pd.factorize(pd.Series(values, dtype=object).fillna("Desconegut"))
+    return codes.astype(np.int32), np.asarray(categories, dtype=str)
+
+# ---------------------------
+# Enregistrador
+# ---------------------------
+
+class SnapshotRecorder:
+    """Desar instantànies successives de posicions en trossos columnars només d'afegir.
+
+    Les instantànies es guarden en memòria i cada `chunk_snapshots` s'escriu un
+    tros nou (<primera>-<última>.npz, en segons des de 1970). Cada fila és un
+    tren en una instantània: id, línia i unitat (codis sobre les categories del
+    tros), posició en enters diferencials per tren, en_hora i l'ocupació de
+    cada cotxe. Cada `compact_chunks` trossos es fusionen en un de sol, perquè
+    llegir mesos d'històric no vagi obrint milers de fitxers petits; mentre
+    no s'esborren els petits, load_history ja no els llegeix. Els trossos
+    s'escriuen i es fusionen amb el lock agafat, perquè ho facin en l'ordre de
+    les instantànies i cap tros fusionat cobreixi hores d'un tros encara per
+    escriure; cada tros va a un fitxer temporal que després es reanomena,
+    perquè els lectors no en vegin mai un de mig fet.
+    """
+
+    def __init__(self, path=HISTORY_DIR, chunk_snapshots=CHUNK_SNAPSHOTS, compact_chunks=COMPACT_CHUNKS):
+        self.path = path
+        self.chunk_snapshots = chunk_snapshots
+        self.compact_chunks = compact_chunks
+        self._lock = threading.Lock()
+        self._pending = []  # [(segons, registres)]
+        self._written = []  # Trossos petits encara per fusionar
+        self._last = -1  # Segons de l'última instantània acceptada
+        os.makedirs(path, exist_ok=True)
+
+    def record(self, records, at=None):
+        """Afegir una instantània (registres de l'API); escriu un tros quan n'hi ha prou."""
+        at = _timestamp(at or datetime.now())
+        with self._lock:
+            if at <= self._last:
+                return  # La mateixa instantània llegida dues vegades
+            self._last = at
+            self._pending.append((at, list(records)))
+            if len(self._pending) >= self.chunk_snapshots:
+                snapshots, self._pending = self._pending, []
+                self._write(snapshots)
+
+    def flush(self):
+        """Escriure ara les instantànies pendents (en un tros més curt)."""
+        with self._lock:
+            snapshots, self._pending = self._pending, []
+            if snapshots:
+                self._write(snapshots, compact=False)
+
+    def _write(self, snapshots, compact=True):
+        """Desar un tros i fusionar els petits quan n'hi ha prou; cal tenir el lock."""
+        records = [registre for _, snapshot in snapshots for registre in snapshot]
+        counts = np.array([len(snapshot) for _, snapshot in snapshots], dtype=np.int64)
+        train, train_categories = _codes([registre.get("id") for registre in records])
+        line, line_categories = _codes([registre.get("lin") for registre in records])
+        unit, unit_categories = _codes([registre.get("ut") for registre in records])
+        points = [registre.get("geo_point_2d") or {} for registre in records]
+        chunk = {
+            "time": np.repeat(np.array([at for at, _ in snapshots], dtype=np.int64), counts),
+            "train": train,
+            "train_categories": train_categories,
+            "line": line,
+            "line_categories": line_categories,
+            "unit": unit,
+            "unit_categories": unit_categories,
+            "lat": np.array([point.get("lat", np.nan) for point in points], dtype=np.float64),
+            "lon": np.array([point.get("lon", np.nan) for point in points], dtype=np.float64),
+            "en_hora": np.array([_flag(registre.get("en_hora")) for registre in records], dtype=np.int8),
+        }
+        for field in OCCUPANCY_FIELDS:
+            chunk[field] = np.array([_occupancy(registre.get(field)) for registre in records], dtype=np.uint8)
+        filename = _save_chunk(self.path, chunk, snapshots[0][0], snapshots[-1][0])
+        if not compact or self.compact_chunks <= 1:
+            return
+
+        self._written.append(filename)
+        if len(self._written) < self.compact_chunks:
+            return
+        small, self._written = self._written, []
+        first, last = _chunk_range(small[0])[0], _chunk_range(small[-1])[1]
+        _save_chunk(self.path, _read_chunks(small, positions=True), first, last)
+        for filename in small:
+            os.remove(filename)
+
+
+def _save_chunk(path, chunk, first, last):
+    """Codificar un tros (columnes com les de load_history) i desar-lo com a <first>-<last>.npz."""
+    lat = np.round(np.nan_to_num(chunk["lat"]) * COORD_SCALE).astype(np.int32)
+    lon = np.round(np.nan_to_num(chunk["lon"]) * COORD_SCALE).astype(np.int32)
+    columns = {
+        "time": delta_encode(chunk["time"], np.zeros(len(chunk["time"]), dtype=np.int32)),
+        "train": chunk["train"],
+        "train_categories": chunk["train_categories"].astype(str),
+        "line": chunk["line"].astype(np.int16),
+        "line_categories": chunk["line_categories"].astype(str),
+        "unit": chunk["unit"],
+        "unit_categories": chunk["unit_categories"].astype(str),
+        "lat": delta_encode(lat, chunk["train"]),
+        "lon": delta_encode(lon, chunk["train"]),
+        "en_hora": chunk["en_hora"],
+        **{field: chunk[field] for field in OCCUPANCY_FIELDS},
+    }
+    filename = os.path.join(path, f"{first}-{last}.npz")
+    handle, staging = tempfile.mkstemp(prefix=".chunk-", suffix=".npz", dir=path)
+    with os.fdopen(handle, "wb") as file:
+        np.savez_compressed(file, **columns)
+    os.replace(staging, filename)
+    return filename
+
+# ---------------------------
+# Lectura i agregacions
+# ---------------------------
+
+def _chunk_range(filename):
+    first, last = os.path.basename(filename)[:-len(".npz")].split("-")
+    return int(first), int(last)
+
+
+def _read_chunks(chunks, first=-np.inf, last=np.inf, positions=False):
+    """Files dels trossos entre first i last (segons), amb les categories unificades."""
+    parts = {}
+    categories = {"line": {}, "unit": {}, "train": {}}
+    for filename in chunks:
+        with np.load(filename) as chunk:
+            times = np.cumsum(chunk["time"])
+            keep = (times >= first) & (times <= last)
+            parts.setdefault("time", []).append(times[keep])
+            for column, known in categories.items():
+                # Codis del tros -> codis comuns
+                local = chunk[f"{column}_categories"]
+                remap = np.array([known.setdefault(name, len(known)) for name in local], dtype=np.int32)
+                parts.setdefault(column, []).append(remap[chunk[column]][keep])
+            for column in ("en_hora", *OCCUPANCY_FIELDS):
+                parts.setdefault(column, []).append(chunk[column][keep])
+            if positions:
+                for column in ("lat", "lon"):
+                    values = delta_decode(chunk[column], chunk["train"]) / COORD_SCALE
+                    parts.setdefault(column, []).append(values[keep])
+
+    columns = ["time", "line", "unit", "train", "en_hora", *OCCUPANCY_FIELDS] + (["lat", "lon"] if positions else [])
+    empty = {"time": np.int64, "en_hora": np.int8, **{field: np.uint8 for field in OCCUPANCY_FIELDS}}
+    history = {column: np.concatenate(parts[column]) if column in parts else np.empty(0, dtype=empty.get(column, np.int32))
+               for column in columns}
+    for column, known in categories.items():
+        history[f"{column}_categories"] = np.array(list(known), dtype=object)
+    return history
+
+
+def load_history(path=HISTORY_DIR, start=None, end=None, positions=False):
+    """Llegir els trossos entre start i end (datetime) en arrays columnars.
+
+    Només s'obren els trossos que toquen l'interval (el nom diu quines hores
+    cobreix); els que queden dins d'un de fusionat se salten. Les categories
+    de línia, unitat i tren de cada tros s'unifiquen en unes de comunes. Les
+    posicions només es descodifiquen amb positions=True.
+    """
+    first = _timestamp(start) if start is not None else -np.inf
+    last = _timestamp(end) if end is not None else np.inf
+    chunks = [filename for filename in glob.glob(os.path.join(path, "*.npz"))
+              if not os.path.basename(filename).startswith(".")]
+    # Per inici i, a igual inici, el més llarg primer: un tros dins de l'anterior ja està llegit
+    chunks.sort(key=lambda filename: (_chunk_range(filename)[0], -_chunk_range(filename)[1]))
+    covered, selected = -np.inf, []
+    for filename in chunks:
+        chunk_first, chunk_last = _chunk_range(filename)
+        if chunk_last <= covered:
+            continue
+        covered = chunk_last
+        if chunk_last >= first and chunk_first <= last:
+            selected.append(filename)
+    return _read_chunks(selected, first, last, positions)
+
+
+def punctuality(history):
+    """Percentatge de trens en hora per línia i hora del dia (files amb en_hora conegut)."""
+    # Histograma (línia, hora, en_hora + 1): la columna 0 són els desconeguts
+    hour = (history["time"] // 3600) % 24
+    key = (history["line"] * 24 + hour) * 3 + (history["en_hora"] + 1)
+    size = len(history["line_categories"]) * 24
+    counts = np.bincount(key, minlength=size * 3).reshape(size, 3)
+    observations = counts[:, 1] + counts[:, 2]
+    on_time = counts[:, 2]
+    seen = np.flatnonzero(observations)
+    return pd.DataFrame({
+        "line": history["line_categories"][seen // 24],
+        "hour": seen % 24,
+        "observations": observations[seen],
+        "on_time_pct": on_time[seen] / observations[seen] * 100,
+    })
+
+
+def occupancy_by_unit(history):
+    """Ocupació mitjana (%) de cada unitat, sobre els cotxes amb dada de totes les observacions."""
+    # Histograma (unitat, valor) de cada cotxe: sense màscares ni pesos en coma flotant
+    size = len(history["unit_categories"])
+    counts = np.zeros(size * 256, dtype=np.int64)
+    for field in OCCUPANCY_FIELDS:
+        counts += np.bincount(history["unit"] * 256 + history[field], minlength=size * 256)
+    counts = counts.reshape(size, 256)[:, :101]
+    samples = counts.sum(axis=1)
+    total = counts @ np.arange(101)
+    seen = np.flatnonzero(samples)
+    return pd.DataFrame({
+        "unit": history["unit_categories"][seen],
+        "samples": samples[seen],
+        "occupancy_pct": total[seen] / samples[seen],
+    }).sort_values("occupancy_pct", ascending=False, ignore_index=True)
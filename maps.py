@@ -0,0 +1,99 @@
+import folium
+import numpy as np
+
+from geo import R
+
+TRACK_TOLERANCE_M = 5  # Tolerància per defecte de Douglas-Peucker, en metres
+TRACK_STYLE = {"color": "blue", "weight": 2, "opacity": 0.7}
+
+# ---------------------------
+# Simplificació de les vies
+# ---------------------------
+
+def douglas_peucker(xy, tolerance):
+    """Màscara dels punts que es queden en simplificar una polilínia (Douglas-Peucker).
+
+    xy són coordenades planes (en km) i tolerance és la distància màxima
+    que pot quedar entre la línia original i la simplificada.
+    """
+    keep = np.zeros(len(xy), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(xy) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last <= first + 1:
+            continue
+        segment = xy[last] - xy[first]
+        points = xy[first + 1:last] - xy[first]
+        length = np.hypot(segment[0], segment[1])
+        if length == 0:
+            distances = np.hypot(points[:, 0], points[:, 1])
+        else:
+            distances = np.abs(segment[0] * points[:, 1] - segment[1] * points[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            middle = first + 1 + farthest
+            keep[middle] = True
+            stack += [(first, middle), (middle, last)]
+    return keep
+
+
+def simplify_tracks(shapes, tolerance_m=TRACK_TOLERANCE_M):
+    """Traçats de shapes sense duplicats (els dos sentits d'una línia en són un) i simplificats."""
+    shapes = shapes.sort_values(["shape_id", "shape_pt_sequence"])
+    lat0 = np.radians(shapes["shape_pt_lat"].mean())
+
+    tracks, seen = [], set()
+    for _, group in shapes.groupby("shape_id", sort=False):
+        latlon = group[["shape_pt_lat", "shape_pt_lon"]].to_numpy(dtype=np.float64).round(6)
+        key = latlon.tobytes()
+        if key in seen or latlon[::-1].tobytes() in seen:
+            continue
+        seen.add(key)
+
+        xy = np.column_stack((R * np.radians(latlon[:, 1]) * np.cos(lat0), R * np.radians(latlon[:, 0])))
+        tracks.append(latlon[douglas_peucker(xy, tolerance_m / 1000)])
+    return tracks
+
+# ---------------------------
+# Capa estàtica de la xarxa
+# ---------------------------
+
+def build_network_layer(shapes, stops, tolerance_m=TRACK_TOLERANCE_M):
+    """Vies i estacions en GeoJSON, preparades un sol cop per versió del feed."""
+    tracks = {
+        "type": "FeatureCollection",
+        "features": [{
+            "type": "Feature",
+            "properties": {},
+            "geometry": {
+                "type": "MultiLineString",
+                # GeoJSON va en ordre (lon, lat)
+                "coordinates": [track[:, ::-1].tolist() for track in simplify_tracks(shapes, tolerance_m)],
+            },
+        }],
+    }
+    stations = {
+        "type": "FeatureCollection",
+        "features": [{
+            "type": "Feature",
+            "properties": {"popup": f"{name} (ID: {stop_id})"},
+            "geometry": {"type": "Point", "coordinates": [round(lon, 6), round(lat, 6)]},
+        } for name, stop_id, lat, lon in zip(stops["stop_name"], stops["stop_id"], stops["stop_lat"], stops["stop_lon"])],
+    }
+    return {"tracks": tracks, "stations": stations}
+
+
+def add_tracks(mapa, network):
+    """Afegir totes les vies al mapa com una sola capa."""
+    folium.GeoJson(network["tracks"], name="Vies", style_function=lambda feature: TRACK_STYLE).add_to(mapa)
+
+
+def add_stations(mapa, network):
+    """Afegir totes les estacions al mapa com una sola capa."""
+    folium.GeoJson(
+        network["stations"],
+        name="Estacions",
+        marker=folium.Marker(icon=folium.Icon(color="blue")),
+        popup=folium.GeoJsonPopup(fields=["popup"], labels=False),
+    ).add_to(mapa)
@@ -0,0 +1,227 @@
+# Temps per etapa i comptadors de l'aplicació, desactivats per defecte.
+# S'activen amb FGC_METRICS=1; el panell de depuració de l'app surt amb ?debug=<FGC_DEBUG_TOKEN>.
+# Ús del driver: python metrics.py [--reruns 20] [--format text|prometheus|jsonl]
+
+import argparse
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from time import perf_counter
+
+import numpy as np
+
+LATENCY_SAMPLES = 1024  # Últimes mesures de cada etapa que es guarden per als percentils
+PROMETHEUS_PREFIX = "fgc"
+
+# ---------------------------
+# Registre de mètriques
+# ---------------------------
+
+class _Span:
+    """Context que mesura el temps d'una etapa i l'afegeix al registre en sortir."""
+
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, perf_counter() - self.start)
+        return False
+
+
+class _NoSpan:
+    """Context buit per quan les mètriques estan desactivades (una sola instància)."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Metrics:
+    """Temps per etapa (spans) i comptadors, compartits per totes les sessions del procés.
+
+    Desactivat, span() torna sempre el mateix context buit i count() i observe()
+    surten de seguida: el cost és comprovar self.enabled. De cada etapa es guarda
+    el nombre de mesures, el total, el màxim i les últimes `samples` mesures per
+    als percentils. Els comptadors poden portar etiquetes (count("cache_hits",
+    cache="feed")).
+    """
+
+    def __init__(self, enabled=False, samples=LATENCY_SAMPLES):
+        self.enabled = enabled
+        self.samples = samples
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Buidar totes les mesures i comptadors."""
+        with self._lock:
+            self._spans = {}  # etapa -> [mesures, total, màxim, últimes mesures]
+            self._counters = {}  # (nom, etiquetes) -> valor
+
+    def span(self, name):
+        """Context que mesura una etapa: with METRICS.span("load_data"): ..."""
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name)
+
+    def observe(self, name, seconds):
+        """Afegir una mesura (en segons) a una etapa."""
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = [0, 0.0, 0.0, deque(maxlen=self.samples)]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            stats[3].append(seconds)
+
+    def count(self, name, value=1, **labels):
+        """Sumar value a un comptador (amb etiquetes opcionals)."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def snapshot(self):
+        """Estat actual: {"spans": {etapa: estadístiques en ms}, "counters": [{name, labels, value}]}."""
+        with self._lock:
+            spans = {name: (count, total, peak, np.array(recent)) for name, (count, total, peak, recent) in self._spans.items()}
+            counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self._counters.items()]
+        return {
+            "spans": {
+                name: {
+                    "count": count,
+                    "total_ms": total * 1000,
+                    "mean_ms": total / count * 1000,
+                    "p50_ms": float(np.percentile(recent, 50)) * 1000,
+                    "p95_ms": float(np.percentile(recent, 95)) * 1000,
+                    "max_ms": peak * 1000,
+                }
+                for name, (count, total, peak, recent) in spans.items()
+            },
+            "counters": sorted(counters, key=lambda counter: (counter["name"], sorted(counter["labels"].items()))),
+        }
+
+    # ---------------------------
+    # Exportació
+    # ---------------------------
+
+    def to_prometheus(self):
+        """Format de text de Prometheus: un summary per etapa i un counter per comptador."""
+        snapshot = self.snapshot()
+        lines = [f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds summary"]
+        for name, stats in sorted(snapshot["spans"].items()):
+            for quantile in ("50", "95"):
+                lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds{{stage="{name}",quantile="0.{quantile}"}} {stats[f"p{quantile}_ms"] / 1000:.6f}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_sum{{stage="{name}"}} {stats["total_ms"] / 1000:.6f}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+
+        declared = set()
+        for counter in snapshot["counters"]:
+            metric = f"{PROMETHEUS_PREFIX}_{counter['name']}_total"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            labels = ",".join(f'{key}="{value}"' for key, value in sorted(counter["labels"].items()))
+            lines.append(f"{metric}{{{labels}}} {counter['value']}" if labels else f"{metric} {counter['value']}")
+        return "\n".join(lines) + "\n"
+
+    def to_json_lines(self, at=None):
+        """Una línia JSON per etapa i per comptador, amb l'hora de l'exportació."""
+        at = (at or datetime.now()).isoformat(timespec="seconds")
+        snapshot = self.snapshot()
+        lines = [json.dumps({"time": at, "type": "stage", "name": name, **stats}) for name, stats in sorted(snapshot["spans"].items())]
+        lines += [json.dumps({"time": at, "type": "counter", **counter}) for counter in snapshot["counters"]]
+        return "\n".join(lines) + "\n"
+
+    def report(self):
+        """Informe de text: latència per etapa (de la més costosa a la que menys) i comptadors."""
+        snapshot = self.snapshot()
+        lines = [f"{'etapa':24} {'n':>6} {'mitjana':>10} {'p50':>10} {'p95':>10} {'màx':>10} {'total':>11}"]
+        for name, stats in sorted(snapshot["spans"].items(), key=lambda item: -item[1]["total_ms"]):
+            lines.append(f"{name:24} {stats['count']:6} {stats['mean_ms']:8.2f}ms {stats['p50_ms']:8.2f}ms "
+                         f"{stats['p95_ms']:8.2f}ms {stats['max_ms']:8.2f}ms {stats['total_ms']:9.1f}ms")
+        for counter in snapshot["counters"]:
+            labels = ",".join(f"{key}={value}" for key, value in sorted(counter["labels"].items()))
+            lines.append(f"{counter['name'] + (f'[{labels}]' if labels else ''):40} {counter['value']:8}")
+        return "\n".join(lines)
+
+
+METRICS = Metrics(enabled=os.environ.get("FGC_METRICS") == "1")
+
+# ---------------------------
+# Driver de reruns
+# ---------------------------
+
+# Clics de cada rerun del driver: menú principal i, si cal, submenú
+RERUN_SCRIPT = [("Buscador", "Llista"), ("Buscador", "Mapa"), ("Trajecte", None), ("Geotren", None)]
+
+
+def drive_reruns(reruns=20, app_path="app.py", timeout=60):
+    """Executar l'app sense navegador (AppTest de Streamlit) i mesurar cada rerun.
+
+    Es fan `reruns` reruns recorrent els menús de RERUN_SCRIPT; la primera
+    execució (que omple les memòries cau de recursos) es mesura a part com a
+    "first_run". Torna METRICS amb totes les mesures.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    METRICS.enabled = True
+    METRICS.reset()
+    app = AppTest.from_file(app_path, default_timeout=timeout)
+    with METRICS.span("first_run"):
+        app.run()
+
+    def click(label):
+        for button in app.button:
+            if button.label == label:
+                button.click()
+                return
+
+    for rerun in range(reruns):
+        menu, submenu = RERUN_SCRIPT[rerun % len(RERUN_SCRIPT)]
+        click(menu)
+        if submenu is not None:
+            app.run()
+            click(submenu)
+        with METRICS.span("driver_rerun"):
+            app.run()
+        if app.exception:
+            raise RuntimeError(f"L'app ha fallat al rerun {rerun}: {app.exception[0].message}")
+    return METRICS
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Informe de latència per etapa de reruns de l'app sense navegador")
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--app", default="app.py")
+    parser.add_argument("--format", choices=("text", "prometheus", "jsonl"), default="text")
+    args = parser.parse_args()
+    # L'app importa el mòdul metrics, no aquest __main__: les mesures són al seu METRICS
+    from metrics import drive_reruns
+    metrics = drive_reruns(args.reruns, args.app)
+    if args.format == "prometheus":
+        print(metrics.to_prometheus(), end="")
+    elif args.format == "jsonl":
+        print(metrics.to_json_lines(), end="")
+    else:
+        print(metrics.report())
@@ -0,0 +1,305 @@
+import threading
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from timetable import DAY, _trip_codes, time_column_seconds, valid_trip_mask
+
+TRANSFER_SECS = 120  # Temps mínim per canviar de tren a la mateixa estació
+UNREACHED = np.iinfo(np.int32).max
+
+# ---------------------------
+# Connexions (tram entre dues parades consecutives d'un viatge)
+# ---------------------------
+
+def build_connections(stop_times, trips, stops, access):
+    """Construir la taula de connexions del planificador (Connection Scan Algorithm).
+
+    Cada parella de parades consecutives d'un viatge és una connexió
+    (parada de sortida, parada d'arribada, hora de sortida, hora d'arribada,
+    viatge), en arrays ordenats per hora de sortida. Les parades són posicions
+    a stop_ids (els stop_id de stops que no falten). accessible marca les
+    estacions amb wheelchair_boarding == 1 a access. Les files de stop_times
+    sense stop_id tenen el codi -1 i no fan cap connexió: si no, totes anirien
+    a parar a la mateixa parada fantasma i s'hi podria fer transbord.
+    """
+    stop_ids = pd.Index(stops["stop_id"].dropna().astype(object))
+    stop_codes = stop_ids.get_indexer(stop_times["stop_id"].astype(object))
+    stop_codes[stop_times["stop_id"].isna().to_numpy()] = -1
+    trip_codes = _trip_codes(stop_times, trips)
+    departures = time_column_seconds(stop_times["departure_time"])
+    arrivals = time_column_seconds(stop_times["arrival_time"], fallback=departures)
+    sequence = stop_times["stop_sequence"].to_numpy()
+
+    # Files de cada viatge en ordre de parada; una connexió per cada dues files seguides
+    order = np.lexsort((sequence, trip_codes))
+    trip_codes, stop_codes = trip_codes[order], stop_codes[order]
+    departures, arrivals = departures[order], arrivals[order]
+    same_trip = (trip_codes[1:] == trip_codes[:-1]) & (trip_codes[1:] >= 0)
+    known = (stop_codes[1:] >= 0) & (stop_codes[:-1] >= 0) & (departures[:-1] >= 0)
+    first = np.flatnonzero(same_trip & known)
+
+    connections = {
+        "dep_stop": stop_codes[first].astype(np.int32),
+        "arr_stop": stop_codes[first + 1].astype(np.int32),
+        "dep_secs": departures[first],
+        "arr_secs": arrivals[first + 1],
+        "trip_code": trip_codes[first],
+    }
+    by_time = np.argsort(connections["dep_secs"], kind="stable")
+    connections = {name: values[by_time] for name, values in connections.items()}
+
+    accessible_ids = access.loc[access["wheelchair_boarding"] == 1, "stop_id"].astype(object)
+    connections.update({
+        "stop_pos": {stop_id: pos for pos, stop_id in enumerate(stop_ids)},
+        "stop_ids": stop_ids,
+        "accessible": stop_ids.isin(accessible_ids),
+        "trips": trips,
+        "by_day": {},  # Connexions de cada dia de servei, preparades per escanejar
+        "reach": {},  # Taules d'abast, per combinació de serveis (les construeix reachability)
+        "reach_lock": threading.Lock(),
+    })
+    return connections
+
+
+def _day_connections(connections, calendar, date):
+    """Connexions que circulen en una data, en llistes de Python per escanejar-les ràpid.
+
+    S'hi afegeixen els viatges del dia de servei anterior que passen de
+    mitjanit (hores >= 24:00), amb l'hora referida a la mitjanit de date.
+    Es guarden per parella de combinacions de serveis (ahir, avui): molts dies
+    comparteixen les mateixes connexions.
+    """
+    previous_trips = valid_trip_mask(calendar, date - timedelta(days=1))
+    today_trips = valid_trip_mask(calendar, date)
+    key = (previous_trips.tobytes(), today_trips.tobytes())
+    if key in connections["by_day"]:
+        return connections["by_day"][key]
+
+    trip_code = connections["trip_code"]
+    previous = np.flatnonzero(previous_trips[trip_code] & (connections["dep_secs"] >= DAY))
+    today = np.flatnonzero(today_trips[trip_code])
+    positions = np.concatenate([previous, today])
+    shift = np.repeat(np.array([-DAY, 0], dtype=np.int32), [len(previous), len(today)])
+    by_time = np.argsort(connections["dep_secs"][positions] + shift, kind="stable")
+    positions, shift = positions[by_time], shift[by_time]
+
+    day = {
+        "dep_stop": connections["dep_stop"][positions],
+        "arr_stop": connections["arr_stop"][positions],
+        "dep_secs": connections["dep_secs"][positions] + shift,
+        "arr_secs": connections["arr_secs"][positions] + shift,
+        "trip_code": connections["trip_code"][positions],
+    }
+    # Indexar llistes de Python dins del bucle és molt més ràpid que indexar arrays
+    day["lists"] = {name: values.tolist() for name, values in day.items()}
+    connections["by_day"][key] = day
+    return day
+
+# ---------------------------
+# Cerca de trajectes
+# ---------------------------
+
+def _scan(day, origin, destination, depart_secs, accessible, transfer_secs):
+    """Connection scan: arribada més d'hora a destination sortint d'origin a partir de depart_secs.
+
+    ready[parada] és l'hora a partir de la qual es pot agafar un tren a la parada
+    (arribada + transbord), i boarded[viatge] la connexió on s'hi ha pujat. Torna
+    les parelles (connexió de pujada, connexió de baixada) de cada tram, o None.
+    """
+    lists = day["lists"]
+    dep_stop, arr_stop = lists["dep_stop"], lists["arr_stop"]
+    dep_secs, arr_secs, trip_code = lists["dep_secs"], lists["arr_secs"], lists["trip_code"]
+
+    ready = {origin: depart_secs}
+    arrival = {}
+    boarded = {}
+    reached_by = {}
+    best = UNREACHED
+
+    start = int(np.searchsorted(day["dep_secs"], depart_secs, side="left"))
+    for c in range(start, len(dep_secs)):
+        dep = dep_secs[c]
+        if dep >= best:
+            break
+        trip = trip_code[c]
+        if trip not in boarded:
+            stop = dep_stop[c]
+            if ready.get(stop, UNREACHED) > dep or (accessible is not None and not accessible[stop]):
+                continue
+            boarded[trip] = c
+        arr, stop = arr_secs[c], arr_stop[c]
+        if arr < arrival.get(stop, UNREACHED) and (accessible is None or accessible[stop]):
+            arrival[stop] = arr
+            reached_by[stop] = (boarded[trip], c)
+            if stop == destination:
+                best = arr
+            elif arr + transfer_secs < ready.get(stop, UNREACHED):
+                ready[stop] = arr + transfer_secs
+
+    if destination not in reached_by:
+        return None
+    legs, stop = [], destination
+    while stop != origin:
+        enter, alight = reached_by[stop]
+        legs.append((enter, alight))
+        stop = dep_stop[enter]
+    return legs[::-1]
+
+
+def plan_journey(connections, calendar, origin_id, destination_id, date, depart_secs, wheelchair=False, transfer_secs=TRANSFER_SECS):
+    """Trajecte que arriba abans a destination_id sortint d'origin_id a partir de depart_secs.
+
+    depart_secs són segons des de la mitjanit de date. Amb wheelchair=True només
+    es puja i es baixa del tren a estacions accessibles (wheelchair_boarding == 1).
+    Torna un tram per fila (trip_id, route_id, trip_headsign, from_stop_id,
+    to_stop_id, departure_secs, arrival_secs); buit si no hi ha cap trajecte.
+    """
+    legs = pd.DataFrame(columns=["trip_id", "route_id", "trip_headsign", "from_stop_id", "to_stop_id", "departure_secs", "arrival_secs"])
+    origin = connections["stop_pos"].get(origin_id)
+    destination = connections["stop_pos"].get(destination_id)
+    if origin is None or destination is None or origin == destination:
+        return legs
+    accessible = connections["accessible"].tolist() if wheelchair else None
+    if accessible is not None and not (accessible[origin] and accessible[destination]):
+        return legs
+
+    day = _day_connections(connections, calendar, date)
+    found = _scan(day, origin, destination, depart_secs, accessible, transfer_secs)
+    if found is None:
+        return legs
+
+    enter, alight = (np.array(part) for part in zip(*found))
+    trips = connections["trips"].iloc[day["trip_code"][enter]]
+    return pd.DataFrame({
+        "trip_id": trips["trip_id"].astype(object).to_numpy(),
+        "route_id": trips["route_id"].astype(object).to_numpy(),
+        "trip_headsign": trips["trip_headsign"].astype(object).to_numpy(),
+        "from_stop_id": connections["stop_ids"][day["dep_stop"][enter]],
+        "to_stop_id": connections["stop_ids"][day["arr_stop"][alight]],
+        "departure_secs": day["dep_secs"][enter],
+        "arrival_secs": day["arr_secs"][alight],
+    })
+
+# ---------------------------
+# Taules d'abast (isòcrones)
+# ---------------------------
+
+REACH_BUCKET_SECS = 15 * 60  # Franges de sortida de les taules d'abast
+REACH_HORIZON_SECS = 3 * 3600  # Durada màxima dels trajectes que es tenen en compte
+REACH_UNREACHED = np.iinfo(np.uint16).max
+
+
+def _reach_lists(day):
+    """Connexions d'un dia en llistes, amb els viatges numerats de 0 a n per a la matriu boarded."""
+    trips, trip_slot = np.unique(day["trip_code"], return_inverse=True)
+    return {
+        "n_trips": len(trips),
+        "dep_secs": day["dep_secs"],
+        "lists": (day["dep_stop"].tolist(), day["arr_stop"].tolist(), day["dep_secs"].tolist(),
+                  day["arr_secs"].tolist(), trip_slot.tolist()),
+    }
+
+
+def _reach_scan(day, start, n_stops, accessible, horizon_secs, transfer_secs):
+    """Connection scan des de totes les estacions alhora, sortint a start: arrival[parada, origen] en segons."""
+    dep_stop, arr_stop, dep_secs, arr_secs, trip_slot = day["lists"]
+    accessible_list = accessible.tolist()
+    origins = np.arange(n_stops)
+    never = np.int64(UNREACHED)
+    # Files: parada; columnes: origen (cada fila és contigua per actualitzar-la d'un cop)
+    ready = np.full((n_stops, n_stops), never)
+    ready[origins, origins] = np.where(accessible, start, never)
+    arrival = ready.copy()
+    boarded = np.zeros((day["n_trips"], n_stops), dtype=bool)
+
+    first = int(np.searchsorted(day["dep_secs"], start, side="left"))
+    last = int(np.searchsorted(day["dep_secs"], start + horizon_secs, side="right"))
+    for c in range(first, last):
+        trip, stop = trip_slot[c], dep_stop[c]
+        on = boarded[trip]
+        if accessible_list[stop]:
+            on = on | (ready[stop] <= dep_secs[c])
+        if not on.any():
+            continue
+        boarded[trip] = on
+        stop = arr_stop[c]
+        if accessible_list[stop]:
+            arrived = np.where(on, arr_secs[c], never)
+            np.minimum(arrival[stop], arrived, out=arrival[stop])
+            np.minimum(ready[stop], arrived + transfer_secs, out=ready[stop])
+    return arrival
+
+
+def build_reachability(connections, calendar, date, wheelchair=False, bucket_secs=REACH_BUCKET_SECS,
+                       horizon_secs=REACH_HORIZON_SECS, transfer_secs=TRANSFER_SECS):
+    """Arribada més d'hora a cada estació des de cada estació, per franges de sortida d'un dia.
+
+    Per cada franja (sortint a l'hora d'inici de la franja, de 00:00 a 24:00,
+    totes dues incloses) es fa un sol connection scan per a totes les estacions
+    d'origen alhora, amb un vector per parada en lloc d'un valor. La franja de
+    les 24:00 és la de les 00:00 de l'endemà, amb els primers trens del dia
+    següent. Les connexions que surten més tard de l'horitzó no s'escanegen.
+    minutes[franja, origen, parada] és el minut (des de la mitjanit de date,
+    arrodonit amunt) d'arribada, o REACH_UNREACHED; uint16 perquè les taules
+    d'un dia ocupin poc.
+    """
+    n_stops = len(connections["stop_ids"])
+    accessible = connections["accessible"] if wheelchair else np.ones(n_stops, dtype=bool)
+    today = _reach_lists(_day_connections(connections, calendar, date))
+    next_day = _reach_lists(_day_connections(connections, calendar, date + timedelta(days=1)))
+
+    starts = np.arange(0, DAY + 1, bucket_secs)
+    minutes = np.full((len(starts), n_stops, n_stops), REACH_UNREACHED, dtype=np.uint16)
+    for bucket, start in enumerate(starts.tolist()):
+        offset = DAY if start >= DAY else 0
+        arrival = _reach_scan(next_day if offset else today, start - offset, n_stops, accessible, horizon_secs, transfer_secs).T
+        reached = arrival < UNREACHED
+        minutes[bucket][reached] = -(-(arrival[reached] + offset) // 60)
+    return {
+        "date": date,
+        "bucket_secs": bucket_secs,
+        "horizon_secs": horizon_secs,
+        "stop_ids": connections["stop_ids"],
+        "minutes": minutes,
+    }
+
+
+def reachability(connections, calendar, date, wheelchair=False):
+    """Taula d'abast d'un dia, construïda la primera vegada i reutilitzada després.
+
+    Es guarda per combinació de serveis (ahir, avui i demà, com
+    _day_connections), de manera que els dies amb els mateixos trens
+    comparteixen la taula. Es construeix amb el lock de connections: les
+    sessions que la demanen alhora esperen la primera en lloc de repetir-la.
+    """
+    key = tuple(valid_trip_mask(calendar, date + timedelta(days=days)).tobytes() for days in (-1, 0, 1)) + (wheelchair,)
+    tables = connections["reach"]
+    table = tables.get(key)
+    if table is None:
+        with connections["reach_lock"]:
+            table = tables.get(key)
+            if table is None:
+                table = tables[key] = build_reachability(connections, calendar, date, wheelchair)
+    return table
+
+
+def reachable_within(table, origin_id, depart_secs, max_minutes):
+    """Minuts de viatge des d'origin_id fins a cada estació, sortint a depart_secs.
+
+    Es fa servir la franja que comença just a depart_secs o després (com si
+    s'esperés a l'estació fins llavors) i, a dins, una sola fila de la taula;
+    passades les 23:45 és la de les 24:00, amb els trens de l'endemà. Torna un
+    array de minuts per parada (en l'ordre de table["stop_ids"]) amb -1 a les
+    que no s'hi arriba en max_minutes.
+    """
+    origin = table["stop_ids"].get_loc(origin_id)
+    bucket = -(-depart_secs // table["bucket_secs"])
+    travel = np.full(len(table["stop_ids"]), -1, dtype=np.int32)
+    if bucket >= len(table["minutes"]):
+        return travel
+    arrival = table["minutes"][bucket, origin].astype(np.int32)
+    within = (arrival != REACH_UNREACHED) & (arrival - depart_secs // 60 <= max_minutes)
+    travel[within] = arrival[within] - depart_secs // 60
+    return travel
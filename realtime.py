@@ -0,0 +1,200 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import METRICS
+
+API_URL = "https://dadesobertes.fgc.cat/api/explore/v2.1/catalog/datasets/posicionament-dels-trens/records"
+PAGE_SIZE = 100  # Màxim de registres per pàgina que accepta l'API
+OCCUPANCY_FIELDS = ["ocupacio_mi_percent", "ocupacio_ri_percent", "ocupacio_m1_percent", "ocupacio_m2_percent"]
+
+# ---------------------------
+# Posicions dels trens en temps real
+# ---------------------------
+
+def index_positions(records, fetched_at=None):
+    """Indexar una instantània de posicions per id de tren i per línia.
+
+    live és una taula per id amb en_hora i l'ocupació (mitjana dels cotxes), per
+    afegir l'estat en temps real a tot un tauler de sortides amb un sol join.
+    fetched_at és l'hora (de rellotge) en què es va obtenir, per defecte ara.
+    """
+    by_id = {registre["id"]: registre for registre in records if "id" in registre}
+    by_line = {}
+    for registre in by_id.values():
+        by_line.setdefault(registre.get("lin", "Desconegut"), []).append(registre)
+
+    live = pd.DataFrame.from_records(list(by_id.values()), columns=["id", "en_hora", *OCCUPANCY_FIELDS])
+    occupancy = live[OCCUPANCY_FIELDS].apply(pd.to_numeric, errors="coerce")
+    live = pd.DataFrame({"en_hora": live["en_hora"].to_numpy(), "ocupacio": occupancy.mean(axis=1).round().to_numpy()}, index=live["id"])
+
+    return {"results": list(by_id.values()), "by_id": by_id, "by_line": by_line, "live": live,
+            "fetched_at": fetched_at or datetime.now()}
+
+
+class TrainPositionsFeed:
+    """Posicions dels trens compartides per totes les sessions del procés.
+
+    Les sessions llegeixen la mateixa instantània en memòria. Un fil de fons la
+    renova abans que caduqui (ttl, en segons), de manera que amb N usuaris
+    l'API només rep una tanda de peticions per interval. Si el fil no corre, la
+    primera sessió que troba les dades caducades les renova i les altres es
+    queden amb les anteriors sense esperar-la; només esperen si encara no n'hi
+    ha cap. Quan l'API falla, durant failure_backoff segons (per defecte el ttl)
+    no s'hi torna a demanar res i es serveixen les dades antigues.
+    Cada instantània inclou totes les pàgines de l'API, indexades amb index_positions.
+    Amb un recorder (history.SnapshotRecorder), cada instantània nova s'hi desa
+    un cop alliberat el lock, perquè escriure l'històric no faci esperar ningú.
+    """
+
+    def __init__(self, url=API_URL, ttl=15, timeout=(3.05, 10), retries=3, backoff=0.5, idle_after=300, workers=4,
+                 recorder=None, failure_backoff=None):
+        self.url = url
+        self.recorder = recorder
+        self.workers = workers
+        self.ttl = ttl
+        self.failure_backoff = ttl if failure_backoff is None else failure_backoff
+        self.timeout = timeout
+        self.idle_after = idle_after  # Sense lectures durant aquests segons, el fil de fons no demana res
+
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.requests_made = 0
+        self._lock = threading.Lock()
+        self._data = None
+        self._fetched_at = 0.0
+        self._failed_at = -float("inf")
+        self._last_error = None
+        self._last_read = time.monotonic()
+        self._stop = threading.Event()
+        self._poller = None
+
+    def _fetch_page(self, offset):
+        params = {"dataset": "posicionament-dels-trens", "limit": PAGE_SIZE, "offset": offset}
+        METRICS.count("api_requests")
+        try:
+            resposta = self.session.get(self.url, params=params, timeout=self.timeout)
+            resposta.raise_for_status()
+        except requests.RequestException:
+            METRICS.count("api_errors")
+            raise
+        return resposta.json()
+
+    def _fetch(self):
+        """Demanar totes les pàgines: la primera diu quantes n'hi ha i la resta van en paral·lel."""
+        with METRICS.span("api_fetch"):
+            first = self._fetch_page(0)
+            records = list(first.get("results", []))
+            offsets = range(PAGE_SIZE, first.get("total_count", len(records)), PAGE_SIZE)
+            self.requests_made += 1 + len(offsets)
+
+            if offsets:
+                with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                    for page in pool.map(self._fetch_page, offsets):
+                        records.extend(page.get("results", []))
+            return index_positions(records, datetime.now())
+
+    def age(self):
+        """Segons des de l'última instantània (infinit si encara no n'hi ha cap)."""
+        return time.monotonic() - self._fetched_at if self._data is not None else float("inf")
+
+    def failing(self):
+        """Si l'última petició a l'API ha fallat fa menys de failure_backoff segons."""
+        return time.monotonic() - self._failed_at < self.failure_backoff
+
+    def _record(self, data):
+        """Desar una instantània nova a l'històric, ja sense el lock (comprimir un tros no atura els lectors)."""
+        if self.recorder is not None:
+            with METRICS.span("history_record"):
+                self.recorder.record(data["results"], data["fetched_at"])
+
+    def _refresh_locked(self):
+        """Demanar una instantània nova amb el lock ja agafat; si falla, es recorda quan."""
+        try:
+            data = self._fetch()
+        except requests.RequestException as error:
+            self._failed_at, self._last_error = time.monotonic(), error
+            raise
+        self._data, self._fetched_at = data, time.monotonic()
+        return data
+
+    def refresh(self):
+        """Demanar una instantània nova a l'API, un sol fil alhora."""
+        with self._lock:
+            data = self._refresh_locked()
+        self._record(data)
+        return data
+
+    def get(self):
+        """Última instantània; només es torna a demanar a l'API si té més de ttl segons.
+
+        Si ja hi ha dades, no s'espera mai ningú: si un altre fil les està
+        renovant, o l'API ha fallat fa poc, o falla ara, es tornen les antigues
+        (consulteu age()). Sense dades, els errors de l'API es propaguen.
+        """
+        self._last_read = time.monotonic()
+        if self.age() < self.ttl:
+            METRICS.count("cache_hits", cache="train_positions")
+            return self._data
+
+        if self._data is not None:
+            if self.failing() or not self._lock.acquire(blocking=False):
+                METRICS.count("stale_reads", cache="train_positions")
+                return self._data
+            try:
+                METRICS.count("cache_misses", cache="train_positions")
+                data = self._refresh_locked()
+            except requests.RequestException:
+                return self._data
+            finally:
+                self._lock.release()
+            self._record(data)
+            return data
+
+        # Encara no hi ha dades: la primera lectura demana l'API i les altres l'esperen
+        with self._lock:
+            if self._data is not None:
+                METRICS.count("cache_hits", cache="train_positions")
+                return self._data
+            if self.failing():
+                raise requests.RequestException(f"L'API ha fallat fa menys de {self.failure_backoff} s") from self._last_error
+            METRICS.count("cache_misses", cache="train_positions")
+            data = self._refresh_locked()
+        self._record(data)
+        return data
+
+    def start(self):
+        """Engegar el fil de fons que renova les dades (si no està ja engegat)."""
+        if self._poller is not None and self._poller.is_alive():
+            return
+        self._stop.clear()
+        self._poller = threading.Thread(target=self._poll, name="train-positions-poller", daemon=True)
+        self._poller.start()
+
+    def stop(self):
+        """Aturar el fil de fons."""
+        self._stop.set()
+        if self._poller is not None:
+            self._poller.join()
+
+    def _poll(self):
+        # Renovem al 80% del ttl perquè els lectors no trobin mai dades caducades
+        while not self._stop.wait(max(self.ttl * 0.8 - self.age(), 0.1)):
+            if time.monotonic() - self._last_read > self.idle_after:
+                self._stop.wait(self.ttl)
+                continue
+            try:
+                self.refresh()
+            except requests.RequestException:
+                # L'API no respon: ho tornem a provar passat el failure_backoff
+                self._stop.wait(self.failure_backoff)
@@ -0,0 +1,147 @@
+import re
+import unicodedata
+
+import numpy as np
+
+UNKNOWN = -1  # wheelchair_boarding i wc de les estacions que no surten a access.csv
+FUZZY_MIN_SCORE = 0.5  # Fracció mínima dels trigrames de la consulta que ha de tenir un resultat aproximat
+
+# ---------------------------
+# Normalització de noms
+# ---------------------------
+
+def normalize(text):
+    """Minúscules, sense accents ni signes: "Plaça Catalunya" -> "placa catalunya"."""
+    text = unicodedata.normalize("NFKD", str(text)).lower()
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def _trigrams(text):
+    """Trigrames de cada paraula, amb un espai davant perquè pesi més el començament."""
+    grams = set()
+    for token in text.split():
+        token = f" {token} "
+        grams.update(token[i:i + 3] for i in range(len(token) - 2))
+    return grams
+
+# ---------------------------
+# Índex d'estacions
+# ---------------------------
+
+def build_station_index(stops, access):
+    """Construir l'índex de cerca d'estacions un sol cop.
+
+    Cada paraula normalitzada dels noms va a un array ordenat (amb l'estació
+    d'on surt), de manera que les estacions amb una paraula que comença per un
+    prefix són un tram que es troba amb una cerca binària. Per als errors
+    d'escriptura hi ha un índex invertit de trigrames. wheelchair_boarding i
+    wc surten d'access.csv, alineats amb les estacions.
+    """
+    stops = stops[stops["stop_id"].notna()]
+    stop_ids = stops["stop_id"].astype(object).to_numpy()
+    names = stops["stop_name"].astype(object).to_numpy()
+    normalized = [normalize(name) for name in names]
+
+    tokens, token_station = [], []
+    trigrams = {}
+    for pos, name in enumerate(normalized):
+        for token in name.split():
+            tokens.append(token)
+            token_station.append(pos)
+        for gram in _trigrams(name):
+            trigrams.setdefault(gram, []).append(pos)
+    tokens = np.array(tokens, dtype=str)
+    order = np.argsort(tokens, kind="stable")
+
+    access = access[access["stop_id"].notna()].drop_duplicates("stop_id")
+    access = access.set_index(access["stop_id"].astype(object))
+    wheelchair = access["wheelchair_boarding"].reindex(stop_ids)
+    wc = access["wc"].reindex(stop_ids)
+    return {
+        "stop_ids": stop_ids,
+        "names": names,
+        "stop_pos": {stop_id: pos for pos, stop_id in enumerate(stop_ids)},
+        "tokens": tokens[order],
+        "token_station": np.array(token_station, dtype=np.int32)[order],
+        "trigrams": {gram: np.array(positions, dtype=np.int32) for gram, positions in trigrams.items()},
+        "name_lengths": np.array([len(name) for name in normalized], dtype=np.int32),
+        "starts": np.array([name[:8] for name in normalized], dtype=str),
+        "wheelchair_boarding": wheelchair.fillna(UNKNOWN).to_numpy(dtype=np.int8),
+        "wc": wc.fillna(UNKNOWN).to_numpy(dtype=np.int8),
+    }
+
+
+def station(index, stop_id):
+    """Nom i accessibilitat d'una estació pel seu stop_id, o None si no hi és."""
+    pos = index["stop_pos"].get(stop_id)
+    if pos is None:
+        return None
+    return {
+        "stop_id": stop_id,
+        "stop_name": index["names"][pos],
+        "wheelchair_boarding": int(index["wheelchair_boarding"][pos]),
+        "wc": int(index["wc"][pos]),
+    }
+
+
+def _filter_mask(index, wheelchair, min_wc):
+    mask = np.ones(len(index["stop_ids"]), dtype=bool)
+    if wheelchair:
+        mask &= index["wheelchair_boarding"] == 1
+    if min_wc is not None:
+        mask &= index["wc"] >= min_wc
+    return mask
+
+
+def _prefix_matches(index, token):
+    """Estacions amb alguna paraula que comença per token (cerca binària a tokens)."""
+    lo = np.searchsorted(index["tokens"], token, side="left")
+    hi = np.searchsorted(index["tokens"], token + "\U0010ffff", side="left")
+    return np.unique(index["token_station"][lo:hi])
+
+
+def _fuzzy_matches(index, query):
+    """Estacions per fracció dels trigrames de query que tenen al nom, de més a menys (a igualtat, nom més curt)."""
+    grams = _trigrams(query)
+    postings = [index["trigrams"][gram] for gram in grams if gram in index["trigrams"]]
+    if not postings:
+        return np.empty(0, dtype=np.int32)
+    shared = np.bincount(np.concatenate(postings), minlength=len(index["stop_ids"]))
+    candidates = np.flatnonzero(shared)
+    score = shared[candidates] / len(grams)
+    keep = score >= FUZZY_MIN_SCORE
+    candidates, score = candidates[keep], score[keep]
+    return candidates[np.lexsort((index["name_lengths"][candidates], -score))]
+
+
+def search_stations(index, query, limit=10, wheelchair=False, min_wc=None):
+    """Posicions (a l'índex) de les estacions que coincideixen amb query, les millors primer.
+
+    Primer es busquen les estacions on cada paraula de la consulta és el
+    començament d'alguna paraula del nom ("placa cat" troba "Barcelona - Plaça
+    Catalunya"), sense accents ni majúscules; les que comencen per la consulta
+    van davant. Si no n'hi ha prou, s'hi afegeixen les més semblants per
+    trigrames (errors d'escriptura). wheelchair=True deixa només les estacions
+    amb wheelchair_boarding == 1, i min_wc les que tenen wc >= min_wc. Amb una
+    consulta buida es tornen totes les estacions que passen els filtres.
+    """
+    allowed = _filter_mask(index, wheelchair, min_wc)
+    query = normalize(query)
+    if not query:
+        return np.flatnonzero(allowed)[:limit]
+
+    matches = None
+    for token in query.split():
+        found = _prefix_matches(index, token)
+        matches = found if matches is None else np.intersect1d(matches, found, assume_unique=True)
+    matches = matches[allowed[matches]]
+    # Primer les que comencen per la consulta, després les de nom més curt
+    starts = np.char.startswith(index["starts"][matches], query[:8])
+    matches = matches[np.lexsort((index["name_lengths"][matches], ~starts))]
+
+    if limit is None or len(matches) < limit:
+        fuzzy = _fuzzy_matches(index, query)
+        fuzzy = fuzzy[allowed[fuzzy] & ~np.isin(fuzzy, matches)]
+        matches = np.concatenate([matches, fuzzy])
+    return matches[:limit]
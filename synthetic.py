@@ -0,0 +1,224 @@
+# Generador de feeds GTFS sintètics amb l'esquema que llegeix feed.load_feed.
+# Ús: python synthetic.py DIRECTORI [--scale 10] [--stops N] [--lines N] [--trips-per-day N]
+
+import argparse
+import os
+from datetime import date as Date, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Mida del feed real de FGC: scale=1 genera un feed d'aquesta mida
+FGC_STOPS = 104
+FGC_LINES = 20
+FGC_TRIPS_PER_DAY = 1800
+
+DAY_TYPES = {"LA": 1.0, "DS": 0.6, "FE": 0.5}  # Laborable, dissabte i festiu: fracció dels viatges d'un laborable
+SHAPE_POINTS_PER_HOP = 8  # Punts de la shape entre dues parades seguides
+BBOX = (41.2, 41.8, 1.6, 2.4)  # lat_min, lat_max, lon_min, lon_max (àrea de FGC)
+FIRST_DEPARTURE = 5 * 3600
+LAST_DEPARTURE = 25 * 3600  # Els últims trens surten passada la mitjanit (hores GTFS de 24:xx)
+
+# ---------------------------
+# Xarxa: parades, línies i recorreguts
+# ---------------------------
+
+def _stops(n_stops, rng):
+    stop_ids = np.array([f"S{i:05d}" for i in range(n_stops)], dtype=object)
+    return pd.DataFrame({
+        "stop_lat": rng.uniform(BBOX[0], BBOX[1], n_stops).round(8),
+        "stop_lon": rng.uniform(BBOX[2], BBOX[3], n_stops).round(8),
+        "stop_name": [f"Estació {i}" for i in range(n_stops)],
+        "stop_id": stop_ids,
+        "wheelchair_boarding": (rng.random(n_stops) < 0.7).astype(int),
+    })
+
+
+def _line_patterns(stops, n_lines, rng, min_stops=6, max_stops=20):
+    """Parades de cada línia, ordenades al llarg d'una direcció a l'atzar perquè el traçat sigui plausible."""
+    lat = stops["stop_lat"].to_numpy()
+    lon = stops["stop_lon"].to_numpy()
+    patterns = []
+    for _ in range(n_lines):
+        size = int(rng.integers(min_stops, min(max_stops, len(stops)) + 1))
+        # Parades a prop d'un centre a l'atzar, en ordre al llarg d'un angle
+        center = rng.integers(len(stops))
+        nearest = np.argsort((lat - lat[center]) ** 2 + (lon - lon[center]) ** 2)[:size * 3]
+        chosen = rng.choice(nearest, size=size, replace=False)
+        angle = rng.uniform(0, np.pi)
+        patterns.append(chosen[np.argsort(lat[chosen] * np.sin(angle) + lon[chosen] * np.cos(angle))])
+    return patterns
+
+
+def _routes(stops, patterns, rng):
+    names = stops["stop_name"].to_numpy()
+    colors = rng.integers(0, 0xFFFFFF, len(patterns))
+    return pd.DataFrame({
+        "route_id": [f"L{line}" for line in range(len(patterns))],
+        "route_short_name": [f"L{line}" for line in range(len(patterns))],
+        # "Origen - Destí": build_trip_vias treu la via del segon extrem
+        "route_long_name": [f"{names[pattern[0]]} - {names[pattern[-1]]}" for pattern in patterns],
+        "route_type": 1,
+        "route_url": "",
+        "route_color": [f"{color:06X}" for color in colors],
+        "route_text_color": "FFFFFF",
+    })
+
+
+def _shape_id(line, direction):
+    return 100000 * (direction + 1) + line
+
+
+def _shapes(stops, patterns):
+    """Una shape per línia i sentit: la recta entre parades, amb SHAPE_POINTS_PER_HOP punts per tram."""
+    lat = stops["stop_lat"].to_numpy()
+    lon = stops["stop_lon"].to_numpy()
+    step = np.linspace(0, 1, SHAPE_POINTS_PER_HOP, endpoint=False)
+    frames = []
+    for line, pattern in enumerate(patterns):
+        for direction, ordered in enumerate((pattern, pattern[::-1])):
+            a, b = ordered[:-1], ordered[1:]
+            points_lat = np.append((lat[a][:, None] + (lat[b] - lat[a])[:, None] * step).ravel(), lat[ordered[-1]])
+            points_lon = np.append((lon[a][:, None] + (lon[b] - lon[a])[:, None] * step).ravel(), lon[ordered[-1]])
+            frames.append(pd.DataFrame({
+                "shape_id": _shape_id(line, direction),
+                "shape_pt_lat": points_lat.round(6),
+                "shape_pt_lon": points_lon.round(6),
+                "shape_pt_sequence": np.arange(len(points_lat)),
+            }))
+    return pd.concat(frames, ignore_index=True)
+
+# ---------------------------
+# Calendari i viatges
+# ---------------------------
+
+def _calendar_dates(start, days, periods):
+    """Un servei per període i tipus de dia; cada data del feed en té exactament un."""
+    dates = [start + timedelta(days=day) for day in range(days)]
+    period = np.minimum(np.arange(days) * periods // days, periods - 1)
+    day_type = ["FE" if day.weekday() == 6 else "DS" if day.weekday() == 5 else "LA" for day in dates]
+    return pd.DataFrame({
+        "service_id": [f"P{p}{kind}" for p, kind in zip(period, day_type)],
+        "date": [int(day.strftime("%Y%m%d")) for day in dates],
+        "exception_type": 1,
+    })
+
+
+def _trips_and_stop_times(stops, patterns, periods, trips_per_day, rng):
+    """Viatges de cada servei, repartits entre línies i sentits, i els seus horaris.
+
+    Cada línia té un temps fix entre parades (2-4 minuts) i 20 segons d'aturada,
+    i les sortides es reparteixen entre FIRST_DEPARTURE i LAST_DEPARTURE.
+    Torna trips i una llista de trossos de stop_times (un per servei).
+    """
+    names = stops["stop_name"].to_numpy()
+    stop_ids = stops["stop_id"].to_numpy()
+    hops = [np.concatenate(([0], rng.integers(120, 240, len(pattern) - 1))) for pattern in patterns]
+    trips, stop_times = [], []
+    for period in range(periods):
+        for kind, fraction in DAY_TYPES.items():
+            service_id = f"P{period}{kind}"
+            per_direction = max(1, round(trips_per_day * fraction / (2 * len(patterns))))
+            service_trips, service_times = [], []
+            for line, pattern in enumerate(patterns):
+                for direction, ordered in enumerate((pattern, pattern[::-1])):
+                    hop = hops[line] if direction == 0 else np.concatenate(([0], hops[line][1:][::-1]))
+                    starts = np.linspace(FIRST_DEPARTURE, LAST_DEPARTURE, per_direction).astype(np.int64) + int(rng.integers(0, 300))
+                    trip_ids = [f"{service_id}|{line}|{direction}|{k}" for k in range(per_direction)]
+                    service_trips.append(pd.DataFrame({
+                        "route_id": f"L{line}",
+                        "service_id": service_id,
+                        "trip_id": trip_ids,
+                        "trip_headsign": names[ordered[-1]],
+                        "shape_id": _shape_id(line, direction),
+                    }))
+                    arrivals = starts[:, None] + np.cumsum(hop)[None, :] + 20 * np.arange(len(ordered))[None, :]
+                    service_times.append((np.repeat(trip_ids, len(ordered)), arrivals.ravel(),
+                                          np.tile(stop_ids[ordered], per_direction), np.tile(np.arange(1, len(ordered) + 1), per_direction)))
+            trips.extend(service_trips)
+            stop_times.append(service_times)
+    return pd.concat(trips, ignore_index=True), stop_times
+
+
+def _format_times(seconds):
+    hours, rest = np.divmod(seconds, 3600)
+    minutes, secs = np.divmod(rest, 60)
+    return pd.Series(hours).astype(str).str.zfill(2) + ":" + pd.Series(minutes).astype(str).str.zfill(2) + ":" + pd.Series(secs).astype(str).str.zfill(2)
+
+# ---------------------------
+# Feed complet
+# ---------------------------
+
+def write_feed(path, n_stops=FGC_STOPS, n_lines=FGC_LINES, trips_per_day=FGC_TRIPS_PER_DAY,
+               periods=4, start=Date(2025, 1, 1), days=365, seed=0):
+    """Escriure a path un GTFS sintètic amb totes les taules de feed.FEED_TABLES.
+
+    La mida la donen n_stops, n_lines i trips_per_day (viatges d'un dia
+    laborable; dissabtes i festius en tenen menys, segons DAY_TYPES). L'any es
+    divideix en `periods` períodes amb serveis propis, com els canvis d'horari
+    del feed real. stop_times s'escriu servei a servei. Torna un resum de la mida.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+    stops = _stops(n_stops, rng)
+    patterns = _line_patterns(stops, n_lines, rng)
+    routes = _routes(stops, patterns, rng)
+    trips, stop_times = _trips_and_stop_times(stops, patterns, periods, trips_per_day, rng)
+    calendar_dates = _calendar_dates(start, days, periods)
+    end = start + timedelta(days=days - 1)
+
+    stops.to_csv(os.path.join(path, "stops.txt"), index=False)
+    routes.to_csv(os.path.join(path, "routes.txt"), index=False)
+    trips.to_csv(os.path.join(path, "trips.txt"), index=False)
+    calendar_dates.to_csv(os.path.join(path, "calendar_dates.txt"), index=False)
+    _shapes(stops, patterns).to_csv(os.path.join(path, "shapes.txt"), index=False)
+    pd.DataFrame({
+        "stop_name": stops["stop_name"],
+        "stop_id": stops["stop_id"],
+        "wheelchair_boarding": stops["wheelchair_boarding"],
+        "wc": rng.integers(-1, 4, n_stops),
+    }).to_csv(os.path.join(path, "access.csv"), index=False)
+    pd.DataFrame({
+        "feed_publisher_name": ["Sintètic"],
+        "feed_publisher_url": ["https://www.fgc.cat"],
+        "feed_lang": ["ca"],
+        "feed_version": [f"synthetic-{n_stops}-{n_lines}-{trips_per_day}-{periods}-{seed}"],
+        "feed_start_date": [int(start.strftime("%Y%m%d"))],
+        "feed_end_date": [int(end.strftime("%Y%m%d"))],
+    }).to_csv(os.path.join(path, "feed_info.txt"), index=False)
+    pd.DataFrame({"agency_name": ["Sintètic"], "agency_url": ["https://www.fgc.cat"], "agency_timezone": ["Europe/Madrid"],
+                  "agency_lang": ["ca"]}).to_csv(os.path.join(path, "agency.txt"), index=False)
+
+    stop_times_path = os.path.join(path, "stop_times.txt")
+    n_stop_times = 0
+    for i, service_times in enumerate(stop_times):
+        trip_ids, seconds, stop_ids, sequence = (np.concatenate(parts) for parts in zip(*service_times))
+        arrivals = _format_times(seconds)
+        pd.DataFrame({
+            "trip_id": trip_ids,
+            "arrival_time": arrivals,
+            "departure_time": _format_times(seconds + 20),
+            "stop_id": stop_ids,
+            "stop_sequence": sequence,
+        }).to_csv(stop_times_path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+        n_stop_times += len(trip_ids)
+    return {"stops": n_stops, "lines": n_lines, "trips": len(trips), "stop_times": n_stop_times}
+
+
+def write_scaled_feed(path, scale=1, seed=0):
+    """GTFS sintètic scale vegades la mida de FGC (parades, línies i viatges per dia)."""
+    return write_feed(path, FGC_STOPS * scale, FGC_LINES * scale, FGC_TRIPS_PER_DAY * scale, seed=seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generar un GTFS sintètic")
+    parser.add_argument("path", help="Directori on s'escriu el feed")
+    parser.add_argument("--scale", type=int, default=1, help="Múltiple de la mida de FGC")
+    parser.add_argument("--stops", type=int, help="Parades (per defecte, les de FGC x scale)")
+    parser.add_argument("--lines", type=int, help="Línies (per defecte, les de FGC x scale)")
+    parser.add_argument("--trips-per-day", type=int, help="Viatges d'un dia laborable (per defecte, els de FGC x scale)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    size = write_feed(args.path, args.stops or FGC_STOPS * args.scale, args.lines or FGC_LINES * args.scale,
+                      args.trips_per_day or FGC_TRIPS_PER_DAY * args.scale, seed=args.seed)
+    print(", ".join(f"{count} {name}" for name, count in size.items()))
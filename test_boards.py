@@ -0,0 +1,77 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import feed
+from boards import boards_to_json, departure_boards
+from synthetic import write_feed
+from timetable import DAY, build_calendar_index, build_departure_index, build_trip_vias
+
+WEDNESDAY = date(2025, 1, 8)
+
+
+@pytest.fixture(scope="module")
+def board_data(tmp_path_factory):
+    path = tmp_path_factory.mktemp("feed")
+    write_feed(str(path / "gtfs"), n_stops=30, n_lines=4, trips_per_day=200, days=14)
+    tables = feed.load_feed(str(path / "gtfs"), str(path / "cache"))
+    trips = tables["trips"]
+    return {
+        "departure_index": build_departure_index(tables["stop_times"], trips),
+        "calendar_index": build_calendar_index(tables["calendar_dates"], tables["feed_info"], trips),
+        "trip_vias": build_trip_vias(trips, tables["routes"]),
+        "trips": trips,
+        "stop_ids": tables["stops"]["stop_id"].astype(object).tolist(),
+        "raw": feed.read_gtfs(str(path / "gtfs")),
+    }
+
+
+def boards(data, stop_ids, start, end, via=0):
+    return departure_boards(data["departure_index"], data["calendar_index"], data["trip_vias"], data["trips"],
+                            stop_ids, WEDNESDAY, start, end, via)
+
+
+def reference_board(raw, stop_id, start, end):
+    """Sortides d'una parada filtrant les files de stop_times tal com són, sense cap índex."""
+    stop_times = raw["stop_times"][raw["stop_times"]["stop_id"] == stop_id]
+    stop_times = stop_times.merge(raw["trips"][["trip_id", "service_id"]], on="trip_id")
+    hms = stop_times["departure_time"].str.split(":")
+    seconds = hms.map(lambda hms: int(hms[0]) * 3600 + int(hms[1]) * 60 + int(hms[2])).astype(int)
+    calendar = raw["calendar_dates"]
+    frames = []
+    for day_offset in (-1, 0, 1):
+        day = int((WEDNESDAY + timedelta(days=day_offset)).strftime("%Y%m%d"))
+        services = calendar.loc[(calendar["date"] == day) & (calendar["exception_type"] == 1), "service_id"]
+        board_secs = seconds + day_offset * DAY
+        keep = stop_times["service_id"].isin(services) & (board_secs > start) & (board_secs <= end)
+        frames.append(pd.DataFrame({"trip_id": stop_times.loc[keep, "trip_id"], "day_offset": day_offset,
+                                    "board_secs": board_secs[keep]}))
+    return pd.concat(frames).sort_values(["board_secs", "trip_id"]).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("start, end", [(8 * 3600, 10 * 3600), (0, 6 * 3600), (22 * 3600, DAY + 6 * 3600)])
+def test_batched_boards_match_a_plain_stop_times_filter(board_data, start, end):
+    batch = boards(board_data, board_data["stop_ids"], start, end)
+    assert len(batch) > 0
+    vias = dict(zip(board_data["trips"]["trip_id"].astype(object), board_data["trip_vias"]))
+    for stop_id in board_data["stop_ids"]:
+        expected = reference_board(board_data["raw"], stop_id, start, end)
+        board = batch[batch["stop_id"] == stop_id].sort_values(["board_secs", "trip_id"]).reset_index(drop=True)
+        pd.testing.assert_frame_equal(board[expected.columns].astype({"trip_id": object}), expected, check_dtype=False)
+        assert board["via"].tolist() == [vias[trip_id] for trip_id in expected["trip_id"]]
+
+
+def test_via_filter(board_data):
+    every = boards(board_data, board_data["stop_ids"], 8 * 3600, 10 * 3600)
+    first = boards(board_data, board_data["stop_ids"], 8 * 3600, 10 * 3600, via=1)
+    second = boards(board_data, board_data["stop_ids"], 8 * 3600, 10 * 3600, via=2)
+    assert set(first["via"]) == {"1"} and set(second["via"]) == {"2"}
+    assert len(first) + len(second) == len(every)
+
+
+def test_json_lists_every_requested_stop(board_data):
+    stop_ids = board_data["stop_ids"][:3] + ["no-hi-és"]
+    result = boards_to_json(boards(board_data, stop_ids, 8 * 3600, 10 * 3600), stop_ids)
+    assert list(result) == stop_ids and result["no-hi-és"] == []
@@ -0,0 +1,94 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from comments import CommentStore
+
+THREADS, PER_THREAD = 8, 100
+
+
+def hammer(add):
+    """THREADS fils escrivint PER_THREAD comentaris cadascun a la mateixa estació."""
+    def writer(thread):
+        for i in range(PER_THREAD):
+            add(thread, f"comentari {thread}-{i}")
+
+    workers = [threading.Thread(target=writer, args=(thread,)) for thread in range(THREADS)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def test_concurrent_writers_on_one_store_lose_nothing(tmp_path):
+    store = CommentStore(str(tmp_path / "comments.db"), keep=None)
+    hammer(lambda thread, comment: store.add("Lavabos", "PC", comment))
+    assert store.count() == THREADS * PER_THREAD
+    assert len({comment for _, comment in store.list("Lavabos", "PC")}) == THREADS * PER_THREAD
+
+
+def test_concurrent_connections_lose_nothing(tmp_path):
+    # Una connexió per fil, com processos diferents sobre el mateix fitxer
+    path = str(tmp_path / "comments.db")
+    stores = [CommentStore(path, keep=None) for _ in range(THREADS)]
+    hammer(lambda thread, comment: stores[thread].add("Lavabos", "PC", comment))
+    assert CommentStore(path, keep=None).count() == THREADS * PER_THREAD
+
+
+def test_retention_is_per_station(tmp_path):
+    store = CommentStore(str(tmp_path / "comments.db"), keep=3)
+    start = datetime(2025, 3, 3, 8)
+    for i in range(5):
+        store.add("Lavabos", "PC", f"PC {i}", start + timedelta(minutes=i))
+        store.add("Lavabos", "SR", f"SR {i}", start + timedelta(minutes=i))
+    store.add("Accessibilitat", "PC", "altre servei", start)
+    assert [comment for _, comment in store.list("Lavabos", "PC")] == ["PC 4", "PC 3", "PC 2"]
+    assert [comment for _, comment in store.list("Lavabos", "SR")] == ["SR 4", "SR 3", "SR 2"]
+    assert [comment for _, comment in store.list("Accessibilitat", "PC")] == ["altre servei"]
+
+
+def test_read_cache_sees_writes_from_other_connections(tmp_path):
+    path = str(tmp_path / "comments.db")
+    reader, writer = CommentStore(path), CommentStore(path)
+    assert reader.list("Lavabos", "PC") == []
+    writer.add("Lavabos", "PC", "nou")
+    assert [comment for _, comment in reader.list("Lavabos", "PC")] == ["nou"]
+
+
+def test_legacy_json_is_imported_once(tmp_path):
+    legacy = tmp_path / "comments.json"
+    legacy.write_text(json.dumps({"Lavabos": [
+        {"service": "Lavabos", "station": "PC", "comment": "antic", "timestamp": "2024-11-20T10:00:00"}]}))
+    path = str(tmp_path / "comments.db")
+    CommentStore(path, legacy_json=str(legacy))
+    store = CommentStore(path, legacy_json=str(legacy))
+    assert store.list("Lavabos", "PC") == [(datetime(2024, 11, 20, 10), "antic")]
+
+
+def test_legacy_import_keeps_only_the_newest_per_station(tmp_path):
+    legacy = tmp_path / "comments.json"
+    start = datetime(2024, 11, 20, 10)
+    legacy.write_text(json.dumps({"Lavabos": [
+        {"service": "Lavabos", "station": station, "comment": f"{station} {i}", "timestamp": (start + timedelta(minutes=i)).isoformat()}
+        for station in ("PC", "SR") for i in range(5)]}))
+    store = CommentStore(str(tmp_path / "comments.db"), keep=3, legacy_json=str(legacy))
+    assert [comment for _, comment in store.list("Lavabos", "PC")] == ["PC 4", "PC 3", "PC 2"]
+    assert [comment for _, comment in store.list("Lavabos", "SR")] == ["SR 4", "SR 3", "SR 2"]
+
+
+def test_failed_legacy_import_is_rolled_back(tmp_path):
+    legacy = tmp_path / "comments.json"
+    legacy.write_text(json.dumps({"Lavabos": [
+        {"service": "Lavabos", "station": "PC", "comment": "bo", "timestamp": "2024-11-20T10:00:00"},
+        {"service": "Lavabos", "station": "PC", "comment": None, "timestamp": "2024-11-20T10:01:00"}]}))
+    path = str(tmp_path / "comments.db")
+    with pytest.raises(sqlite3.IntegrityError):
+        CommentStore(path, legacy_json=str(legacy))
+    # Ni mitja importació ni la connexió encallada dins la transacció
+    store = CommentStore(path)
+    assert store.count() == 0
+    store.add("Lavabos", "PC", "nou")
+    assert store.count() == 1
@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import feed
+from boards import departure_boards
+from synthetic import write_feed
+from timetable import build_calendar_index, build_departure_index, build_trip_vias
+
+DAY = date(2025, 1, 8)
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    path = tmp_path_factory.mktemp("feed")
+    write_feed(str(path / "gtfs"), n_stops=40, n_lines=4, trips_per_day=120, days=14)
+    data = feed.load_dataset(str(path / "gtfs"), str(path / "cache"))
+    indices = (build_departure_index(data.stop_times, data.trips),
+               build_calendar_index(data.calendar_dates, data.feed_info, data.trips),
+               build_trip_vias(data.trips, data.routes))
+    return data, indices
+
+
+def session(data, indices, stop_id):
+    """Un rerun de l'app: tauler de l'estació i les tres parades més properes, sobre la còpia de la sessió."""
+    board = departure_boards(*indices, data.trips, [stop_id], DAY, 8 * 3600, 10 * 3600)
+    stops = data.stops
+    here = stops.iloc[data.stop_pos[stop_id]]
+    stops["distance"] = np.hypot(stops["stop_lat"] - here["stop_lat"], stops["stop_lon"] - here["stop_lon"])
+    return board["trip_id"].tolist(), stops.nsmallest(3, "distance")["stop_id"].tolist()
+
+
+def table_hashes(data):
+    return {name: pd.util.hash_pandas_object(getattr(data, name)).sum() for name in feed.FEED_TABLES}
+
+
+def test_concurrent_sessions_match_serial_and_leave_shared_tables_intact(dataset):
+    data, indices = dataset
+    before = table_hashes(data)
+    stop_ids = [list(data.stop_pos)[i % len(data.stop_pos)] for i in range(64)]
+    serial = [session(data, indices, stop_id) for stop_id in stop_ids]
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        concurrent = list(pool.map(lambda stop_id: session(data, indices, stop_id), stop_ids))
+    assert concurrent == serial
+    assert any(boards for boards, _ in serial)
+    assert "distance" not in data.stops.columns
+    assert table_hashes(data) == before
+
+
+def test_shared_tables_are_read_only_shallow_copies(dataset):
+    data, _ = dataset
+    stops = data.stops
+    assert stops is not data.stops
+    assert np.shares_memory(stops["stop_lat"].to_numpy(), data.stops["stop_lat"].to_numpy())
+    with pytest.raises(ValueError):
+        stops["stop_lat"].to_numpy()[0] = 0
+    with pytest.raises(AttributeError):
+        data.stops = stops
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from delays import DelayTracker, save_snapshot
+from realtime import index_positions
+
+
+@pytest.fixture
+def tracker():
+    """Viatge t1 A-B-C (08:00, 08:05-08:06, 08:10) i t2 A-C."""
+    trips = pd.DataFrame({"trip_id": ["t1", "t2"], "service_id": "s", "route_id": "1", "trip_headsign": "C"})
+    stop_times = pd.DataFrame({
+        "trip_id": ["t1", "t1", "t1", "t2", "t2"],
+        "stop_id": ["A", "B", "C", "A", "C"],
+        "stop_sequence": [1, 2, 3, 1, 2],
+        "arrival_time": ["08:00:00", "08:05:00", "08:10:00", "09:00:00", "09:10:00"],
+        "departure_time": ["08:00:00", "08:06:00", "08:10:00", "09:00:00", "09:10:00"],
+    })
+    return DelayTracker(stop_times, trips)
+
+
+def test_replayed_snapshots_propagate_delays(tmp_path, tracker):
+    snapshots = [
+        (datetime(2025, 3, 3, 8, 2), [{"id": "t1", "estacionat_a": None, "properes_parades": '{"parada": "B"};{"parada": "C"}'}]),
+        (datetime(2025, 3, 3, 8, 9), [{"id": "t1", "estacionat_a": "B", "properes_parades": '{"parada": "C"}'}]),
+        (datetime(2025, 3, 3, 8, 9, 30), [{"id": "t1", "estacionat_a": "B", "properes_parades": '{"parada": "C"}'}]),
+        (datetime(2025, 3, 3, 8, 15), []),
+    ]
+    paths = []
+    for i, (fetched_at, records) in enumerate(snapshots):
+        paths.append(str(tmp_path / f"{i}.json"))
+        save_snapshot(paths[-1], records, fetched_at)
+
+    # Cada instantània es reprodueix per separat per mirar l'estat entremig
+    assert tracker.replay(paths[:1]) == [{0}]
+    assert tracker.predicted_times("t1")["predicted_secs"].tolist() == [28800, 29160, 29400]
+    assert tracker.replay(paths[1:3]) == [{0}, set()]
+    # Arriba a B 4 minuts tard: B i C passen 4 minuts més tard, A no
+    assert tracker.predicted_times("t1")["predicted_secs"].tolist() == [28800, 29400, 29640]
+    # El tren desapareix de l'API: es torna a l'horari
+    assert tracker.replay(paths[3:]) == [{0}]
+    assert tracker.predicted_times("t1")["predicted_secs"].tolist() == [28800, 29160, 29400]
+
+
+def test_snapshots_are_applied_at_their_fetch_time(tracker):
+    snapshot = index_positions([{"id": "t1", "estacionat_a": "B", "properes_parades": '{"parada": "C"}'}],
+                               datetime(2025, 3, 3, 8, 9))
+    assert tracker.update_snapshot(snapshot) == {0}
+    assert tracker.predicted_times("t1")["predicted_secs"].tolist() == [28800, 29400, 29640]
+    assert tracker.update_snapshot(snapshot) == set()
@@ -0,0 +1,104 @@
+import zipfile
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import feed
+from boards import departure_boards
+from planner import build_connections
+from timetable import build_calendar_index, build_departure_index, build_trip_vias
+
+
+def write_numeric_feed(path):
+    """GTFS de tres parades amb tots els id numèrics (101, 1, 7...), com els d'alguns operadors."""
+    path.mkdir()
+    tables = {
+        "stops.txt": "stop_lat,stop_lon,stop_name,stop_id,wheelchair_boarding\n"
+                     "41.40,2.10,A,101,1\n41.41,2.11,B,102,1\n41.42,2.12,C,103,0\n",
+        "trips.txt": "route_id,service_id,trip_id,trip_headsign,shape_id\n5,7,1,C,9\n5,7,2,C,9\n",
+        "stop_times.txt": "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+                          "1,08:00:00,08:00:00,101,1\n1,08:05:00,08:05:00,102,2\n1,08:10:00,08:10:00,103,3\n"
+                          "2,09:00:00,09:00:00,101,1\n2,09:10:00,09:10:00,103,2\n",
+        "calendar_dates.txt": "service_id,date,exception_type\n7,20250303,1\n",
+        "feed_info.txt": "feed_publisher_name,feed_version,feed_start_date,feed_end_date\nProva,1,20250301,20250331\n",
+        "routes.txt": "route_id,route_short_name,route_long_name,route_type\n5,L5,A - C,2\n",
+        "access.csv": "stop_name,stop_id,wheelchair_boarding,wc\nA,101,1,2\nB,102,1,-1\nC,103,0,-1\n",
+        "shapes.txt": "shape_id,shape_pt_lat,shape_pt_lon,shape_pt_sequence\n9,41.40,2.10,1\n9,41.42,2.12,2\n",
+    }
+    for filename, text in tables.items():
+        (path / filename).write_text(text)
+    return path
+
+
+def test_numeric_ids_are_read_as_text(tmp_path):
+    tables = feed.load_feed(str(write_numeric_feed(tmp_path / "gtfs")), str(tmp_path / "cache"))
+    trips, stop_times = tables["trips"], tables["stop_times"]
+    assert list(trips["trip_id"].astype(object)) == ["1", "2"]
+    assert set(stop_times["trip_id"].astype(object)) == {"1", "2"}
+    assert list(tables["stops"]["stop_id"].astype(object)) == ["101", "102", "103"]
+
+    index = build_departure_index(stop_times, trips)
+    calendar = build_calendar_index(tables["calendar_dates"], tables["feed_info"], trips)
+    boards = departure_boards(index, calendar, build_trip_vias(trips, tables["routes"]), trips,
+                              ["101"], date(2025, 3, 3), 7 * 3600, 10 * 3600)
+    assert list(boards["trip_id"]) == ["1", "2"]
+    assert list(boards["service_id"]) == ["7", "7"]
+
+    connections = build_connections(stop_times, trips, tables["stops"], tables["access"])
+    assert len(connections["dep_secs"]) == 3
+
+
+def test_unknown_trips_are_dropped_from_the_departure_index():
+    trips = pd.DataFrame({"trip_id": ["1"], "service_id": ["7"]})
+    stop_times = pd.DataFrame({"trip_id": ["1", "no-hi-és"], "stop_id": ["101", "101"],
+                               "departure_time": ["08:00:00", "09:00:00"]})
+    index = build_departure_index(stop_times, trips)
+    assert list(index["trip_id"]) == ["1"]
+    assert list(index["departure_secs"]) == [8 * 3600]
+
+
+def test_zipped_feed_in_a_folder_and_missing_members(tmp_path):
+    gtfs = write_numeric_feed(tmp_path / "gtfs")
+    path = tmp_path / "gtfs.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        for member in gtfs.iterdir():
+            if member.name != "access.csv":
+                archive.write(member, f"fgc/{member.name}")
+    assert list(feed.read_table(str(path), "stops.txt")["stop_id"]) == ["101", "102", "103"]
+    with pytest.raises(FileNotFoundError, match="access.csv"):
+        feed.read_table(str(path), "access.csv")
+
+
+def test_na_is_a_stop_id_and_only_blank_ids_are_missing(tmp_path):
+    gtfs = write_numeric_feed(tmp_path / "gtfs")
+    (gtfs / "stops.txt").write_text("stop_lat,stop_lon,stop_name,stop_id,wheelchair_boarding\n"
+                                    "41.40,2.10,A,101,1\n41.58,2.01,Terrassa Nacions Unides,NA,0\n41.42,2.12,C,103,\n")
+    (gtfs / "stop_times.txt").write_text("trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+                                         "1,08:00:00,08:00:00,101,1\n1,08:05:00,08:05:00,NA,2\n1,08:10:00,08:10:00,,3\n")
+    for tables in (feed.read_gtfs(str(gtfs)), feed.load_feed(str(gtfs), str(tmp_path / "cache"))):
+        assert list(tables["stops"]["stop_id"].astype(object)) == ["101", "NA", "103"]
+        assert tables["stop_times"]["stop_id"].astype(object).tolist()[:2] == ["101", "NA"]
+        assert tables["stop_times"]["stop_id"].isna().tolist() == [False, False, True]
+        # Fora dels id, les buides continuen sent NaN
+        assert tables["stops"]["wheelchair_boarding"].isna().tolist() == [False, False, True]
+    assert "NA" in feed.FeedDataset(feed.read_gtfs(str(gtfs))).stop_pos
+
+
+def mapped(array):
+    """Si array (o algun array del qual és una vista) és un np.memmap."""
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = getattr(array, "base", None)
+    return False
+
+
+def test_cached_text_columns_stay_on_the_mmap(tmp_path):
+    gtfs = str(write_numeric_feed(tmp_path / "gtfs"))
+    tables = feed.load_feed(gtfs, str(tmp_path / "cache"))
+    for table, column in (("stop_times", "trip_id"), ("stop_times", "stop_id"), ("stops", "stop_name"), ("trips", "trip_id")):
+        assert mapped(tables[table][column].array.codes), (table, column)
+    dataset = feed.load_dataset(gtfs, str(tmp_path / "cache"))
+    assert mapped(dataset.stop_times["stop_id"].array.codes)
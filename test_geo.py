@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import geo
+from geo import R, _point_cell, build_stop_index, nearest_stops, nearest_stops_bruteforce, stops_within
+
+
+@pytest.fixture(autouse=True)
+def grid_always(monkeypatch):
+    """Fer servir la graella encara que hi hagi poques parades."""
+    monkeypatch.setattr(geo, "BRUTEFORCE_MAX_STOPS", 0)
+
+
+def unproject(index, x, y):
+    """Inversa de geo._project: (lat, lon) d'un punt en km."""
+    return np.degrees(y / R), np.degrees(x / (R * np.cos(np.radians(index["lat0"]))))
+
+
+def cell_corner(index, cx, cy):
+    """(lat, lon) de la cantonada inferior esquerra d'una cel·la."""
+    return unproject(index, index["x0"] + cx * index["cell_km"], index["y0"] + cy * index["cell_km"])
+
+
+@pytest.fixture(scope="module")
+def clusters():
+    """Dos grups de parades separats per una franja buida, en un rang de latitud ampli (la projecció deforma)."""
+    rng = np.random.default_rng(3)
+    lats = np.concatenate([rng.uniform(40.5, 41.2, 150), rng.uniform(42.0, 42.8, 150)])
+    lons = np.concatenate([rng.uniform(0.2, 1.0, 150), rng.uniform(2.0, 3.2, 150)])
+    return build_stop_index(pd.DataFrame({"stop_lat": lats, "stop_lon": lons}))
+
+
+def query_points(index, rng):
+    """Punts a l'atzar, cantonades i vores de cel·les (incloses les buides) i les mateixes parades."""
+    cx = rng.integers(0, index["n_cols"], 40)
+    cy = rng.integers(0, index["n_rows"], 40)
+    corners = cell_corner(index, cx, cy)
+    edges = cell_corner(index, cx + 0.5, cy)
+    lats = np.concatenate([rng.uniform(40.5, 42.8, 80), corners[0], edges[0], index["lats"][:20]])
+    lons = np.concatenate([rng.uniform(0.2, 3.2, 80), corners[1], edges[1], index["lons"][:20]])
+    return zip(lats, lons)
+
+
+@pytest.mark.parametrize("k", [1, 5])
+def test_nearest_stops_match_bruteforce(clusters, k):
+    for lat, lon in query_points(clusters, np.random.default_rng(k)):
+        positions, distances = nearest_stops(clusters, lat, lon, k)
+        expected_positions, expected_distances = nearest_stops_bruteforce(clusters, lat, lon, k)
+        np.testing.assert_allclose(distances, expected_distances)
+        assert set(positions) == set(expected_positions)
+
+
+@pytest.mark.parametrize("radius_km", [0.5, 5.0, 20.0])
+def test_stops_within_match_bruteforce(clusters, radius_km):
+    for lat, lon in query_points(clusters, np.random.default_rng(int(radius_km))):
+        positions, distances = stops_within(clusters, lat, lon, radius_km)
+        every, every_distance = nearest_stops_bruteforce(clusters, lat, lon, len(clusters["lats"]))
+        assert set(positions) == set(every[every_distance <= radius_km])
+        assert np.all(np.diff(distances) >= 0)
+
+
+def test_margin_covers_the_projection_error():
+    # Lluny de lat0 la projecció allarga les distàncies est-oest: E, a l'anell 2, és
+    # més a prop de debò que N, a l'anell 1. Sense GRID_MARGIN la cerca pararia a N.
+    y0 = R * np.radians(38.0)
+    qy = y0 + 780.5  # Al mig d'una cel·la, cap als 45° de latitud
+    lats = np.degrees(np.array([y0, qy + 0.985, qy]) / R)  # Cantonada de la graella, N i E
+    lon_km = R * np.cos(np.radians(lats.mean())) * np.pi / 180
+    lons = np.array([0.0, 100.995, 102.01]) / lon_km  # El punt és a 100.995 km, gairebé a la vora est de la cel·la
+    index = build_stop_index(pd.DataFrame({"stop_lat": lats, "stop_lon": lons}), cell_km=1.0)
+
+    lat, lon = np.degrees(qy / R), 100.995 / lon_km
+    assert _point_cell(index, lat, lon) == (100, 780)
+    expected_positions, expected_distances = nearest_stops_bruteforce(index, lat, lon)
+    assert expected_positions.tolist() == [2] and expected_distances[0] < 0.985
+    assert nearest_stops(index, lat, lon)[0].tolist() == [2]
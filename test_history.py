@@ -0,0 +1,150 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import history
+from history import SnapshotRecorder, delta_decode, delta_encode, load_history, occupancy_by_unit, punctuality
+
+START = datetime(2025, 3, 3)
+LINES = ["L6", "L7", "S1"]
+
+
+def snapshots(n_trains=7, seed=0):
+    """Una instantània per hora: trens que es mouen a l'atzar, amb en_hora i ocupació (la m2 de vegades buida)."""
+    rng = np.random.default_rng(seed)
+    positions = np.array([41.4, 2.1]) + np.cumsum(rng.normal(0, 0.001, size=(24, n_trains, 2)), axis=0)
+    for hour in range(24):
+        yield START + timedelta(hours=hour), [{
+            "id": f"T{train}",
+            "lin": LINES[train % len(LINES)],
+            "ut": f"{112 + train % 4}.{train % 3}",
+            "geo_point_2d": {"lat": positions[hour, train, 0], "lon": positions[hour, train, 1]},
+            "en_hora": "False" if rng.random() < 0.2 else "True",
+            "ocupacio_mi_percent": int(rng.integers(0, 101)),
+            "ocupacio_ri_percent": int(rng.integers(0, 101)),
+            "ocupacio_m1_percent": int(rng.integers(0, 101)),
+            "ocupacio_m2_percent": None if train % 2 else int(rng.integers(0, 101)),
+        } for train in range(n_trains)]
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    day = list(snapshots())
+    recorder = SnapshotRecorder(str(tmp_path), chunk_snapshots=5)
+    for at, records in day:
+        recorder.record(records, at)
+    recorder.record(day[-1][1], day[-1][0])  # Repetida: no es desa
+    recorder.flush()
+    rows = pd.DataFrame([dict(registre, hour=at.hour) for at, records in day for registre in records])
+    return str(tmp_path), rows
+
+
+def test_delta_encoding_is_per_group():
+    # Dos trens intercalats: cada un es codifica respecte a la seva posició anterior
+    values = np.array([5, 100, 7, 103, 7, 90], dtype=np.int64)
+    trains = np.array([0, 1, 0, 1, 0, 1])
+    encoded = delta_encode(values, trains)
+    assert encoded.tolist() == [5, 100, 2, 3, 0, -13]
+    assert np.array_equal(delta_decode(encoded, trains), values)
+
+
+def test_recorded_rows_and_positions_are_read_back(recorded):
+    path, rows = recorded
+    history = load_history(path, positions=True)
+    assert len(history["time"]) == len(rows)
+    assert np.array_equal(history["line_categories"][history["line"]], rows["lin"])
+    assert np.allclose(history["lat"], np.round(rows["geo_point_2d"].str["lat"] * 100_000) / 100_000)
+    assert np.allclose(history["lon"], np.round(rows["geo_point_2d"].str["lon"] * 100_000) / 100_000)
+
+
+def test_statistics_match_pandas(recorded):
+    path, rows = recorded
+    history = load_history(path)
+    expected = (rows["en_hora"] == "True").groupby([rows["lin"], rows["hour"]]).mean() * 100
+    stats = punctuality(history).set_index(["line", "hour"])["on_time_pct"]
+    assert np.allclose(stats.sort_index(), expected.sort_index())
+
+    cars = rows.melt(id_vars="ut", value_vars=["ocupacio_mi_percent", "ocupacio_ri_percent",
+                                               "ocupacio_m1_percent", "ocupacio_m2_percent"]).dropna()
+    expected = cars.groupby("ut")["value"].mean()
+    stats = occupancy_by_unit(history).set_index("unit")["occupancy_pct"]
+    assert np.allclose(stats.sort_index(), expected.sort_index())
+
+
+def test_time_window_and_empty_history(recorded, tmp_path):
+    path, _ = recorded
+    # Només les instantànies de 5 a 9 h
+    window = load_history(path, start=START + timedelta(hours=5), end=START + timedelta(hours=9))
+    assert len(window["time"]) == 5 * 7
+    empty = load_history(str(tmp_path / "buit"))
+    assert len(empty["time"]) == 0
+    assert punctuality(empty).empty
+
+
+def test_chunks_are_written_every_chunk_snapshots(tmp_path):
+    day = list(snapshots())[:5]
+    recorder = SnapshotRecorder(str(tmp_path), chunk_snapshots=2)
+    for at, records in day:
+        recorder.record(records, at)
+    assert len(list(tmp_path.glob("*.npz"))) == 2
+    # Ja escrita en un tros: tampoc es torna a desar
+    recorder.record(day[3][1], day[3][0])
+    recorder.flush()
+    recorder.flush()
+    assert len(list(tmp_path.glob("*.npz"))) == 3
+    assert len(load_history(str(tmp_path))["time"]) == 5 * 7
+
+
+def test_small_chunks_are_merged_without_changing_the_history(tmp_path):
+    day = list(snapshots())
+    merged, small = tmp_path / "fusionat", tmp_path / "petits"
+    for path, compact_chunks in ((merged, 3), (small, 1)):
+        recorder = SnapshotRecorder(str(path), chunk_snapshots=2, compact_chunks=compact_chunks)
+        for at, records in day:
+            recorder.record(records, at)
+        recorder.flush()
+    assert len(list(merged.glob("*.npz"))) == 4 and len(list(small.glob("*.npz"))) == 12
+
+    expected = load_history(str(small), positions=True)
+    history = load_history(str(merged), positions=True)
+    for column in ("time", "en_hora", "lat", "lon", "ocupacio_m2_percent"):
+        assert np.array_equal(history[column], expected[column])
+    for column in ("line", "unit", "train"):
+        names = history[f"{column}_categories"][history[column]]
+        assert np.array_equal(names, expected[f"{column}_categories"][expected[column]])
+
+    # Si un procés mor entre fusionar i esborrar, els trossos petits que queden no es compten dues vegades
+    for chunk in small.glob("*.npz"):
+        chunk.rename(merged / chunk.name)
+    assert len(load_history(str(merged))["time"]) == len(day) * 7
+
+
+def test_a_slow_chunk_is_still_merged_in_time_order(tmp_path, monkeypatch):
+    day = list(snapshots())[:4]
+    writing = threading.Event()
+    save_chunk = history._save_chunk
+
+    def slow_first_chunk(path, chunk, first, last):
+        # El primer tros tarda: mentrestant un altre fil omple i escriu el segon
+        if not writing.is_set():
+            writing.set()
+            time.sleep(0.2)
+        return save_chunk(path, chunk, first, last)
+
+    monkeypatch.setattr(history, "_save_chunk", slow_first_chunk)
+    recorder = SnapshotRecorder(str(tmp_path), chunk_snapshots=2, compact_chunks=2)
+    first_chunk = threading.Thread(target=lambda: [recorder.record(records, at) for at, records in day[:2]])
+    first_chunk.start()
+    writing.wait()
+    for at, records in day[2:]:
+        recorder.record(records, at)
+    first_chunk.join()
+
+    start, end = history._timestamp(day[0][0]), history._timestamp(day[-1][0])
+    assert [chunk.name for chunk in tmp_path.glob("*.npz")] == [f"{start}-{end}.npz"]
+    times = load_history(str(tmp_path))["time"]
+    assert len(times) == 4 * 7 and np.all(np.diff(times) >= 0)
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from maps import douglas_peucker, simplify_tracks
+
+
+def distance_to_segment(points, start, end):
+    """Distància de cada punt al segment start-end."""
+    segment = end - start
+    length2 = segment @ segment
+    t = np.clip((points - start) @ segment / length2, 0, 1) if length2 else np.zeros(len(points))
+    return np.hypot(*(points - start - t[:, None] * segment).T)
+
+
+def wiggly_line(n=500, seed=0):
+    """Una via de n punts (km) amb corbes i soroll de l'ordre de la tolerància."""
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 10, n)
+    return np.column_stack((t, np.sin(t) + rng.normal(0, 0.01, n)))
+
+
+def test_douglas_peucker_keeps_endpoints_and_stays_within_tolerance():
+    xy = wiggly_line()
+    for tolerance in (0.005, 0.02, 0.1):
+        keep = douglas_peucker(xy, tolerance)
+        assert keep[0] and keep[-1]
+        assert keep.sum() < len(xy)
+        # Cada punt descartat és a menys de tolerance del tram simplificat que el cobreix
+        kept = np.flatnonzero(keep)
+        for first, last in zip(kept[:-1], kept[1:]):
+            assert (distance_to_segment(xy[first + 1:last], xy[first], xy[last]) <= tolerance + 1e-12).all()
+
+
+def test_douglas_peucker_on_a_closed_loop():
+    # Primer i últim punt iguals: el segment de referència té longitud zero
+    angles = np.linspace(0, 2 * np.pi, 100)
+    keep = douglas_peucker(np.column_stack((np.cos(angles), np.sin(angles))), 0.01)
+    assert keep[0] and keep[-1] and 2 < keep.sum() < 100
+
+
+def test_reversed_shape_is_drawn_once():
+    xy = wiggly_line(50)
+    lat, lon = 41.4 + xy[:, 1] / 111, 2.1 + xy[:, 0] / 83
+    shapes = pd.DataFrame({
+        "shape_id": ["anada"] * 50 + ["tornada"] * 50 + ["ramal"] * 2,
+        "shape_pt_sequence": [*range(50), *range(50), 0, 1],
+        "shape_pt_lat": [*lat, *lat[::-1], 41.5, 41.6],
+        "shape_pt_lon": [*lon, *lon[::-1], 2.2, 2.3],
+    })
+    tracks = simplify_tracks(shapes, tolerance_m=5)
+    assert len(tracks) == 2
+    assert tracks[0][[0, -1]].tolist() == np.round([[lat[0], lon[0]], [lat[-1], lon[-1]]], 6).tolist()
+    assert tracks[1].tolist() == [[41.5, 2.2], [41.6, 2.3]]
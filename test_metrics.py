@@ -0,0 +1,56 @@
+import json
+import threading
+from datetime import datetime
+
+from metrics import Metrics
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics()
+    with metrics.span("etapa"):
+        pass
+    metrics.count("cache_hits", cache="feed")
+    metrics.observe("etapa", 1.0)
+    assert metrics.snapshot() == {"spans": {}, "counters": []}
+
+
+def test_spans_and_counters_from_many_threads():
+    metrics = Metrics(enabled=True)
+
+    def work():
+        for _ in range(1000):
+            with metrics.span("etapa"):
+                pass
+            metrics.count("cache_hits", cache="feed")
+
+    workers = [threading.Thread(target=work) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    snapshot = metrics.snapshot()
+    assert snapshot["spans"]["etapa"]["count"] == 4000
+    assert snapshot["counters"] == [{"name": "cache_hits", "labels": {"cache": "feed"}, "value": 4000}]
+
+
+def test_exports():
+    metrics = Metrics(enabled=True)
+    metrics.observe("load_data", 0.5)
+    metrics.observe("load_data", 1.5)
+    metrics.count("cache_hits", 3, cache="feed")
+    metrics.count("reruns")
+
+    stats = metrics.snapshot()["spans"]["load_data"]
+    assert (stats["count"], stats["total_ms"], stats["mean_ms"], stats["max_ms"]) == (2, 2000, 1000, 1500)
+
+    prometheus = metrics.to_prometheus()
+    assert 'fgc_stage_seconds_count{stage="load_data"} 2' in prometheus
+    assert 'fgc_cache_hits_total{cache="feed"} 3' in prometheus
+    assert "fgc_reruns_total 1" in prometheus
+
+    lines = [json.loads(line) for line in metrics.to_json_lines(datetime(2025, 3, 3, 8)).splitlines()]
+    assert {line["type"] for line in lines} == {"stage", "counter"}
+    assert all(line["time"] == "2025-03-03T08:00:00" for line in lines)
+
+    metrics.reset()
+    assert metrics.snapshot() == {"spans": {}, "counters": []}
@@ -0,0 +1,157 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import planner
+from planner import build_connections, plan_journey, reachability, reachable_within
+from timetable import DAY, build_calendar_index
+
+MONDAY, TUESDAY = date(2025, 3, 3), date(2025, 3, 4)
+
+
+@pytest.fixture
+def network():
+    """Xarxa mínima: A-B-C amb la línia 1, C-D amb la 2 i B-D amb la 3; només A, C i D són accessibles."""
+    stops = pd.DataFrame({"stop_id": ["A", "B", "C", "D"]})
+    access = pd.DataFrame({"stop_id": ["A", "B", "C", "D"], "wheelchair_boarding": [1, 0, 1, 1]})
+    trips = pd.DataFrame({"trip_id": ["l1", "l2a", "l2b", "l3"], "service_id": "s", "route_id": ["1", "2", "2", "3"],
+                          "trip_headsign": ["C", "D", "D", "D"]})
+    stop_times = pd.DataFrame({
+        "trip_id": ["l1", "l1", "l1", "l2a", "l2a", "l2b", "l2b", "l3", "l3"],
+        "stop_id": ["A", "B", "C", "C", "D", "C", "D", "B", "D"],
+        "stop_sequence": [1, 2, 3, 1, 2, 1, 2, 1, 2],
+        "arrival_time": ["08:00:00", "08:05:00", "08:10:00", "08:11:00", "08:20:00", "08:15:00", "08:24:00", "08:07:00", "08:12:00"],
+        "departure_time": ["08:00:00", "08:05:00", "08:10:00", "08:11:00", "08:20:00", "08:15:00", "08:24:00", "08:07:00", "08:12:00"],
+    })
+    calendar = build_calendar_index(
+        pd.DataFrame({"service_id": ["s"], "date": [20250303], "exception_type": [1]}),
+        pd.DataFrame({"feed_start_date": [20250303], "feed_end_date": [20250303]}), trips)
+    return build_connections(stop_times, trips, stops, access), calendar
+
+
+def route(network, depart_secs=8 * 3600, **kwargs):
+    connections, calendar = network
+    legs = plan_journey(connections, calendar, "A", "D", MONDAY, depart_secs, **kwargs)
+    return [(leg.trip_id, leg.arrival_secs) for leg in legs.itertuples()]
+
+
+def test_fastest_route_transfers_at_b(network):
+    assert route(network) == [("l1", 8 * 3600 + 5 * 60), ("l3", 8 * 3600 + 12 * 60)]
+
+
+def test_wheelchair_route_avoids_inaccessible_stations(network):
+    # B no és accessible: transbord a C; l2a surt abans del temps mínim de transbord
+    assert route(network, wheelchair=True) == [("l1", 8 * 3600 + 10 * 60), ("l2b", 8 * 3600 + 24 * 60)]
+    assert route(network, wheelchair=True, transfer_secs=60) == [("l1", 8 * 3600 + 10 * 60), ("l2a", 8 * 3600 + 20 * 60)]
+
+
+def test_no_route_after_the_last_train(network):
+    assert route(network, depart_secs=9 * 3600) == []
+
+
+@pytest.fixture
+def overnight():
+    """A-B cada dia a les 23:30 i a les 24:20 (dia de servei anterior), i a les 00:10; el servei circula dilluns i dimarts."""
+    stops = pd.DataFrame({"stop_id": ["A", "B"]})
+    access = pd.DataFrame({"stop_id": ["A", "B"], "wheelchair_boarding": [1, 1]})
+    trips = pd.DataFrame({"trip_id": ["vespre", "nit", "matinada"], "service_id": "s", "route_id": "1", "trip_headsign": "B"})
+    stop_times = pd.DataFrame({
+        "trip_id": ["vespre", "vespre", "nit", "nit", "matinada", "matinada"],
+        "stop_id": ["A", "B"] * 3,
+        "stop_sequence": [1, 2] * 3,
+        "arrival_time": ["23:30:00", "23:40:00", "24:20:00", "24:30:00", "00:10:00", "00:25:00"],
+        "departure_time": ["23:30:00", "23:40:00", "24:20:00", "24:30:00", "00:10:00", "00:25:00"],
+    })
+    calendar = build_calendar_index(
+        pd.DataFrame({"service_id": ["s", "s"], "date": [20250303, 20250304], "exception_type": [1, 1]}),
+        pd.DataFrame({"feed_start_date": [20250303], "feed_end_date": [20250304]}), trips)
+    return build_connections(stop_times, trips, stops, access), calendar
+
+
+def test_reachability_matches_the_planner(network):
+    connections, calendar = network
+    table = reachability(connections, calendar, MONDAY)
+    stop_ids = list(connections["stop_ids"])
+    for depart_secs in range(7 * 3600 + 45 * 60, 8 * 3600 + 30 * 60, table["bucket_secs"]):
+        for origin in stop_ids:
+            travel = reachable_within(table, origin, depart_secs, 180)
+            for destination in stop_ids:
+                if destination == origin:
+                    continue
+                legs = plan_journey(connections, calendar, origin, destination, MONDAY, depart_secs)
+                expected = -1 if legs.empty else -(-int(legs["arrival_secs"].iloc[-1]) // 60) - depart_secs // 60
+                assert travel[connections["stop_pos"][destination]] == expected, (origin, destination, depart_secs)
+
+
+def test_departures_after_the_last_bucket_roll_over_to_the_next_day(overnight):
+    connections, calendar = overnight
+    table = reachability(connections, calendar, MONDAY)
+    b = connections["stop_pos"]["B"]
+    # 23:50: ja no hi ha el de les 23:30; el de les 00:10 de dimarts arriba a les 00:25 (35 minuts)
+    assert reachable_within(table, "A", 23 * 3600 + 50 * 60, 60)[b] == 35
+    assert reachable_within(table, "A", DAY - 1, 60)[b] == 26
+    # Igual que el planificador sortint a les 00:00 de dimarts
+    legs = plan_journey(connections, calendar, "A", "B", TUESDAY, 0)
+    assert legs["trip_id"].tolist() == ["matinada"]
+    # El de les 24:20 de dilluns també hi és, però arriba més tard
+    assert reachable_within(table, "A", 23 * 3600 + 50 * 60, 30)[b] == -1
+
+
+def test_concurrent_sessions_build_the_table_once(network, monkeypatch):
+    connections, calendar = network
+    built, build = [], planner.build_reachability
+    barrier = threading.Barrier(8)
+
+    def counting_build(*args, **kwargs):
+        built.append(args[2])
+        return build(*args, **kwargs)
+
+    def session(_):
+        barrier.wait()
+        return reachability(connections, calendar, MONDAY)
+
+    monkeypatch.setattr(planner, "build_reachability", counting_build)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        tables = list(pool.map(session, range(8)))
+    assert built == [MONDAY]
+    assert all(table is tables[0] for table in tables)
+
+
+@pytest.fixture
+def blank_stops():
+    """Dues línies que no es toquen, cadascuna amb una parada sense stop_id, i una parada amb stop_id buit a stops."""
+    stops = pd.DataFrame({"stop_id": ["A", "C", None, "D"]})
+    access = pd.DataFrame({"stop_id": ["A", "C", "D"], "wheelchair_boarding": 1})
+    trips = pd.DataFrame({"trip_id": ["s1", "r50"], "service_id": "s", "route_id": ["S1", "R50"], "trip_headsign": ["X", "C"]})
+    stop_times = pd.DataFrame({
+        "trip_id": ["s1", "s1", "r50", "r50", "r50"],
+        "stop_id": ["A", None, None, "D", "C"],
+        "stop_sequence": [1, 2, 1, 2, 3],
+        "arrival_time": ["08:00:00", "08:05:00", "08:10:00", "08:15:00", "08:20:00"],
+        "departure_time": ["08:00:00", "08:05:00", "08:10:00", "08:15:00", "08:20:00"],
+    })
+    calendar = build_calendar_index(
+        pd.DataFrame({"service_id": ["s"], "date": [20250303], "exception_type": [1]}),
+        pd.DataFrame({"feed_start_date": [20250303], "feed_end_date": [20250303]}), trips)
+    return build_connections(stop_times, trips, stops, access), calendar
+
+
+def test_blank_stop_ids_do_not_join_lines(blank_stops):
+    connections, calendar = blank_stops
+    assert list(connections["stop_ids"]) == ["A", "C", "D"]
+    # Només D-C: els trams cap a o des d'una parada sense stop_id no hi són
+    assert len(connections["dep_secs"]) == 1
+    assert plan_journey(connections, calendar, "A", "C", MONDAY, 8 * 3600).empty
+    assert plan_journey(connections, calendar, "D", "C", MONDAY, 8 * 3600)["trip_id"].tolist() == ["r50"]
+
+
+def test_no_station_is_reachable_through_a_blank_stop(blank_stops):
+    connections, calendar = blank_stops
+    table = reachability(connections, calendar, MONDAY)
+    assert not table["stop_ids"].isna().any()
+    travel = dict(zip(table["stop_ids"], reachable_within(table, "A", 8 * 3600, 180)))
+    assert travel == {"A": 0, "C": -1, "D": -1}
+    assert reachable_within(table, "D", 8 * 3600, 180).tolist() == [-1, 20, 0]
@@ -0,0 +1,109 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from realtime import PAGE_SIZE, TrainPositionsFeed
+
+
+class StubAPI:
+    """Servidor local que fa de l'API de posicions: records trens, o error si status no és 200."""
+
+    def __init__(self, records):
+        self.records = records
+        self.status = 200
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                if stub.status != 200:
+                    self.send_error(stub.status)
+                    return
+                offset = int(self.path.split("offset=")[1].split("&")[0])
+                body = json.dumps({"total_count": len(stub.records), "results": stub.records[offset:offset + PAGE_SIZE]})
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(body.encode())
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/records"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def api():
+    stub = StubAPI([{"id": f"T{i}", "lin": "S1" if i % 2 else "L6", "en_hora": "True"} for i in range(250)])
+    yield stub
+    stub.close()
+
+
+def test_all_pages_are_fetched_and_indexed(api):
+    train_feed = TrainPositionsFeed(api.url, retries=0)
+    data = train_feed.get()
+    assert len(data["results"]) == 250 and api.requests == 3
+    assert data["by_id"]["T7"]["lin"] == "S1"
+    assert len(data["by_line"]["L6"]) == 125
+    train_feed.get()
+    assert api.requests == 3  # Dins del ttl no es torna a demanar
+
+
+def test_stale_snapshot_is_served_without_blocking_while_the_api_fails(api):
+    train_feed = TrainPositionsFeed(api.url, ttl=0.05, retries=0, failure_backoff=30)
+    first = train_feed.get()
+    time.sleep(0.1)
+    api.status, api.requests = 503, 0
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        results = list(pool.map(lambda _: train_feed.get(), range(20)))
+    assert all(result is first for result in results)
+    assert api.requests == 1  # Una sola petició; la resta espera el failure_backoff
+    assert time.perf_counter() - started < 1
+    assert train_feed.failing()
+
+    train_feed.get()
+    assert api.requests == 1
+
+
+def test_without_data_failures_are_raised_and_not_retried_during_backoff(api):
+    api.status = 503
+    train_feed = TrainPositionsFeed(api.url, retries=0, failure_backoff=30)
+    with pytest.raises(requests.RequestException):
+        train_feed.get()
+    with pytest.raises(requests.RequestException):
+        train_feed.get()
+    assert api.requests == 1
+
+
+def test_snapshots_are_recorded_outside_the_fetch_lock(api):
+    class Recorder:
+        def __init__(self):
+            self.calls = []
+            self.times = []
+
+        def record(self, records, at=None):
+            self.calls.append((len(records), train_feed._lock.locked()))
+            self.times.append(at)
+
+    recorder = Recorder()
+    train_feed = TrainPositionsFeed(api.url, ttl=0, retries=0, recorder=recorder)
+    train_feed.get()
+    train_feed.get()
+    data = train_feed.refresh()
+    assert recorder.calls == [(250, False)] * 3
+    # Cada instantània es desa amb l'hora en què es va obtenir
+    assert recorder.times[-1] == data["fetched_at"]
@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+from stations import build_station_index, normalize, search_stations, station
+
+
+@pytest.fixture
+def index():
+    stops = pd.DataFrame({
+        "stop_id": ["PC", "PR", "SR", "TR", "TN", None],
+        "stop_name": ["Barcelona - Plaça Catalunya", "Barcelona - Provença", "Sarrià", "Terrassa - Rambla",
+                      "Terrassa - Nacions Unides", "Sense id"],
+    })
+    access = pd.DataFrame({
+        "stop_id": ["PC", "PR", "SR", "TR", "TN"],
+        "wheelchair_boarding": [1, 1, 0, 1, 1],
+        "wc": [2, -1, 3, 3, 1],
+    })
+    return build_station_index(stops, access)
+
+
+def names(index, query, **filters):
+    return [index["names"][pos] for pos in search_stations(index, query, **filters)]
+
+
+def test_normalize_ignores_accents_case_and_punctuation():
+    assert normalize("Barcelona - Plaça Catalunya") == "barcelona placa catalunya"
+    assert normalize("SARRIÀ") == "sarria"
+
+
+def test_prefix_search_on_any_word(index):
+    assert names(index, "placa cat") == ["Barcelona - Plaça Catalunya"]
+    assert names(index, "PLAÇA CATALUNYA") == ["Barcelona - Plaça Catalunya"]
+    assert names(index, "sarria") == ["Sarrià"]
+    assert set(names(index, "terrassa")) == {"Terrassa - Rambla", "Terrassa - Nacions Unides"}
+    assert names(index, "xyzzy") == []
+
+
+def test_typos_fall_back_to_fuzzy_search(index):
+    assert "Terrassa - Rambla" in names(index, "terasa")
+
+
+def test_accessibility_filters(index):
+    accessible = search_stations(index, "", limit=None, wheelchair=True, min_wc=2)
+    assert sorted(index["stop_ids"][pos] for pos in accessible) == ["PC", "TR"]
+
+
+def test_station_lookup_by_id(index):
+    assert station(index, "PC")["stop_name"] == "Barcelona - Plaça Catalunya"
+    assert station(index, "PR")["wc"] == -1
+    assert station(index, "??") is None
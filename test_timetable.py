@@ -0,0 +1,107 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from boards import departure_boards
+from timetable import (DAY, build_calendar_index, build_departure_index, build_trip_vias, gtfs_time_to_seconds,
+                       query_departures, query_window, valid_trip_mask)
+
+MONDAY, TUESDAY = date(2025, 3, 3), date(2025, 3, 4)
+
+
+@pytest.fixture
+def feed():
+    """Una parada A amb un tren de nit (25:10), un de matinada (00:20), un de vespre i un servei que no circula."""
+    trips = pd.DataFrame({
+        "route_id": "L6",
+        "service_id": ["LA", "LA", "LA", "OFF"],
+        "trip_id": ["nit", "matinada", "vespre", "inactiu"],
+        "trip_headsign": "B",
+    })
+    stop_times = pd.DataFrame({
+        "trip_id": ["nit", "nit", "matinada", "matinada", "vespre", "vespre", "inactiu", "inactiu"],
+        "arrival_time": ["25:10:00", "25:20:00", "00:20:00", "00:30:00", "23:30:00", "23:40:00", "00:40:00", "00:50:00"],
+        "departure_time": ["25:10:00", "25:20:00", "00:20:00", "00:30:00", "23:30:00", "23:40:00", "00:40:00", "00:50:00"],
+        "stop_id": ["A", "B"] * 4,
+        "stop_sequence": [1, 2] * 4,
+    })
+    # LA circula dilluns i dimarts; OFF s'afegeix dilluns i es treu dimarts
+    calendar_dates = pd.DataFrame({
+        "service_id": ["LA", "LA", "OFF", "OFF"],
+        "date": [20250303, 20250304, 20250303, 20250304],
+        "exception_type": [1, 1, 1, 2],
+    })
+    feed_info = pd.DataFrame({"feed_start_date": [20250301], "feed_end_date": [20250331]})
+    routes = pd.DataFrame({"route_id": ["L6"], "route_long_name": ["A - B"]})
+    return {
+        "trips": trips,
+        "index": build_departure_index(stop_times, trips),
+        "calendar": build_calendar_index(calendar_dates, feed_info, trips),
+        "vias": build_trip_vias(trips, routes),
+    }
+
+
+def boards(feed, day, start, end):
+    return departure_boards(feed["index"], feed["calendar"], feed["vias"], feed["trips"], ["A"], day, start, end)
+
+
+def test_times_after_midnight_stay_on_their_service_day():
+    times = pd.Series(["25:10:00", "00:20:00", "7:05:00", "27:59:59"])
+    assert list(gtfs_time_to_seconds(times)) == [90600, 1200, 25500, 100799]
+
+
+def test_padded_times_fall_back_to_the_text_parser():
+    # Fa 8 bytes com "06:00:00" però no són tots dígits
+    assert list(gtfs_time_to_seconds(pd.Series([" 6:00:00", "06:00:00"]))) == [21600, 21600]
+    assert list(gtfs_time_to_seconds(pd.Series(["6:00:00 ", "7:05:00"]))) == [21600, 25500]
+
+
+def test_previous_day_late_trip_on_early_board(feed):
+    board = boards(feed, TUESDAY, 0, 2 * 3600)
+    night = board[board["trip_id"] == "nit"]
+    assert len(night) == 1
+    assert night["day_offset"].iloc[0] == -1
+    assert night["board_secs"].iloc[0] == 3600 + 10 * 60
+    # El viatge de matinada de dimarts també hi és, amb el seu propi dia de servei
+    assert board.loc[board["trip_id"] == "matinada", "day_offset"].tolist() == [0]
+
+
+def test_window_crossing_midnight_picks_up_next_day_trips(feed):
+    board = boards(feed, MONDAY, 23 * 3600, DAY + 2 * 3600)
+    assert board["trip_id"].tolist() == ["vespre", "matinada", "nit"]
+    assert board["day_offset"].tolist() == [0, 1, 0]
+    assert board["board_secs"].tolist() == [23 * 3600 + 30 * 60, DAY + 20 * 60, DAY + 3600 + 10 * 60]
+
+
+def test_inactive_service_is_dropped(feed):
+    assert not valid_trip_mask(feed["calendar"], TUESDAY)[3]
+    # L'índex el troba, però el tauler el treu perquè dimarts OFF no circula
+    assert "inactiu" in query_window(feed["index"], "A", 0, 2 * 3600)["trip_id"].tolist()
+    assert "inactiu" not in boards(feed, TUESDAY, 0, 2 * 3600)["trip_id"].tolist()
+    assert "inactiu" in boards(feed, MONDAY, 0, 2 * 3600)["trip_id"].tolist()
+
+
+def test_departure_index_matches_a_plain_stop_times_filter():
+    rng = np.random.default_rng(1)
+    trips = pd.DataFrame({"trip_id": [f"t{i}" for i in range(40)], "service_id": rng.choice(["LA", "FE"], 40)})
+    seconds = rng.integers(4 * 3600, 27 * 3600, 2000)
+    stop_times = pd.DataFrame({
+        "trip_id": rng.choice([*trips["trip_id"], "sense_viatge"], 2000),  # Sense viatge a trips: es descarta
+        "stop_id": rng.choice(["A", "B", "C", "D"], 2000),
+        "departure_time": [f"{hours}:{minutes:02}:{secs:02}" for hours, minutes, secs in
+                           zip(seconds // 3600, seconds // 60 % 60, seconds % 60)],
+    })
+    index = build_departure_index(stop_times, trips)
+
+    rows = stop_times.assign(departure_secs=seconds).merge(trips, on="trip_id")
+    for stop_id in ["A", "B", "C", "D"]:
+        for start, end in [(0, 30 * 3600), (8 * 3600, 9 * 3600), (23 * 3600, DAY + 3600), (int(seconds[0]) - 1, int(seconds[0]))]:
+            departures = query_departures(index, stop_id, start, end)
+            expected = rows[(rows["stop_id"] == stop_id) & (rows["departure_secs"] > start) & (rows["departure_secs"] <= end)]
+            key = ["departure_secs", "trip_id"]
+            assert (departures[["trip_id", "service_id", "departure_secs"]].sort_values(key).to_numpy().tolist()
+                    == expected[["trip_id", "service_id", "departure_secs"]].sort_values(key).to_numpy().tolist())
+            assert (trips["trip_id"].to_numpy()[departures["trip_code"]] == departures["trip_id"]).all()
+            assert departures["departure_secs"].is_monotonic_increasing
@@ -0,0 +1,274 @@
+import numpy as np
+import pandas as pd
+
+DAY = 86400  # Segons d'un dia de servei
+KEY_SPAN = 4 * DAY  # Rang de segons de cada parada dins de stop_keys
+
+# ---------------------------
+# Índex de sortides per parada
+# ---------------------------
+
+def gtfs_time_to_seconds(times):
+    """Convertir hores GTFS (HH:MM:SS) a segons des de la mitjanit del dia de servei.
+
+    Les hores >= 24 (serveis que acaben després de mitjanit) es mantenen tal qual:
+    25:10:00 són 90600 segons del mateix dia de servei, no la 01:10 del mateix dia.
+    """
+    if len(times) == 0:
+        return np.empty(0, dtype=np.int32)
+
+    # Camí ràpid per a "H:MM:SS" i "HH:MM:SS": es llegeixen els dígits directament dels bytes
+    raw = np.asarray(times.to_numpy(dtype=object), dtype="S9")
+    length = np.char.str_len(raw)
+    digits = raw.view(np.uint8).reshape(len(raw), 9).astype(np.int32) - ord("0")
+    if ((length == 7) | (length == 8)).all():
+        rows = np.arange(len(raw))
+        hours = np.where(length == 8, digits[:, 0] * 10 + digits[:, 1], digits[:, 0])
+        minutes = digits[rows, length - 5] * 10 + digits[rows, length - 4]
+        seconds = digits[rows, length - 2] * 10 + digits[rows, length - 1]
+        colons = (digits[rows, length - 3] == ord(":") - ord("0")) & (digits[rows, length - 6] == ord(":") - ord("0"))
+        # La resta de bytes han de ser 0-9 (" 6:00:00" també fa 8 bytes)
+        positions = np.arange(9)
+        digit_slots = (positions < length[:, None]) & (positions != (length - 3)[:, None]) & (positions != (length - 6)[:, None])
+        numeric = ((digits >= 0) & (digits <= 9)) | ~digit_slots
+        if colons.all() and numeric.all():
+            return (hours * 3600 + minutes * 60 + seconds).astype(np.int32)
+
+    parts = times.str.strip().str.split(":", expand=True).astype(np.int32)
+    return (parts[0] * 3600 + parts[1] * 60 + parts[2]).to_numpy(dtype=np.int32)
+
+
+def time_column_seconds(values, fallback=None):
+    """Segons d'una columna d'hores, tant si és text GTFS com si ja és en segons (memòria cau).
+
+    Les hores que falten són -1, o el valor de fallback a la mateixa posició si se'n dona.
+    """
+    if pd.api.types.is_integer_dtype(values):
+        seconds = values.to_numpy(dtype=np.int32)
+        missing = seconds < 0
+    else:
+        missing = values.isna().to_numpy()
+        seconds = np.full(len(values), -1, dtype=np.int32)
+        seconds[~missing] = gtfs_time_to_seconds(values[~missing].astype(str))
+    if fallback is not None:
+        seconds = np.where(missing, fallback, seconds)
+    return seconds
+
+
+def format_seconds(seconds):
+    """Passar segons des de mitjanit a cadenes HH:MM:SS."""
+    hours, rest = np.divmod(np.asarray(seconds, dtype=np.int64), 3600)
+    minutes, secs = np.divmod(rest, 60)
+    return [f"{h:02}:{m:02}:{s:02}" for h, m, s in zip(hours, minutes, secs)]
+
+
+def _trip_codes(stop_times, trips):
+    """Fila de trips de cada fila de stop_times (sense materialitzar els trip_id si són categòrics).
+
+    Els viatges que no són a trips (o sense trip_id) tenen -1: qui ho fa servir
+    per indexar ha de descartar-los abans.
+    """
+    trip_ids = stop_times["trip_id"]
+    trips_index = pd.Index(trips["trip_id"].astype(object))
+    if isinstance(trip_ids.dtype, pd.CategoricalDtype):
+        codes = trip_ids.cat.codes.to_numpy()
+        trip_codes = trips_index.get_indexer(trip_ids.cat.categories)[codes].astype(np.int32)
+        trip_codes[codes < 0] = -1
+        return trip_codes
+    return trips_index.get_indexer(trip_ids).astype(np.int32)
+
+
+def build_departure_index(stop_times, trips):
+    """Construir l'índex de sortides: per cada parada, un tram ordenat de segons.
+
+    departure_time pot venir com a text GTFS o ja en segons (memòria cau del feed).
+    Les files de stop_times amb un trip_id que no és a trips es descarten.
+    """
+    stop_codes, stop_ids = pd.factorize(stop_times["stop_id"])
+    if pd.api.types.is_integer_dtype(stop_times["departure_time"]):
+        seconds = stop_times["departure_time"].to_numpy(dtype=np.int32)
+    else:
+        seconds = gtfs_time_to_seconds(stop_times["departure_time"])
+    trip_codes = _trip_codes(stop_times, trips)
+
+    # Ordenem per parada i després per hora; cada parada ocupa un tram contigu
+    order = np.lexsort((seconds, stop_codes))
+    order = order[trip_codes[order] >= 0]  # -1 indexaria l'últim viatge de trips
+    trip_codes = trip_codes[order]
+    trip_ids = trips["trip_id"].to_numpy(dtype=object)[trip_codes]
+    service_ids = trips["service_id"].to_numpy(dtype=object)[trip_codes]
+    offsets = np.searchsorted(stop_codes[order], np.arange(len(stop_ids) + 1))
+
+    return {
+        "stop_pos": {stop_id: pos for pos, stop_id in enumerate(stop_ids)},
+        "stop_ids": np.asarray(stop_ids, dtype=object),
+        "offsets": offsets,
+        # Parada i hora en una sola clau ordenada, per buscar moltes parades alhora
+        "stop_keys": stop_codes[order].astype(np.int64) * KEY_SPAN + seconds[order],
+        "departure_secs": seconds[order],
+        "trip_id": trip_ids,
+        "trip_code": trip_codes,
+        "service_id": service_ids,
+    }
+
+
+def _stop_slice(index, stop_id, start, end):
+    """Posicions [first, last) de les sortides d'una parada amb start < hora <= end."""
+    pos = index["stop_pos"].get(stop_id)
+    if pos is None:
+        return 0, 0
+
+    lo, hi = index["offsets"][pos], index["offsets"][pos + 1]
+    stop_secs = index["departure_secs"][lo:hi]
+    first = lo + np.searchsorted(stop_secs, start, side="right")
+    last = lo + np.searchsorted(stop_secs, end, side="right")
+    return first, last
+
+
+def query_departures(index, stop_id, start, end):
+    """Sortides d'una parada amb start < hora <= end (en segons del dia de servei)."""
+    first, last = _stop_slice(index, stop_id, start, end)
+    return pd.DataFrame({
+        "trip_id": index["trip_id"][first:last],
+        "trip_code": index["trip_code"][first:last],
+        "service_id": index["service_id"][first:last],
+        "departure_secs": index["departure_secs"][first:last],
+    })
+
+
+def query_boards(index, stop_ids, start, end):
+    """Sortides de moltes parades alhora en una finestra que pot travessar la mitjanit.
+
+    Com query_window, però per una llista de parades i sense bucle per parada:
+    els trams de totes les parades i dels tres dies de servei es troben amb una
+    sola cerca binària sobre stop_keys. Les parades que no hi són s'ignoren.
+    Torna les columnes de query_window i stop_id, ordenades per parada i board_secs.
+    """
+    positions = np.array([index["stop_pos"][stop_id] for stop_id in stop_ids if stop_id in index["stop_pos"]], dtype=np.int64)
+    day_offsets = np.tile(np.array([-1, 0, 1], dtype=np.int64), len(positions))
+    stops = np.repeat(positions, 3)
+
+    # Límits de la finestra dins del rang de cada parada (sense invadir la del costat)
+    low = np.clip(start - day_offsets * DAY, -1, KEY_SPAN - 1)
+    high = np.clip(end - day_offsets * DAY, -1, KEY_SPAN - 1)
+    first = np.searchsorted(index["stop_keys"], stops * KEY_SPAN + low, side="right")
+    last = np.searchsorted(index["stop_keys"], stops * KEY_SPAN + high, side="right")
+    counts = last - first
+
+    # Concatenar els trams [first, last) sense bucle de Python
+    rows = np.repeat(first - np.concatenate(([0], np.cumsum(counts)[:-1])), counts) + np.arange(counts.sum())
+    day_offset = np.repeat(day_offsets, counts).astype(np.int8)
+    stop_codes = np.repeat(stops, counts)
+    board_secs = index["departure_secs"][rows] + day_offset.astype(np.int32) * DAY
+
+    order = np.lexsort((board_secs, stop_codes))
+    rows, day_offset, stop_codes, board_secs = rows[order], day_offset[order], stop_codes[order], board_secs[order]
+    return pd.DataFrame({
+        "stop_id": index["stop_ids"][stop_codes],
+        "trip_id": index["trip_id"][rows],
+        "trip_code": index["trip_code"][rows],
+        "service_id": index["service_id"][rows],
+        "departure_secs": index["departure_secs"][rows],
+        "day_offset": day_offset,
+        "board_secs": board_secs,
+    })
+
+
+def query_window(index, stop_id, start, end):
+    """Sortides d'una parada en una finestra que pot travessar la mitjanit.
+
+    start i end són segons des de la mitjanit del dia consultat (end pot superar DAY).
+    Es busca als tres dies de servei que hi poden tenir trens: el dia anterior
+    (serveis de 24:xx en endavant), el mateix dia i el dia següent. day_offset
+    indica el dia de servei de cada sortida (-1, 0 o 1) i board_secs l'hora
+    respecte a la mitjanit del dia consultat.
+    """
+    return query_boards(index, [stop_id], start, end).drop(columns="stop_id")
+
+
+# ---------------------------
+# Índex del calendari de serveis
+# ---------------------------
+
+def build_calendar_index(calendar_dates, feed_info, trips):
+    """Precalcular, per cada dia del feed, quins serveis i quins viatges circulen.
+
+    active és una matriu de bits (dies x serveis). Com que molts dies comparteixen
+    la mateixa combinació de serveis, només es guarda una màscara de viatges per
+    combinació diferent i cada dia apunta a la seva amb day_pattern.
+    """
+    dates = pd.to_datetime(calendar_dates["date"].astype(str), format="%Y%m%d")
+    feed_start = pd.to_datetime(str(feed_info["feed_start_date"].iloc[0]), format="%Y%m%d")
+    feed_end = pd.to_datetime(str(feed_info["feed_end_date"].iloc[0]), format="%Y%m%d")
+    first_day = min(feed_start, dates.min())
+    n_days = (max(feed_end, dates.max()) - first_day).days + 1
+
+    service_ids = pd.Index(pd.unique(trips["service_id"]))
+    trip_services = service_ids.get_indexer(trips["service_id"])
+    calendar_services = service_ids.get_indexer(calendar_dates["service_id"])
+    days = (dates - first_day).dt.days.to_numpy()
+    exception_type = calendar_dates["exception_type"].to_numpy()
+
+    # exception_type 1 afegeix el servei aquell dia i 2 el treu
+    active = np.zeros((n_days, len(service_ids)), dtype=bool)
+    added = (calendar_services >= 0) & (exception_type == 1)
+    removed = (calendar_services >= 0) & (exception_type == 2)
+    active[days[added], calendar_services[added]] = True
+    active[days[removed], calendar_services[removed]] = False
+
+    patterns, day_pattern = np.unique(active, axis=0, return_inverse=True)
+    return {
+        "first_day": first_day.date(),
+        "service_ids": service_ids,
+        "active": active,
+        "day_pattern": day_pattern.ravel().astype(np.int32),
+        "trip_masks": patterns[:, trip_services],
+        "no_trips": np.zeros(len(trips), dtype=bool),
+    }
+
+
+def _feed_day(calendar, date):
+    """Posició d'una data dins del calendari, o None si és fora del feed."""
+    day = (date - calendar["first_day"]).days
+    return day if 0 <= day < len(calendar["day_pattern"]) else None
+
+
+def active_services(calendar, date):
+    """service_id actius en una data."""
+    day = _feed_day(calendar, date)
+    if day is None:
+        return calendar["service_ids"][:0]
+    return calendar["service_ids"][calendar["active"][day]]
+
+
+def valid_trip_mask(calendar, date):
+    """Màscara booleana (una posició per fila de trips) dels viatges que circulen en una data."""
+    day = _feed_day(calendar, date)
+    if day is None:
+        return calendar["no_trips"]
+    return calendar["trip_masks"][calendar["day_pattern"][day]]
+
+
+# ---------------------------
+# Via (sentit) de cada viatge
+# ---------------------------
+
+def build_trip_vias(trips, routes):
+    """Via de cada fila de trips: "1" cap al destí de la línia, "2" en sentit contrari.
+
+    Si trips té direction_id es fa servir directament. Si no, es compara el destí
+    del viatge amb el segon extrem de route_long_name ("Origen - Destí"); si el nom
+    no té aquest format la via és "Desconegut". Es calcula per cada parella
+    (route_id, trip_headsign), no per cada viatge.
+    """
+    if "direction_id" in trips.columns and trips["direction_id"].notna().all():
+        return np.where(trips["direction_id"].to_numpy() == 0, "1", "2").astype(object)
+
+    pairs = trips[["route_id", "trip_headsign"]].drop_duplicates()
+    pairs = pairs.merge(routes[["route_id", "route_long_name"]], on="route_id", how="left")
+    ends = pairs["route_long_name"].astype(object).fillna("").str.split(" - ")
+    has_ends = ends.str.len() > 1
+    pairs["via"] = np.where(~has_ends, "Desconegut", np.where(pairs["trip_headsign"].astype(object) == ends.str[1], "1", "2"))
+
+    vias = trips[["route_id", "trip_headsign"]].merge(pairs, on=["route_id", "trip_headsign"], how="left")["via"]
+    return vias.to_numpy(dtype=object)